@@ -1,16 +1,13 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, render_template, request, jsonify, send_from_directory, Response
 import os
 import json
-import requests
 import shutil
-import networkx as nx
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
-import io
-import base64
-from matplotlib.colors import LinearSegmentedColormap
-import matplotlib.patches as mpatches
+from utils.metrics import timed, render_metrics
+from utils.graph_render import GraphImageCache
+from utils.graph_layout import GraphLayoutStore
+from utils.analysis_store import AnalysisStore
+from utils.backend_client import backend, BackendBusy
+from utils.kg_builder import TieredGraphBuilder, local_graph_available
 
 # Configure Flask app with static and template folders
 app = Flask(
@@ -23,8 +20,27 @@ app = Flask(
 UNIVERSES_DIR = os.path.join(os.getcwd(), "universes")
 os.makedirs(UNIVERSES_DIR, exist_ok=True)
 
-# Store analysis results for each universe
-universe_analysis = {}
+# Store analysis results for each universe, shared by all workers and kept across restarts
+ANALYSIS_DB = os.getenv("ANALYSIS_DB", os.path.join(UNIVERSES_DIR, ".analysis.sqlite3"))
+universe_analysis = AnalysisStore(ANALYSIS_DB)
+
+# Graph images are rendered off-thread on request, once per graph version, and cached by graph hash
+graph_images = GraphImageCache()
+GRAPH_RENDER_TIMEOUT = float(os.getenv("GRAPH_RENDER_TIMEOUT", "60"))
+
+# Node positions for client-side drawing, persisted and updated per universe
+graph_layouts = GraphLayoutStore(UNIVERSES_DIR)
+
+# "tiered": build knowledge graphs locally (NER + relation patterns) and ask the
+# LLM only about uncertain items; "llm": let the backend's analysis build them
+KG_BUILDER = os.getenv("KG_BUILDER", "tiered")
+
+def use_local_graph():
+    return KG_BUILDER == "tiered" and local_graph_available()
+
+@app.errorhandler(BackendBusy)
+def backend_busy(e):
+    return jsonify({"error": str(e)}), 503
 
 @app.route('/')
 def index():
@@ -72,13 +88,19 @@ def upload_file():
     if file and file.filename.endswith('.txt'):
         filepath = os.path.join(universe_path, file.filename)
         file.save(filepath)
-        response = requests.post(
-            'http://localhost:8000/file_uploaded',
-            json={"file_name": file.filename, "folder_path": universe_path}
+        response = backend.post(
+            "file_uploaded", universe_name,
+            json={"file_name": file.filename, "folder_path": universe_path,
+                  "local_graph": use_local_graph()}
         )
 
-        # Call the analysis endpoint
-        analyze_universe(universe_path)
+        # The backend analyzes the file while ingesting it; only fall back to
+        # a separate /analyze pass if it didn't return an analysis
+        analysis = response.json().get("analysis") if response.ok else None
+        if analysis is not None:
+            store_analysis(universe_path, analysis)
+        else:
+            analyze_universe(universe_path)
         
         return jsonify({
             "success": True, 
@@ -87,6 +109,51 @@ def upload_file():
         })
     
     return jsonify({"error": "Only .txt files are allowed"}), 400
+@app.route('/upload-files', methods=['POST'])
+def upload_files():
+    """Upload many .txt files at once; the backend ingests them with one reconcile and analysis"""
+    universe_id = request.form.get('universeId')
+    
+    if not universe_id:
+        return jsonify({"error": "Universe ID is required"}), 400
+    
+    universe_name = universe_id.replace('universe-', '')
+    universe_path = os.path.join(UNIVERSES_DIR, universe_name)
+    os.makedirs(universe_path, exist_ok=True)
+    
+    files = [f for f in request.files.getlist('files') if f.filename]
+    if not files:
+        return jsonify({"error": "No files selected"}), 400
+    
+    saved, skipped = [], []
+    for file in files:
+        if file.filename.endswith('.txt'):
+            file.save(os.path.join(universe_path, file.filename))
+            saved.append(file.filename)
+        else:
+            skipped.append(file.filename)
+    
+    if not saved:
+        return jsonify({"error": "Only .txt files are allowed", "skipped": skipped}), 400
+    
+    response = backend.post(
+        "files_uploaded", universe_name,
+        json={"file_names": saved, "folder_path": universe_path,
+              "local_graph": use_local_graph()}
+    )
+    
+    analysis = response.json().get("analysis") if response.ok else None
+    if analysis is not None:
+        store_analysis(universe_path, analysis)
+    else:
+        analyze_universe(universe_path)
+    
+    return jsonify({
+        "success": True,
+        "filenames": saved,
+        "skipped": skipped
+    })
+
 @app.route("/call_chat_bot", methods=["POST"])
 def call_chatbot():
     data = request.get_json()
@@ -104,11 +171,13 @@ def call_chatbot():
     
     try:
         print(f"Sending request to chat bot with universe path: {universe_path}")
-        response = requests.post(
-            'http://localhost:8000/chat_bot',
+        response = backend.post(
+            "chat_bot", universe_name,
             json={"folder_path": universe_path, "message": message}
         )
         return jsonify(response.json())
+    except BackendBusy as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 @app.route('/get-universe-files', methods=['GET'])
@@ -139,15 +208,17 @@ def delete_universe():
     
     if os.path.exists(universe_path):
         try:
-            response = requests.post(
-                'http://localhost:8000/folder_deleted',
+            response = backend.post(
+                "folder_deleted", universe_name,
                 json={"folder_path": universe_path}
             )
             shutil.rmtree(universe_path)
             # Also remove analysis results if they exist
-            if universe_id in universe_analysis:
-                del universe_analysis[universe_id]
+            universe_analysis.delete(universe_id)
+            graph_layouts.forget(universe_name)
             return jsonify({"success": True})
+        except BackendBusy as e:
+            return jsonify({"error": str(e)}), 503
         except Exception as e:
             return jsonify({"error": str(e)}), 500
     
@@ -162,153 +233,165 @@ def delete_file():
         return jsonify({"error": "Universe ID and filename are required"}), 400
     
     universe_name = universe_id.replace('universe-', '')
-    file_path = os.path.join(UNIVERSES_DIR, universe_name, filename)
+    universe_path = os.path.join(UNIVERSES_DIR, universe_name)
+    file_path = os.path.join(universe_path, filename)
     
     if os.path.exists(file_path):
         try:
-            response = requests.post(
-                'http://localhost:8000/file_deleted',
-                json={"file_name": filename, "folder_path": universe_name}
+            response = backend.post(
+                "file_deleted", universe_name,
+                json={"file_name": filename, "folder_path": universe_path}
             )
             os.remove(file_path)
-            # Re-analyze the universe after file deletion
-            analyze_universe(os.path.join(UNIVERSES_DIR, universe_name))
+            # The backend returns the universe analysis without the deleted file
+            analysis = response.json().get("analysis") if response.ok else None
+            if analysis is not None:
+                store_analysis(universe_path, analysis)
+            else:
+                analyze_universe(universe_path)
             return jsonify({"success": True})
+        except BackendBusy as e:
+            return jsonify({"error": str(e)}), 503
         except Exception as e:
             return jsonify({"error": str(e)}), 500
     
     return jsonify({"error": "File not found"}), 404
 
+@app.route('/set-precedence', methods=['POST'])
+def set_precedence():
+    """Set which files are canon and their precedence, for canonical-first chat retrieval"""
+    data = request.get_json() or {}
+    universe_id = data.get('universeId')
+    if not universe_id:
+        return jsonify({"error": "Universe ID is required"}), 400
+    
+    universe_name = universe_id.replace('universe-', '')
+    universe_path = os.path.join(UNIVERSES_DIR, universe_name)
+    if not os.path.exists(universe_path):
+        return jsonify({"error": "Universe not found"}), 404
+    
+    order = data.get('order', [])
+    canonical = data.get('canonical', [])
+    # Plain file names only, so nothing outside the universe can be named
+    for field, names in (("order", order), ("canonical", canonical)):
+        if not isinstance(names, list) or not all(
+                isinstance(f, str) and f == os.path.basename(f) and f not in ('', '.', '..') for f in names):
+            return jsonify({"error": f"'{field}' must be a list of file names"}), 400
+    missing = [f for f in order + canonical if not os.path.isfile(os.path.join(universe_path, f))]
+    if missing:
+        return jsonify({"error": f"Unknown files: {', '.join(missing)}"}), 400
+    
+    response = backend.post(
+        "set_precedence", universe_name,
+        json={"folder_path": universe_path, "order": order, "canonical": canonical}
+    )
+    if not response.ok:
+        return jsonify({"error": "Failed to update precedence"}), 502
+    return jsonify({"success": True, **response.json()})
+
 @app.route('/get-knowledge-graph', methods=['GET'])
 def get_knowledge_graph():
     universe_id = request.args.get('universeId')
     
-    if not universe_id or universe_id not in universe_analysis:
+    analysis = universe_analysis.get(universe_id) if universe_id else None
+    if analysis is None:
         return jsonify({"error": "No analysis available for this universe"}), 404
     
-    knowledge_graph = universe_analysis[universe_id].get("knowledge_graph", {})
+    knowledge_graph = analysis.get("knowledge_graph", {})
     
-    # Generate a visual graph using NetworkX
-    graph_image = generate_graph_image(knowledge_graph)
+    # Rendered on the first request for this graph version (the UI draws from
+    # /get-graph-layout, so most analyses are never rendered)
+    with timed("render_graph"):
+        try:
+            graph_image = graph_images.get(knowledge_graph, timeout=GRAPH_RENDER_TIMEOUT)
+        except Exception as e:
+            print(f"Error rendering knowledge graph: {str(e)}")
+            graph_image = None
     
     return jsonify({
         "knowledge_graph": knowledge_graph,
         "graph_image": graph_image
     })
 
+@app.route('/get-graph-layout', methods=['GET'])
+def get_graph_layout():
+    """Node coordinates and edges as compact JSON; 304 if the client's copy is current"""
+    universe_id = request.args.get('universeId')
+    
+    analysis = universe_analysis.get(universe_id) if universe_id else None
+    if analysis is None:
+        return jsonify({"error": "No analysis available for this universe"}), 404
+    
+    knowledge_graph = analysis.get("knowledge_graph", {})
+    with timed("layout_graph"):
+        layout = graph_layouts.get(universe_id.replace('universe-', ''), knowledge_graph)
+    
+    response = jsonify(layout)
+    response.set_etag(layout["version"])
+    return response.make_conditional(request)
+
 @app.route('/get-contradictions', methods=['GET'])
 def get_contradictions():
     universe_id = request.args.get('universeId')
     
-    if not universe_id or universe_id not in universe_analysis:
+    analysis = universe_analysis.get(universe_id) if universe_id else None
+    if analysis is None:
         return jsonify({"error": "No analysis available for this universe"}), 404
     
     return jsonify({
-        "contradictions": universe_analysis[universe_id].get("contradictions", []),
-        "speculation_boundaries": universe_analysis[universe_id].get("speculation_boundaries", [])
+        "contradictions": analysis.get("contradictions", []),
+        "speculation_boundaries": analysis.get("speculation_boundaries", [])
     })
 
-def generate_graph_image(knowledge_graph):
-    """Generate a NetworkX visualization of the knowledge graph"""
-    if not knowledge_graph or 'nodes' not in knowledge_graph or 'edges' not in knowledge_graph:
-        return None
-    
-    # Create a NetworkX graph
-    G = nx.Graph()
-    
-    # Node colors based on type
-    node_colors = {
-        'Character': '#4a6cf7',  # Primary color
-        'Location': '#00d4d7',   # Accent color
-        'Object': '#ff6b6b',     # Danger color
-        'Other': '#6c757d'       # Secondary color
-    }
-    
-    # Node labels and colors
-    node_labels = {}
-    node_color_map = []
-    
-    # Add nodes to graph
-    for node in knowledge_graph['nodes']:
-        G.add_node(node['id'])
-        node_labels[node['id']] = node['id']
-        node_type = node.get('type', 'Other')
-        node_color_map.append(node_colors.get(node_type, node_colors['Other']))
-    
-    # Add edges to graph
-    for edge in knowledge_graph['edges']:
-        if edge['source'] in node_labels and edge['target'] in node_labels:
-            G.add_edge(edge['source'], edge['target'], 
-                      label=edge.get('relationship', ''))
-    
-    # Create figure
-    plt.figure(figsize=(12, 10))
-    plt.tight_layout()
-    
-    # Position nodes using spring layout
-    pos = nx.spring_layout(G, k=0.4, iterations=50)
-    
-    # Draw nodes
-    nx.draw_networkx_nodes(G, pos, 
-                          node_size=900, 
-                          node_color=node_color_map, 
-                          alpha=0.9,
-                          edgecolors='white',
-                          linewidths=2.0)
-    
-    # Draw edges
-    nx.draw_networkx_edges(G, pos, width=1.5, alpha=0.7, edge_color='#d0d0d0')
-    
-    # Draw labels
-    nx.draw_networkx_labels(G, pos, font_size=10, font_family='sans-serif', 
-                           font_weight='bold', font_color='white')
-    
-    # Draw edge labels (relationships)
-    edge_labels = nx.get_edge_attributes(G, 'label')
-    nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_labels, 
-                               font_size=8, font_color='#333333',
-                               bbox=dict(facecolor='white', edgecolor='none', 
-                                        alpha=0.7, boxstyle='round,pad=0.2'))
-    
-    # Create legend
-    legend_elements = [
-        mpatches.Patch(color=node_colors['Character'], label='Character'),
-        mpatches.Patch(color=node_colors['Location'], label='Location'),
-        mpatches.Patch(color=node_colors['Object'], label='Object'),
-        mpatches.Patch(color=node_colors['Other'], label='Other')
-    ]
-    plt.legend(handles=legend_elements, loc='upper right', fontsize=10)
-    
-    # Set background and remove axes
-    plt.axis('off')
-    
-    # Add title
-    plt.title('Knowledge Graph Visualization', fontsize=16, pad=20)
-    
-    # Save figure to BytesIO
-    buffer = io.BytesIO()
-    plt.savefig(buffer, format='png', bbox_inches='tight', 
-               dpi=100, facecolor='#fcfcff')
-    plt.close()
-    
-    # Convert to base64 for embedding in HTML
-    buffer.seek(0)
-    image_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-    return f"data:image/png;base64,{image_base64}"
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint for backend-call and graph-render timings"""
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+def build_knowledge_graph(universe_path):
+    """The universe's knowledge graph, built locally with LLM refinement of uncertain items,
+    and the contradictions found in its facts"""
+    universe_name = os.path.basename(universe_path)
+
+    def refine(candidates):
+        # The local graph is still served if refinement fails; it's retried next time
+        try:
+            response = backend.post("refine_graph", universe_name, json={"candidates": candidates})
+        except Exception as e:
+            return {"error": str(e)}
+        return response.json().get("refinements") if response.ok else {"error": response.text}
+
+    with timed("build_graph"):
+        builder = TieredGraphBuilder(universe_path, refine=refine)
+        return builder.build(), builder.contradictions
+
+def store_analysis(universe_path, data):
+    """Store a universe's analysis and prepare its graph layout"""
+    universe_id = f"universe-{os.path.basename(universe_path)}"
+    if use_local_graph():
+        graph, contradictions = build_knowledge_graph(universe_path)
+        data = {**data, "knowledge_graph": graph}
+        # Listed after the contradictions the backend's analysis found
+        if isinstance(data.get("contradictions", []), list):
+            data["contradictions"] = data.get("contradictions", []) + contradictions
+    universe_analysis.put(universe_id, data)
+    with timed("layout_graph"):
+        graph_layouts.get(os.path.basename(universe_path), data.get("knowledge_graph", {}))
 
 def analyze_universe(universe_path):
     """Call the analysis endpoint and store results"""
     try:
         # Make the POST request to analyze the folder
-        response = requests.post(
-            'http://localhost:8000/analyze',
+        # Concurrent re-analyses of the same universe share one backend call
+        response = backend.post(
+            "analyze", os.path.basename(universe_path),
             files={'folder': (None, universe_path)}
         )
         
         if response.status_code == 200:
             data = response.json()
-            universe_id = f"universe-{os.path.basename(universe_path)}"
-            universe_analysis[universe_id] = data
+            store_analysis(universe_path, data)
             return data
         else:
             print(f"Analysis request failed with status code {response.status_code}")
@@ -382,13 +382,14 @@ async function showKnowledgeGraph() {
   `;
 
   try {
-    const response = await fetch(
-      `/get-knowledge-graph?universeId=${universeId}`
-    );
+    const response = await fetch(`/get-graph-layout?universeId=${universeId}`);
     const data = await response.json();
 
-    if (response.ok && data.knowledge_graph) {
-      renderKnowledgeGraph(data, universeName);
+    if (response.ok && data.nodes) {
+      renderKnowledgeGraph(
+        { knowledge_graph: expandGraphLayout(data) },
+        universeName
+      );
     } else {
       document.getElementById("chat-output").innerHTML = `
         <div class="error-message">
@@ -408,6 +409,23 @@ async function showKnowledgeGraph() {
   }
 }
 
+// Expand the compact layout payload ([id, type, x, y] nodes and
+// [source, target, relationship] edges, by index) into node/edge objects
+function expandGraphLayout(layout) {
+  const nodes = layout.nodes.map(([id, type, x, y]) => ({
+    id,
+    type: layout.types[type],
+    x,
+    y,
+  }));
+  const edges = layout.edges.map(([source, target, relationship]) => ({
+    source: nodes[source].id,
+    target: nodes[target].id,
+    relationship: layout.relationships[relationship],
+  }));
+  return { nodes, edges };
+}
+
 function renderKnowledgeGraph(data, universeName) {
   const chatOutput = document.getElementById("chat-output");
   const graphData = data.knowledge_graph;
@@ -579,6 +597,9 @@ function getTopCentralNodes(graphData, limit) {
     .slice(0, limit);
 }
 
+// Above this many nodes the server layout is drawn as-is, without a simulation
+const LARGE_GRAPH_NODES = 300;
+
 // Global variables for the graph visualization
 let graphSimulation;
 let graphSvg;
@@ -693,38 +714,64 @@ function initializeInteractiveGraph(graphData, containerId) {
   // Add tooltips on hover
   nodes.append("title").text((d) => `${d.id} (${d.type})`);
 
-  // Create the force simulation
-  graphSimulation = d3
-    .forceSimulation(graphData.nodes)
-    .force(
-      "link",
-      d3
-        .forceLink(graphData.edges)
-        .id((d) => d.id)
-        .distance(150)
-    )
-    .force("charge", d3.forceManyBody().strength(-400))
-    .force("center", d3.forceCenter(width / 2, height / 2))
-    .force("collision", d3.forceCollide().radius(40))
-    .on("tick", () => {
-      // Update positions on tick
-      lines
-        .attr("x1", (d) => d.source.x)
-        .attr("y1", (d) => d.source.y)
-        .attr("x2", (d) => d.target.x)
-        .attr("y2", (d) => d.target.y);
-
-      links
-        .select("text")
-        .attr("x", (d) => (d.source.x + d.target.x) / 2)
-        .attr("y", (d) => (d.source.y + d.target.y) / 2);
-
-      nodes.attr("transform", (d) => `translate(${d.x}, ${d.y})`);
+  // Update element positions from node coordinates
+  function ticked() {
+    lines
+      .attr("x1", (d) => d.source.x)
+      .attr("y1", (d) => d.source.y)
+      .attr("x2", (d) => d.target.x)
+      .attr("y2", (d) => d.target.y);
+
+    links
+      .select("text")
+      .attr("x", (d) => (d.source.x + d.target.x) / 2)
+      .attr("y", (d) => (d.source.y + d.target.y) / 2);
+
+    nodes.attr("transform", (d) => `translate(${d.x}, ${d.y})`);
+  }
+
+  // Server-computed positions are centred on the origin
+  const positioned = graphData.nodes.every((d) => d.x !== undefined);
+  if (positioned) {
+    graphData.nodes.forEach((d) => {
+      d.x += width / 2;
+      d.y += height / 2;
     });
+  }
+
+  if (positioned && graphData.nodes.length > LARGE_GRAPH_NODES) {
+    // Large graph: the server layout is final, so draw it once
+    const nodeById = new Map(graphData.nodes.map((d) => [d.id, d]));
+    graphData.edges.forEach((edge) => {
+      edge.source = nodeById.get(edge.source);
+      edge.target = nodeById.get(edge.target);
+    });
+    graphSimulation = null;
+    ticked();
+  } else {
+    // Create the force simulation
+    graphSimulation = d3
+      .forceSimulation(graphData.nodes)
+      .force(
+        "link",
+        d3
+          .forceLink(graphData.edges)
+          .id((d) => d.id)
+          .distance(150)
+      )
+      .force("charge", d3.forceManyBody().strength(-400))
+      .force("center", d3.forceCenter(width / 2, height / 2))
+      .force("collision", d3.forceCollide().radius(40))
+      .on("tick", ticked);
+
+    // Starting from the server layout, only small adjustments are needed
+    if (positioned) graphSimulation.alpha(0.1);
+  }
 
   // Functions for node dragging
   function dragstarted(event, d) {
-    if (!event.active) graphSimulation.alphaTarget(0.3).restart();
+    if (graphSimulation && !event.active)
+      graphSimulation.alphaTarget(0.3).restart();
     d.fx = d.x;
     d.fy = d.y;
   }
@@ -732,10 +779,15 @@ function initializeInteractiveGraph(graphData, containerId) {
   function dragged(event, d) {
     d.fx = event.x;
     d.fy = event.y;
+    if (!graphSimulation) {
+      d.x = event.x;
+      d.y = event.y;
+      ticked();
+    }
   }
 
   function dragended(event, d) {
-    if (!event.active) graphSimulation.alphaTarget(0);
+    if (graphSimulation && !event.active) graphSimulation.alphaTarget(0);
     d.fx = null;
     d.fy = null;
   }
@@ -1439,6 +1491,10 @@ async function handleFileUpload(event) {
   }
 
   const universeId = selectedUniverse.id;
+  const formData = new FormData();
+  formData.append("universeId", universeId);
+
+  let fileCount = 0;
   for (let i = 0; i < fileList.length; i++) {
     const file = fileList[i];
 
@@ -1446,13 +1502,15 @@ async function handleFileUpload(event) {
       alert(`Only .txt files are supported. Skipping ${file.name}`);
       continue;
     }
+    formData.append("files", file);
+    fileCount++;
+  }
 
+  // All selected files go up in one request, so the backend reconciles and
+  // analyzes the universe once rather than once per file
+  if (fileCount > 0) {
     try {
-      const formData = new FormData();
-      formData.append("universeId", universeId);
-      formData.append("file", file);
-
-      const response = await fetch("/upload-file", {
+      const response = await fetch("/upload-files", {
         method: "POST",
         body: formData,
       });
@@ -1463,11 +1521,11 @@ async function handleFileUpload(event) {
         // Refresh the file list
         await handleUniverseClick(universeId);
       } else {
-        alert(`Failed to upload ${file.name}: ${data.error}`);
+        alert(`Failed to upload files: ${data.error}`);
       }
     } catch (error) {
-      console.error(`Error uploading ${file.name}:`, error);
-      alert(`An error occurred while uploading ${file.name}.`);
+      console.error("Error uploading files:", error);
+      alert("An error occurred while uploading the files.");
     }
   }
 
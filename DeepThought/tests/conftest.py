@@ -0,0 +1,60 @@
+import os
+import sys
+
+import pytest
+
+# The app imports its helpers as the top-level `utils` package (run from DeepThought/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeResponse:
+    def __init__(self, data, status_code=200):
+        self._data = data
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.text = str(data)
+
+    def json(self):
+        return self._data
+
+
+@pytest.fixture(scope="session")
+def app_module(tmp_path_factory):
+    # app.py creates its universes directory in the working directory on import
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("app"))
+    try:
+        import app
+    finally:
+        os.chdir(cwd)
+    return app
+
+
+@pytest.fixture
+def web(app_module, tmp_path, monkeypatch):
+    """The Flask app with universes in tmp_path and backend calls recorded.
+
+    Set `web.responses[endpoint]` to the data the backend returns.
+    """
+    from utils.analysis_store import AnalysisStore
+    from utils.graph_layout import GraphLayoutStore
+    from utils.graph_render import GraphImageCache
+
+    monkeypatch.setattr(app_module, "UNIVERSES_DIR", str(tmp_path))
+    monkeypatch.setattr(app_module, "KG_BUILDER", "llm")
+    monkeypatch.setattr(
+        app_module, "universe_analysis", AnalysisStore(str(tmp_path / "analysis.sqlite3"))
+    )
+    monkeypatch.setattr(app_module, "graph_layouts", GraphLayoutStore(str(tmp_path)))
+    monkeypatch.setattr(app_module, "graph_images", GraphImageCache())
+
+    client = app_module.app.test_client()
+    client.calls = []
+    client.responses = {}
+
+    def post(endpoint, universe, json=None, files=None):
+        client.calls.append((endpoint, universe, json))
+        return FakeResponse(client.responses.get(endpoint, {}))
+
+    monkeypatch.setattr(app_module.backend, "post", post)
+    return client
@@ -0,0 +1,51 @@
+from utils.analysis_store import AnalysisStore
+
+ANALYSIS = {"knowledge_graph": {"entities": {"Arya": {"type": "PERSON"}}}, "contradictions": []}
+
+
+def test_analyses_survive_reopening_the_database(tmp_path):
+    db = str(tmp_path / "analysis.sqlite3")
+    AnalysisStore(db).put("universe-a", ANALYSIS)
+
+    reopened = AnalysisStore(db)
+    assert reopened.get("universe-a") == ANALYSIS
+    assert reopened.get("universe-b") is None
+
+
+def test_a_write_from_another_connection_drops_the_cached_analysis(tmp_path):
+    db = str(tmp_path / "analysis.sqlite3")
+    worker, other = AnalysisStore(db), AnalysisStore(db)
+    worker.put("universe-a", ANALYSIS)
+    assert "universe-a" in worker._cache
+
+    updated = {**ANALYSIS, "contradictions": [{"type": "Location"}]}
+    other.put("universe-a", updated)
+
+    assert worker.get("universe-a") == updated
+    other.delete("universe-a")
+    assert worker.get("universe-a") is None
+
+
+def test_own_writes_keep_the_cache(tmp_path):
+    store = AnalysisStore(str(tmp_path / "analysis.sqlite3"))
+    store.put("universe-a", ANALYSIS)
+    store.put("universe-b", ANALYSIS)
+
+    assert list(store._cache) == ["universe-a", "universe-b"]
+
+
+def test_delete_and_list_are_per_universe(tmp_path):
+    store = AnalysisStore(str(tmp_path / "analysis.sqlite3"), max_entries=1)
+    for universe_id in ("universe-b", "universe-a", "universe-c"):
+        store.put(universe_id, {**ANALYSIS, "universe": universe_id})
+    assert store.universe_ids() == ["universe-a", "universe-b", "universe-c"]
+    # Only the most recent analysis stays in memory; the others are read back
+    assert list(store._cache) == ["universe-c"]
+    assert store.get("universe-b")["universe"] == "universe-b"
+
+    store.delete("universe-b")
+    store.delete("universe-missing")
+
+    assert store.universe_ids() == ["universe-a", "universe-c"]
+    assert store.get("universe-b") is None
+    assert store.get("universe-a")["universe"] == "universe-a"
@@ -0,0 +1,90 @@
+import io
+import os
+
+
+def _upload(web, *names, universe="universe-saga"):
+    return web.post(
+        "/upload-files",
+        data={
+            "universeId": universe,
+            "files": [(io.BytesIO(f"Text of {name}".encode()), name) for name in names],
+        },
+        content_type="multipart/form-data",
+    )
+
+
+def test_upload_files_sends_one_batch_and_stores_its_analysis(web, app_module, tmp_path):
+    web.responses["files_uploaded"] = {"analysis": {"summary": "two books"}}
+
+    response = _upload(web, "one.txt", "two.txt", "cover.png")
+
+    assert response.status_code == 200
+    assert response.get_json() == {
+        "success": True,
+        "filenames": ["one.txt", "two.txt"],
+        "skipped": ["cover.png"],
+    }
+    assert {"one.txt", "two.txt"} <= set(os.listdir(tmp_path / "saga"))
+    assert "cover.png" not in os.listdir(tmp_path / "saga")
+    assert [call[0] for call in web.calls] == ["files_uploaded"]
+    endpoint, universe, body = web.calls[0]
+    assert universe == "saga"
+    assert body["file_names"] == ["one.txt", "two.txt"]
+    assert app_module.universe_analysis.get("universe-saga") == {"summary": "two books"}
+
+
+def test_upload_files_falls_back_to_analyze_without_an_analysis(web, app_module):
+    web.responses["analyze"] = {"summary": "analyzed"}
+
+    assert _upload(web, "one.txt").status_code == 200
+
+    assert [call[0] for call in web.calls] == ["files_uploaded", "analyze"]
+    assert app_module.universe_analysis.get("universe-saga") == {"summary": "analyzed"}
+
+
+def test_upload_files_rejects_batches_without_text_files(web):
+    assert web.post("/upload-files", data={"universeId": "universe-saga"}).status_code == 400
+
+    response = _upload(web, "cover.png")
+    assert response.status_code == 400
+    assert response.get_json()["skipped"] == ["cover.png"]
+    assert web.calls == []
+
+    assert _upload(web, "one.txt", universe="").status_code == 400
+
+
+def _set_precedence(web, **body):
+    return web.post("/set-precedence", json={"universeId": "universe-saga", **body})
+
+
+def test_set_precedence_forwards_known_files(web, tmp_path):
+    (tmp_path / "saga").mkdir()
+    for name in ("one.txt", "two.txt"):
+        (tmp_path / "saga" / name).write_text(name)
+    web.responses["set_precedence"] = {"precedence": ["two.txt", "one.txt"], "canonical": ["one.txt"]}
+
+    response = _set_precedence(web, order=["two.txt", "one.txt"], canonical=["one.txt"])
+
+    assert response.status_code == 200
+    assert response.get_json()["canonical"] == ["one.txt"]
+    assert web.calls == [("set_precedence", "saga", {
+        "folder_path": str(tmp_path / "saga"), "order": ["two.txt", "one.txt"], "canonical": ["one.txt"]})]
+
+
+def test_set_precedence_accepts_only_file_names_in_the_universe(web, tmp_path):
+    assert _set_precedence(web, order=[]).status_code == 404
+    (tmp_path / "saga" / "notes").mkdir(parents=True)
+    (tmp_path / "saga" / "one.txt").write_text("one")
+    (tmp_path / "secret.txt").write_text("secret")
+
+    for body in ({"order": "one.txt"}, {"canonical": [1]}, {"order": ["../secret.txt"]},
+                 {"canonical": ["notes/one.txt"]}, {"order": [".."]}, {"order": [""]}):
+        response = _set_precedence(web, **body)
+        assert response.status_code == 400
+        assert "must be a list of file names" in response.get_json()["error"]
+    for body in ({"order": ["missing.txt"]}, {"canonical": ["notes"]}):
+        response = _set_precedence(web, **body)
+        assert response.status_code == 400
+        assert response.get_json()["error"].startswith("Unknown files")
+    assert web.post("/set-precedence", json={}).status_code == 400
+    assert web.calls == []
@@ -0,0 +1,123 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from utils import backend_client
+from utils.backend_client import BackendBusy, BackendClient
+
+
+class StubSession:
+    """Stands in for requests.Session; each post waits until `release` is set."""
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+        self.error = None
+
+    def post(self, url, json=None, files=None, timeout=None):
+        self.calls.append({"url": url, "json": json, "timeout": timeout})
+        self.release.wait(5)
+        if self.error:
+            raise self.error
+        return {"url": url, "json": json}
+
+
+@pytest.fixture
+def client():
+    client = BackendClient("http://backend:8000/", max_per_universe=2)
+    client.session = StubSession()
+    return client
+
+
+def _in_threads(count, target):
+    results = [None] * count
+    errors = [None] * count
+
+    def run(i):
+        try:
+            results[i] = target()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def _wait_for_calls(client, count):
+    deadline = time.monotonic() + 5
+    while len(client.session.calls) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_posts_with_per_endpoint_timeouts(client):
+    response = client.post("chat_bot", "u", json={"question": "Who?"})
+
+    assert response["url"] == "http://backend:8000/chat_bot"
+    assert client.session.calls[0]["timeout"] == (
+        backend_client.CONNECT_TIMEOUT,
+        backend_client.READ_TIMEOUTS["chat_bot"],
+    )
+    client.post("unknown", "u")
+    assert client.session.calls[1]["timeout"][1] == backend_client.DEFAULT_READ_TIMEOUT
+
+
+def test_identical_concurrent_requests_share_one_call(client):
+    client.session.release.clear()
+    threads, results, errors = _in_threads(
+        5, lambda: client.post("analyze", "u", json={"folder": "u"})
+    )
+    _wait_for_calls(client, 1)
+    time.sleep(0.05)
+    client.session.release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(client.session.calls) == 1
+    assert errors == [None] * 5
+    assert all(result is results[0] for result in results)
+    assert client._in_flight == {} and client._per_universe == {}
+
+
+def test_followers_get_the_leaders_error(client):
+    client.session.release.clear()
+    client.session.error = ConnectionError("backend down")
+    threads, _, errors = _in_threads(3, lambda: client.post("analyze", "u"))
+    _wait_for_calls(client, 1)
+    time.sleep(0.05)
+    client.session.release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(client.session.calls) == 1
+    assert all(isinstance(e, ConnectionError) for e in errors)
+
+
+def test_distinct_requests_per_universe_are_limited(client):
+    client.session.release.clear()
+    threads, _, _ = _in_threads(
+        2, lambda: client.post("chat_bot", "u", json={"q": threading.get_ident()})
+    )
+    _wait_for_calls(client, 2)
+
+    with pytest.raises(BackendBusy):
+        client.post("chat_bot", "u", json={"q": "third"})
+    # Other universes are unaffected
+    client.session.release.set()
+    assert client.post("chat_bot", "v", json={"q": "third"})["json"] == {"q": "third"}
+    for thread in threads:
+        thread.join()
+    assert client.post("chat_bot", "u", json={"q": "later"})
+
+
+def test_post_async_uses_the_same_client(client):
+    response = asyncio.run(client.post_async("file_deleted", "u", json={"f": 1}))
+
+    assert response["json"] == {"f": 1}
+    assert client.session.calls[0]["timeout"][1] == backend_client.READ_TIMEOUTS[
+        "file_deleted"
+    ]
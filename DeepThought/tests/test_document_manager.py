@@ -0,0 +1,124 @@
+import io
+import os
+import threading
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from utils import document_manager
+from utils.document_manager import CATALOG_FILE, DocumentManager
+
+
+def _file(name, text):
+    return FileStorage(io.BytesIO(text.encode("utf-8")), filename=name)
+
+
+def _stored(tmp_path):
+    return sorted(f for f in os.listdir(tmp_path) if not f.startswith(CATALOG_FILE))
+
+
+def test_adding_the_same_content_twice_returns_the_first_document(tmp_path):
+    manager = DocumentManager(str(tmp_path))
+    first = manager.add_document(_file("a.txt", "Arya"), {"book": 1})
+
+    assert manager.add_document(_file("copy.txt", "Arya")) == first
+    assert list(manager.documents) == [first]
+    record = manager.get_document(first)
+    assert (record["filename"], record["metadata"], record["size"]) == ("a.txt", {"book": 1}, 4)
+    assert _stored(tmp_path) == [os.path.basename(record["filepath"])]
+    assert manager.get_document("missing") is None
+
+
+def test_concurrent_uploads_from_several_workers_add_one_document(tmp_path):
+    managers = [DocumentManager(str(tmp_path)) for _ in range(4)]
+    ids = []
+    threads = [threading.Thread(target=lambda m: ids.append(m.add_document(_file("a.txt", "Arya"))),
+                                args=(manager,))
+               for manager in managers for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(ids)) == 1 and len(ids) == 12
+    assert len(_stored(tmp_path)) == 1
+
+
+def test_catalog_is_shared_by_managers_on_the_same_directory(tmp_path):
+    writer, reader = DocumentManager(str(tmp_path)), DocumentManager(str(tmp_path))
+    doc_id = writer.add_document(_file("a.txt", "Arya"))
+
+    assert reader.get_document_content(doc_id) == "Arya"
+    writer.remove_document(doc_id)
+    assert reader.get_document(doc_id) is None
+    assert reader.remove_document(doc_id) is False
+    assert _stored(tmp_path) == []
+
+
+def test_canonical_documents_go_first(tmp_path):
+    manager = DocumentManager(str(tmp_path))
+    a = manager.add_document(_file("a.txt", "a"))
+    b = manager.add_document(_file("b.txt", "b"))
+    canon = manager.add_document(_file("canon.txt", "c"), canonical=True)
+
+    assert manager.hierarchy == [canon, a, b]
+    assert [d["id"] for d in manager.get_all_documents()] == [canon, a, b]
+
+
+def test_move_document_reorders_around_an_anchor(tmp_path):
+    manager = DocumentManager(str(tmp_path))
+    a, b, c, d = (manager.add_document(_file(f"{n}.txt", n)) for n in "abcd")
+
+    manager.move_document(d, before=b)
+    assert manager.hierarchy == [a, d, b, c]
+    manager.move_document(a, after=c)
+    assert manager.hierarchy == [d, b, c, a]
+    manager.move_document(c)
+    assert manager.hierarchy == [c, d, b, a]
+
+    with pytest.raises(ValueError):
+        manager.move_document("missing")
+    with pytest.raises(ValueError):
+        manager.move_document(a, before=a)
+
+
+def test_repeated_moves_into_the_same_gap_renumber(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_manager, "MIN_RANK_GAP", 0.1)
+    manager = DocumentManager(str(tmp_path))
+    a, b, c = (manager.add_document(_file(f"{n}.txt", n)) for n in "abc")
+
+    # Each move halves the gap after a
+    for moved in (c, b, c, b, c, b):
+        manager.move_document(moved, after=a)
+
+    assert manager.hierarchy == [a, b, c]
+
+
+def test_set_hierarchy_keeps_unlisted_documents_after_the_listed_ones(tmp_path):
+    manager = DocumentManager(str(tmp_path))
+    a, b, c = (manager.add_document(_file(f"{n}.txt", n)) for n in "abc")
+
+    manager.set_hierarchy([c, b])
+    assert manager.hierarchy == [c, b, a]
+    manager.set_hierarchy([a])
+    assert manager.hierarchy == [a, c, b]
+    with pytest.raises(ValueError):
+        manager.set_hierarchy([a, "missing"])
+
+
+def test_documents_are_read_in_pieces(tmp_path):
+    manager = DocumentManager(str(tmp_path))
+    text = "Arya ☃ Stark " * 10
+    doc_id = manager.add_document(_file("a.txt", text))
+
+    pieces = list(manager.iter_document_content(doc_id, chunk_size=5))
+    assert "".join(pieces) == text and len(pieces) > 1
+    assert manager.read_range(doc_id, 0, 4) == b"Arya"
+    assert manager.read_range(doc_id, len(text.encode()) - 6) == b"Stark "
+    with manager.map_document(doc_id) as mapped:
+        assert mapped[:4] == b"Arya"
+    assert list(manager.iter_document_content("missing")) == []
+    assert manager.read_range("missing", 0) is None
+    with pytest.raises(KeyError):
+        with manager.map_document("missing"):
+            pass
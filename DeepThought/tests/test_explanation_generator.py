@@ -0,0 +1,156 @@
+import json
+import re
+from collections import OrderedDict
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from utils import explanation_generator as eg
+
+
+class ScriptedLLM:
+    """Answers packed prompts in JSON and single prompts in text.
+
+    `packed` picks how packed prompts are answered: "all", "skip_last",
+    "malformed" or "error"; prompts mentioning a word in `fail` raise.
+    """
+
+    def __init__(self, packed="all", fail=()):
+        self.packed = packed
+        self.fail = fail
+        self.prompts = []
+
+    def __call__(self, prompt):
+        text = prompt.to_string()
+        self.prompts.append(text)
+        if any(word in text for word in self.fail):
+            raise RuntimeError("quota exceeded")
+        if "JSON Explanations" not in text:
+            description = re.search(r"narrative:\s+(.+)", text).group(1)
+            return AIMessage(content=f"single: {description}")
+        if self.packed == "error":
+            raise RuntimeError("overloaded")
+        if self.packed == "malformed":
+            return AIMessage(content="Here are your explanations!")
+        listed = text.split("narrative:")[1].split("For *each*")[0]
+        items = re.findall(r"^(\d+)\. (.+)$", listed, re.MULTILINE)
+        if self.packed == "skip_last":
+            items = items[:-1]
+        answer = [{"index": int(i), "explanation": f"packed: {d}"} for i, d in items]
+        return AIMessage(content="```json\n" + json.dumps(answer) + "\n```")
+
+    def packed_prompts(self):
+        return [p for p in self.prompts if "JSON Explanations" in p]
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    monkeypatch.setattr(eg, "_explanations", OrderedDict())
+    fake = ScriptedLLM()
+    eg.set_llm_factory(lambda: RunnableLambda(fake))
+    yield fake
+    eg.set_llm_factory(None)
+
+
+def _contradictions(*descriptions):
+    return [{"description": d} for d in descriptions]
+
+
+def _texts(explanations):
+    return [e.content for e in explanations]
+
+
+def test_duplicates_are_explained_once_in_one_packed_prompt(llm):
+    found = eg.generate_explanations(_contradictions("Arya dies", "Ned lives", "Arya dies"))
+
+    assert _texts(found) == ["packed: Arya dies", "packed: Ned lives", "packed: Arya dies"]
+    assert len(llm.prompts) == 1
+
+
+def test_a_lone_contradiction_uses_the_single_prompt(llm):
+    assert _texts(eg.generate_explanations(_contradictions("Arya dies"))) == ["single: Arya dies"]
+    assert llm.packed_prompts() == []
+
+
+def test_cache_hits_are_keyed_by_world_context(llm):
+    eg.generate_explanations(_contradictions("Arya dies", "Ned lives"), "Westeros")
+    calls = len(llm.prompts)
+
+    again = eg.generate_explanations(_contradictions("Ned lives", "Arya dies"), "Westeros")
+    assert _texts(again) == ["packed: Ned lives", "packed: Arya dies"]
+    assert len(llm.prompts) == calls
+    assert _texts([eg.generate_explanation({"description": "Arya dies"}, "Westeros")]) == ["packed: Arya dies"]
+    assert len(llm.prompts) == calls
+
+    eg.generate_explanations(_contradictions("Arya dies"), "Essos")
+    assert len(llm.prompts) == calls + 1
+
+
+def test_cache_evicts_the_least_recently_used(llm, monkeypatch):
+    monkeypatch.setattr(eg, "CACHE_SIZE", 2)
+    for description in ("a", "b"):
+        eg.generate_explanation({"description": description})
+    eg.generate_explanation({"description": "a"})
+    eg.generate_explanation({"description": "c"})
+    calls = len(llm.prompts)
+
+    eg.generate_explanation({"description": "a"})
+    assert len(llm.prompts) == calls
+    eg.generate_explanation({"description": "b"})
+    assert len(llm.prompts) == calls + 1
+
+
+def test_pack_respects_item_and_character_limits():
+    assert [len(g) for g in eg._pack([f"c{i}" for i in range(eg.MAX_PACKED * 2 + 1)])] == [
+        eg.MAX_PACKED, eg.MAX_PACKED, 1]
+    half = "x" * (eg.PACK_CHARS // 2)
+    huge = "y" * (eg.PACK_CHARS + 1)
+    assert eg._pack([half, half, "z", huge, "w"]) == [[half, half], ["z"], [huge], ["w"]]
+    assert eg._pack([]) == []
+
+
+def test_parse_packed_keeps_only_well_formed_items():
+    response = AIMessage(content="```json\n" + json.dumps([
+        {"index": 1, "explanation": "one"},
+        {"index": 3, "explanation": "three"},
+        {"index": 4, "explanation": "out of range"},
+        {"index": "2", "explanation": "index not a number"},
+        {"index": 2, "explanation": ""},
+        "not an object",
+    ]) + "\n```")
+
+    answers = eg._parse_packed(response, 3)
+
+    assert {i: a.content for i, a in answers.items()} == {0: "one", 2: "three"}
+    assert eg._parse_packed("not json", 2) == {}
+    assert eg._parse_packed('{"index": 1, "explanation": "not a list"}', 1) == {}
+
+
+def test_items_a_packed_answer_leaves_out_are_explained_singly(llm):
+    llm.packed = "skip_last"
+
+    found = eg.generate_explanations(_contradictions("Arya dies", "Ned lives", "Jon wins"))
+
+    assert _texts(found) == ["packed: Arya dies", "packed: Ned lives", "single: Jon wins"]
+
+
+@pytest.mark.parametrize("packed", ["malformed", "error"])
+def test_failed_packed_prompts_fall_back_to_single_prompts(llm, packed):
+    llm.packed = packed
+
+    found = eg.generate_explanations(_contradictions("Arya dies", "Ned lives"))
+
+    assert _texts(found) == ["single: Arya dies", "single: Ned lives"]
+
+
+def test_a_failed_call_only_loses_its_own_explanation(llm):
+    llm.packed = "error"
+    llm.fail = ("Ned",)
+
+    found = eg.generate_explanations(_contradictions("Arya dies", "Ned lives", "Jon wins"))
+
+    assert _texts(found) == ["single: Arya dies", eg.FALLBACK_EXPLANATION, "single: Jon wins"]
+    # The fallback isn't cached, so the next request asks again
+    llm.fail = ()
+    assert _texts(eg.generate_explanations(_contradictions("Ned lives"))) == ["single: Ned lives"]
@@ -0,0 +1,110 @@
+import json
+
+import pytest
+
+from utils import graph_layout
+from utils.graph_layout import LAYOUT_FILE, GraphLayoutStore, compact_layout, compute_layout
+
+
+def _graph(names, edges=()):
+    return {
+        "nodes": [{"id": name, "type": "Location" if name.islower() else "Character"} for name in names],
+        "edges": [{"source": s, "target": t, "relationship": r} for s, t, r in edges],
+    }
+
+
+HOUSE = _graph(
+    ["Arya", "Sansa", "Bran", "Rickon", "Robb", "winterfell"],
+    [("Arya", "Sansa", "sister of"), ("Bran", "Rickon", "brother of"), ("Robb", "winterfell", "rules"),
+     ("Arya", "winterfell", "lives in")],
+)
+WITH_JON = _graph(
+    ["Arya", "Sansa", "Bran", "Rickon", "Robb", "winterfell", "Jon"],
+    [(e["source"], e["target"], e["relationship"]) for e in HOUSE["edges"]] + [("Jon", "Arya", "brother of")],
+)
+
+
+def test_existing_nodes_keep_their_positions_when_nodes_are_added():
+    positions, relaid_out = compute_layout(HOUSE)
+    assert relaid_out
+
+    updated, relaid_out = compute_layout(WITH_JON, positions)
+
+    assert not relaid_out
+    assert {n: updated[n] for n in positions} == positions
+    assert set(updated) == set(positions) | {"Jon"}
+    assert compute_layout(HOUSE, positions) == (positions, False)
+
+
+def test_mostly_new_graphs_are_relaid_out():
+    positions, _ = compute_layout(_graph(["Arya", "Sansa"], [("Arya", "Sansa", "sister of")]))
+
+    _, relaid_out = compute_layout(WITH_JON, positions)
+
+    assert relaid_out
+
+
+def test_compact_layout_lists_types_and_relationships_once():
+    positions = {"Arya": [0.5, -0.25], "Sansa": [-1.0, 0.0], "winterfell": [0.0, 1.0]}
+    graph = _graph(["Arya", "Sansa", "winterfell", "Jon"],
+                   [("Arya", "Sansa", "sister of"), ("Sansa", "Arya", "sister of"),
+                    ("Arya", "winterfell", "lives in"), ("Jon", "Arya", "brother of")])
+
+    layout = compact_layout(graph, positions, "v1", 200)
+
+    assert layout == {
+        "version": "v1",
+        "types": ["Character", "Location"],
+        "relationships": ["sister of", "lives in"],
+        "nodes": [["Arya", 0, 100, -50], ["Sansa", 0, -200, 0], ["winterfell", 1, 0, 200]],
+        "edges": [[0, 1, 0], [1, 0, 0], [0, 2, 1]],
+    }
+
+
+def test_layouts_persist_next_to_the_universe_and_reload(tmp_path, monkeypatch):
+    (tmp_path / "saga").mkdir()
+    layout = GraphLayoutStore(str(tmp_path)).get("saga", HOUSE)
+
+    with open(tmp_path / "saga" / LAYOUT_FILE) as f:
+        stored = json.load(f)
+    assert stored["version"] == layout["version"]
+    assert set(stored["positions"]) == {node["id"] for node in HOUSE["nodes"]}
+
+    def recompute(*args, **kwargs):
+        pytest.fail("a stored layout was computed again")
+
+    monkeypatch.setattr(graph_layout, "compute_layout", recompute)
+    assert GraphLayoutStore(str(tmp_path)).get("saga", HOUSE) == layout
+
+
+def test_updated_layouts_keep_their_scale_and_node_positions(tmp_path):
+    (tmp_path / "saga").mkdir()
+    store = GraphLayoutStore(str(tmp_path))
+    before = store.get("saga", HOUSE)
+
+    after = GraphLayoutStore(str(tmp_path)).get("saga", WITH_JON)
+
+    assert after["version"] != before["version"]
+    assert after["nodes"][:len(before["nodes"])] == before["nodes"]
+    with open(tmp_path / "saga" / LAYOUT_FILE) as f:
+        assert "Jon" in json.load(f)["positions"]
+
+
+def test_graph_layout_route_answers_304_for_a_current_copy(web, app_module, tmp_path):
+    (tmp_path / "saga").mkdir()
+    app_module.universe_analysis.put("universe-saga", {"knowledge_graph": HOUSE})
+
+    response = web.get("/get-graph-layout?universeId=universe-saga")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert etag == f'"{response.get_json()["version"]}"'
+
+    repeat = web.get("/get-graph-layout?universeId=universe-saga", headers={"If-None-Match": etag})
+    assert repeat.status_code == 304
+    assert repeat.data == b""
+
+    app_module.universe_analysis.put("universe-saga", {"knowledge_graph": WITH_JON})
+    changed = web.get("/get-graph-layout?universeId=universe-saga", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert web.get("/get-graph-layout?universeId=universe-other").status_code == 404
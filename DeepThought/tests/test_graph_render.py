@@ -0,0 +1,94 @@
+import base64
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils import graph_render
+from utils.graph_render import GraphImageCache, graph_hash, render_graph_image
+
+GRAPH = {
+    "nodes": [{"id": "Arya", "type": "Character"}, {"id": "Braavos", "type": "Location"}],
+    "edges": [{"source": "Arya", "target": "Braavos", "relationship": "travels to"}],
+}
+
+
+class Renders(list):
+    """Graphs passed to the render function; clear `gate` to hold renders until it is set"""
+
+    def __init__(self):
+        super().__init__()
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def __call__(self, knowledge_graph):
+        self.gate.wait(5)
+        self.append(knowledge_graph)
+        return f"image-{len(self)}"
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    """Renders run in threads and are recorded instead of drawn"""
+    renders = Renders()
+    executor = ThreadPoolExecutor(max_workers=4)
+    monkeypatch.setattr(graph_render, "render_graph_image", renders)
+    monkeypatch.setattr(GraphImageCache, "_get_executor", lambda self: executor)
+    yield renders
+    executor.shutdown()
+
+
+def test_graph_hash_ignores_key_order():
+    reordered = {"edges": GRAPH["edges"], "nodes": [dict(reversed(list(n.items()))) for n in GRAPH["nodes"]]}
+
+    assert graph_hash(reordered) == graph_hash(GRAPH)
+    assert graph_hash({**GRAPH, "edges": []}) != graph_hash(GRAPH)
+
+
+def test_renders_a_png_data_url():
+    image = render_graph_image(GRAPH)
+
+    prefix = "data:image/png;base64,"
+    assert image.startswith(prefix)
+    assert base64.b64decode(image[len(prefix):]).startswith(b"\x89PNG")
+    assert render_graph_image({}) is None
+    assert render_graph_image({"nodes": []}) is None
+
+
+def test_each_graph_version_is_rendered_once(renders):
+    cache = GraphImageCache()
+    renders.gate.clear()
+    with ThreadPoolExecutor(max_workers=4) as requests:
+        images = [requests.submit(cache.get, GRAPH, 5) for _ in range(4)]
+        renders.gate.set()
+        assert {f.result() for f in images} == {"image-1"}
+
+    assert cache.get(dict(GRAPH), timeout=5) == "image-1"
+    assert cache.get({**GRAPH, "edges": []}, timeout=5) == "image-2"
+    assert len(renders) == 2
+
+
+def test_only_the_most_recent_images_are_kept(renders):
+    cache = GraphImageCache(max_entries=2)
+    graphs = [{"nodes": [{"id": name}], "edges": []} for name in ("a", "b", "c")]
+    for graph in graphs:
+        cache.get(graph, timeout=5)
+
+    assert list(cache._images) == [graph_hash(g) for g in graphs[1:]]
+    cache.get(graphs[0], timeout=5)
+    assert len(renders) == 4
+
+
+def test_graphs_are_rendered_on_request_not_when_analyses_are_stored(web, app_module, tmp_path, renders):
+    universe_path = tmp_path / "saga"
+    universe_path.mkdir()
+    app_module.store_analysis(str(universe_path), {"knowledge_graph": GRAPH, "contradictions": []})
+    assert renders == []
+
+    response = web.get("/get-knowledge-graph?universeId=universe-saga")
+
+    assert response.status_code == 200
+    assert response.get_json() == {"knowledge_graph": GRAPH, "graph_image": "image-1"}
+    assert web.get("/get-knowledge-graph?universeId=universe-saga").get_json()["graph_image"] == "image-1"
+    assert len(renders) == 1
+    assert web.get("/get-knowledge-graph?universeId=universe-other").status_code == 404
@@ -0,0 +1,175 @@
+import re
+
+import pytest
+
+from utils import kg_builder
+from utils.kg_builder import TieredGraphBuilder
+from utils.knowledge_graph import FictionKnowledgeGraph, merge_knowledge_graphs
+
+NAMES = {"Arya": "PERSON", "Ned": "PERSON", "Winterfell": "GPE", "Braavos": "GPE"}
+
+
+@pytest.fixture
+def parsed(monkeypatch):
+    """Stands in for spaCy NER: known names only; returns the texts parsed."""
+    texts = []
+
+    def stream_entities(text):
+        texts.append(text)
+        for match in re.finditer("|".join(NAMES), text):
+            yield {"type": NAMES[match.group()], "name": match.group(),
+                   "start": match.start(), "end": match.end(),
+                   "context": text[max(0, match.start() - 20):match.end() + 20]}
+
+    monkeypatch.setattr(kg_builder, "stream_entities", stream_entities)
+    return texts
+
+
+class Refiner:
+    def __init__(self, answer=None):
+        self.answer = answer or {}
+        self.calls = []
+
+    def __call__(self, candidates):
+        self.calls.append(candidates)
+        return self.answer
+
+
+def _write(tmp_path, name, text):
+    (tmp_path / name).write_text(text, encoding="utf-8")
+
+
+def _nodes(graph):
+    return {n["id"]: n for n in graph["nodes"]}
+
+
+def test_only_uncertain_items_are_sent_for_refinement(tmp_path, parsed):
+    _write(tmp_path, "a.txt", "Ned is the father of Arya. Arya left Winterfell. Ned stayed.")
+    refine = Refiner()
+
+    graph = TieredGraphBuilder(str(tmp_path), refine=refine).build()
+
+    assert set(_nodes(graph)) == {"Ned", "Arya", "Winterfell"}
+    assert _nodes(graph)["Arya"]["type"] == "Character"
+    assert graph["edges"][0]["source"] == "Ned" and graph["edges"][0]["target"] == "Arya"
+    # Only Winterfell is mentioned once
+    assert len(refine.calls) == 1
+    assert [n["id"] for n in refine.calls[0]["nodes"]] == ["Winterfell"]
+    assert refine.calls[0]["edges"] == []
+
+
+def test_answers_are_cached_and_applied(tmp_path, parsed):
+    _write(tmp_path, "a.txt", "Arya met Ned. Arya and Ned talked. Braavos burned. Winterfell stood.")
+    refine = Refiner({"nodes": [{"id": "Braavos", "keep": False},
+                                {"id": "Winterfell", "type": "Castle", "confidence": 0.8}]})
+
+    graph = TieredGraphBuilder(str(tmp_path), refine=refine).build()
+    again = TieredGraphBuilder(str(tmp_path), refine=refine).build()
+
+    assert len(refine.calls) == 1
+    for result in (graph, again):
+        nodes = _nodes(result)
+        assert "Braavos" not in nodes
+        assert nodes["Winterfell"]["type"] == "Castle"
+        assert nodes["Winterfell"]["confidence"] == 0.8
+
+
+def test_items_the_llm_skips_are_not_asked_about_again(tmp_path, parsed):
+    _write(tmp_path, "a.txt", "Braavos burned.")
+    refine = Refiner({"nodes": []})
+
+    TieredGraphBuilder(str(tmp_path), refine=refine).build()
+    graph = TieredGraphBuilder(str(tmp_path), refine=refine).build()
+
+    assert len(refine.calls) == 1
+    assert "Braavos" in _nodes(graph)
+
+
+def test_failed_refinement_serves_the_local_graph_and_retries(tmp_path, parsed):
+    _write(tmp_path, "a.txt", "Braavos burned.")
+    failing = Refiner({"error": "quota"})
+
+    graph = TieredGraphBuilder(str(tmp_path), refine=failing).build()
+    TieredGraphBuilder(str(tmp_path), refine=failing).build()
+
+    assert "Braavos" in _nodes(graph)
+    assert len(failing.calls) == 2
+
+
+def test_refinement_is_capped_lowest_confidence_first(tmp_path, parsed):
+    _write(tmp_path, "a.txt", "Arya. Arya. Arya. Ned. Ned. Braavos. Winterfell.")
+    refine = Refiner()
+
+    TieredGraphBuilder(str(tmp_path), refine=refine, threshold=0.99, max_refine_items=2).build()
+
+    assert sorted(n["id"] for n in refine.calls[0]["nodes"]) == ["Braavos", "Winterfell"]
+
+
+def test_unchanged_files_are_not_parsed_again(tmp_path, parsed):
+    _write(tmp_path, "a.txt", "Arya left Winterfell.")
+    _write(tmp_path, "b.txt", "Ned stayed.")
+    TieredGraphBuilder(str(tmp_path)).build()
+    assert len(parsed) == 2
+
+    _write(tmp_path, "b.txt", "Ned stayed in Braavos.")
+    graph = TieredGraphBuilder(str(tmp_path)).build()
+
+    assert parsed[2:] == ["Ned stayed in Braavos."]
+    assert set(_nodes(graph)) == {"Arya", "Winterfell", "Ned", "Braavos"}
+    # The old version of b.txt is pruned from the cache
+    assert len(list((tmp_path / kg_builder.CACHE_DIR / kg_builder.DOCUMENTS_DIR).iterdir())) == 2
+
+
+def _located(text, source_doc):
+    # "Person@Place" per line
+    kg = FictionKnowledgeGraph()
+    for line in text.splitlines():
+        person, place = line.split("@")
+        kg.add_relationship({"type": "PERSON", "name": person}, "is in",
+                            {"type": "GPE", "name": place}, source_doc)
+    return kg
+
+
+def test_added_files_are_merged_and_checked_incrementally(tmp_path, monkeypatch):
+    merges = []
+    monkeypatch.setattr(kg_builder, "merge_knowledge_graphs",
+                        lambda graphs: merges.append(1) or merge_knowledge_graphs(graphs))
+
+    def build(*files):
+        builder = TieredGraphBuilder(str(tmp_path))
+        builder.documents.build = _located
+        builder.build(list(files))
+        return builder.contradictions
+
+    _write(tmp_path, "a.txt", "Arya@Winterfell\nNed@Winterfell")
+    assert build("a.txt") == []
+    _write(tmp_path, "b.txt", "Arya@Braavos")
+
+    found = build("a.txt", "b.txt")
+
+    # Only the first build merged from scratch
+    assert merges == [1]
+    assert [c["type"] for c in found] == ["Location"]
+    assert found[0]["confidence"] == kg_builder.PATTERN_CONFIDENCE
+    # Earlier results are kept while nothing new is added
+    assert build("a.txt", "b.txt") == found
+    assert merges == [1]
+
+    # Removing a file rebuilds, and its contradictions go with it
+    assert build("a.txt") == []
+    assert merges == [1, 1]
+
+
+def test_graph_view_counts_ner_mentions_apart_from_relationship_endpoints(parsed):
+    kg = kg_builder.document_graph("Ned is the father of Arya. Ned is the father of Jon.", "a.txt")
+
+    view = kg_builder.graph_view(kg)
+
+    nodes = _nodes(view)
+    # Ned twice and Arya once by NER; Jon only as an endpoint
+    assert nodes["Ned"]["confidence"] == 0.65
+    assert nodes["Arya"]["confidence"] == 0.5
+    assert nodes["Jon"]["confidence"] == 0.4
+    assert "Ned is the father" in nodes["Ned"]["description"]
+    confidences = {e["target"]: e["confidence"] for e in view["edges"]}
+    assert confidences == {"Arya": kg_builder.PATTERN_CONFIDENCE, "Jon": 0.5}
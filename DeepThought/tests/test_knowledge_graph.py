@@ -0,0 +1,270 @@
+import os
+from datetime import date, datetime
+
+import pytest
+
+from utils.knowledge_graph import (DocumentGraphCache, FictionKnowledgeGraph, contradictions_by_candidate,
+                                   detect_contradictions, merge_knowledge_graphs)
+
+ARYA = {"type": "PERSON", "name": "Arya"}
+
+
+def _events(kg, entity=ARYA):
+    return [e["event"] for e in kg.timeline[kg.entity_id(entity)]]
+
+
+def test_timeline_is_sorted_by_timestamp_with_ties_in_stated_order():
+    kg = FictionKnowledgeGraph()
+    kg.add_timeline_event(ARYA, "trains", 3)
+    kg.add_timeline_event(ARYA, "is born", 1)
+    kg.add_timeline_event(ARYA, "leaves", 3)
+    kg.add_timeline_event(ARYA, "meets Syrio", 2)
+
+    assert _events(kg) == ["is born", "meets Syrio", "trains", "leaves"]
+    assert [e["order"] for e in kg.timeline[kg.entity_id(ARYA)]] == [1, 3, 0, 2]
+
+
+def test_single_events_are_inserted_in_place_without_a_resort():
+    kg = FictionKnowledgeGraph()
+    for t in (3, 1, 3, 2):
+        kg.add_timeline_event(ARYA, f"day {t}", t)
+        # Nothing is left for the next read to sort
+        assert not kg._unsorted
+
+    arya = kg.entity_id(ARYA)
+    assert kg._timeline_keys[arya] == [(1, 1), (2, 3), (3, 0), (3, 2)]
+    assert [e["event"] for e in kg.events_between(ARYA, 2, 3)] == ["day 2", "day 3", "day 3"]
+
+
+def test_events_added_after_a_read_are_sorted_in():
+    kg = FictionKnowledgeGraph()
+    kg.add_timeline_events(ARYA, [("is born", 1), ("returns", 9)])
+    assert _events(kg) == ["is born", "returns"]
+
+    kg.add_timeline_events(ARYA, [{"event": "trains", "timestamp": 5, "source": "b.txt"}],
+                           source_doc="a.txt")
+    kg.add_timeline_event(ARYA, "leaves", 4)
+
+    assert _events(kg) == ["is born", "leaves", "trains", "returns"]
+    assert kg.timeline[kg.entity_id(ARYA)][2]["source"] == "b.txt"
+
+
+def test_events_between_is_inclusive_and_open_ended():
+    kg = FictionKnowledgeGraph()
+    kg.add_timeline_events(ARYA, [(f"day {t}", t) for t in (5, 1, 3, 3, 8)])
+
+    assert [e["event"] for e in kg.events_between(ARYA, 3, 5)] == ["day 3", "day 3", "day 5"]
+    assert [e["event"] for e in kg.events_between(ARYA, end=2)] == ["day 1"]
+    assert [e["event"] for e in kg.events_between(ARYA, start=6)] == ["day 8"]
+    assert len(kg.events_between(ARYA)) == 5
+    assert kg.events_between(ARYA, 6, 7) == []
+    assert kg.events_between({"type": "PERSON", "name": "Ned"}) == []
+
+
+def _located(kg, person, *places, source=None):
+    for place in places:
+        kg.add_relationship({"type": "PERSON", "name": person}, "is in",
+                            {"type": "GPE", "name": place}, source)
+
+
+def test_detects_each_kind_of_contradiction_in_order():
+    kg = FictionKnowledgeGraph()
+    kg.add_attribute(ARYA, "eyes", "grey", "a.txt")
+    kg.add_attribute(ARYA, "eyes", "blue", "b.txt")
+    kg.add_timeline_event(ARYA, "returns", 9, "a.txt")
+    kg.add_timeline_event(ARYA, "leaves", 4, "a.txt")
+    _located(kg, "Arya", "Winterfell", "Braavos")
+
+    found = detect_contradictions(kg)
+
+    assert [c["type"] for c in found] == ["Location", "Timeline", "Attribute"]
+    assert found[0]["conflicting_statements"] == ["Arya is in Winterfell", "Arya is in Braavos"]
+    assert found[1]["conflicting_statements"] == ["returns", "leaves"]
+    assert found[2]["conflicting_statements"] == ["Arya's eyes is blue", "Arya's eyes is grey"]
+
+
+def test_timelines_are_compared_in_stated_order_per_source():
+    kg = FictionKnowledgeGraph()
+    # Each source states its events in chronological order
+    kg.add_timeline_events(ARYA, [("is born", 1), ("returns", 9)], source_doc="a.txt")
+    kg.add_timeline_events(ARYA, [("leaves", 4), ("trains", 5)], source_doc="b.txt")
+
+    assert detect_contradictions(kg) == []
+
+
+def test_every_checked_fact_has_an_entry():
+    kg = FictionKnowledgeGraph()
+    kg.add_attribute(ARYA, "house", "Stark")
+    _located(kg, "Arya", "Winterfell")
+
+    found = contradictions_by_candidate(kg)
+
+    arya = kg.entity_id(ARYA)
+    assert found == {("Attribute", arya, "house"): [], ("Location", arya): []}
+
+
+def test_incremental_checks_only_facts_added_since_the_last_check():
+    kg = FictionKnowledgeGraph()
+    kg.add_attribute(ARYA, "eyes", "grey")
+    kg.add_attribute(ARYA, "eyes", "blue")
+    assert len(detect_contradictions(kg)) == 1
+    assert kg.candidates == set()
+
+    assert detect_contradictions(kg, incremental=True) == []
+    kg.add_attribute(ARYA, "house", "Stark")
+    _located(kg, "Ned", "Winterfell", "King's Landing")
+
+    found = contradictions_by_candidate(kg, incremental=True)
+
+    assert set(found) == {("Attribute", kg.entity_id(ARYA), "house"),
+                          ("Location", kg.entity_id({"type": "PERSON", "name": "Ned"}))}
+    assert [c["type"] for results in found.values() for c in results] == ["Location"]
+
+
+def test_merge_marks_the_merged_facts_as_candidates():
+    kg = FictionKnowledgeGraph()
+    _located(kg, "Arya", "Winterfell")
+    detect_contradictions(kg)
+
+    other = FictionKnowledgeGraph()
+    _located(other, "Arya", "Braavos")
+    kg.merge(other)
+
+    assert [c["type"] for c in detect_contradictions(kg, incremental=True)] == ["Location"]
+
+
+def test_entities_are_interned_to_sequential_ids():
+    kg = FictionKnowledgeGraph()
+    assert kg.add_entity(ARYA, "a.txt") == 0
+    assert kg.add_entity({"type": "GPE", "name": "Arya"}) == 1
+    assert kg.add_entity(ARYA, "b.txt") == 0
+
+    record = kg.entity_info[0]
+    assert record["name"] == "Arya" and record.first_appearance == "a.txt"
+    assert record.mentions == {"a.txt": 1, "b.txt": 1}
+    assert record.attributes == {}
+    assert len(kg.entity_info) == 2 and 1 in kg.entity_info and 2 not in kg.entity_info
+    assert kg.entity_info.get(2) is None
+    assert kg.entity_id({"type": "PERSON", "name": "Ned"}) is None
+
+
+def test_edges_and_successors_per_entity():
+    kg = FictionKnowledgeGraph()
+    _located(kg, "Arya", "Winterfell", "Braavos", "Winterfell", source="a.txt")
+    _located(kg, "Ned", "Winterfell")
+    arya, ned = kg.entity_id(ARYA), kg.entity_id({"type": "PERSON", "name": "Ned"})
+
+    assert [kg.entity_info[i].name for i in kg.successors(arya)] == ["Winterfell", "Braavos"]
+    assert kg.edge_count() == 4
+    assert len(list(kg.edges(arya))) == 3
+    assert list(kg.edges(ned)) == [(ned, kg.entity_id({"type": "GPE", "name": "Winterfell"}),
+                                    "is in", None, 1.0)]
+
+    # The edge index is rebuilt after new edges
+    _located(kg, "Ned", "King's Landing")
+    assert len(kg.successors(ned)) == 2
+    assert kg.successors(kg.entity_id({"type": "GPE", "name": "Braavos"})) == []
+
+
+def test_networkx_view_is_cached_until_the_graph_changes():
+    kg = FictionKnowledgeGraph()
+    _located(kg, "Arya", "Winterfell", source="a.txt")
+
+    graph = kg.graph
+    assert kg.graph is graph
+    assert graph.nodes[0] == {"type": "PERSON", "name": "Arya", "confidence": 1.0}
+    assert list(graph.edges(data="relation")) == [(0, 1, "is in")]
+
+    kg.add_entity({"type": "PERSON", "name": "Ned"})
+    assert kg.graph is not graph and kg.graph.number_of_nodes() == 3
+
+
+def _sample_graph():
+    kg = FictionKnowledgeGraph()
+    kg.add_entity(ARYA, "a.txt", confidence=0.5)
+    kg.entity_info[0].description = "The younger Stark daughter"
+    kg.add_attribute(ARYA, "eyes", "grey", "a.txt", confidence=0.8)
+    _located(kg, "Arya", "Braavos", source="a.txt")
+    kg.add_timeline_event(ARYA, "leaves", datetime(299, 5, 1, 12, 30), "a.txt")
+    kg.add_timeline_event(ARYA, "is born", datetime(289, 1, 1), "a.txt")
+    kg.add_timeline_events({"type": "PERSON", "name": "Ned"}, [("dies", date(298, 6, 1))])
+    kg.add_timeline_events({"type": "GPE", "name": "Braavos"}, [("founded", -700)])
+    return kg
+
+
+def test_serialized_graphs_round_trip(tmp_path):
+    kg = _sample_graph()
+    path = str(tmp_path / "graph.fkg")
+    kg.save(path)
+
+    loaded = FictionKnowledgeGraph.load(path)
+
+    assert os.listdir(tmp_path) == ["graph.fkg"]
+    assert loaded.to_bytes() == kg.to_bytes()
+    arya = loaded.entity_info[loaded.entity_id(ARYA)]
+    assert (arya.mentions, arya.confidence, arya.description) == (
+        kg.entity_info[0].mentions, 0.5, "The younger Stark daughter")
+    assert arya.attributes["eyes"][0]["value"] == "grey"
+    assert list(loaded.edges()) == list(kg.edges())
+    assert loaded.successors(0) == kg.successors(0)
+    assert loaded.timeline == kg.timeline
+    assert loaded.events_between(ARYA, end=datetime(290, 1, 1))[0]["event"] == "is born"
+    assert isinstance(loaded.events_between({"type": "PERSON", "name": "Ned"})[0]["timestamp"], date)
+
+
+def test_loading_other_data_fails():
+    with pytest.raises(ValueError):
+        FictionKnowledgeGraph.from_bytes(b"not a graph")
+
+
+def test_merge_combines_entities_edges_and_timelines():
+    kg = _sample_graph()
+    other = FictionKnowledgeGraph()
+    other.add_entity({"type": "PERSON", "name": "Jon"}, "b.txt")
+    other.add_entity(ARYA, "b.txt", confidence=0.5)
+    other.entity_info[1].description = "A faceless girl"
+    _located(other, "Jon", "Winterfell", source="b.txt")
+    other.add_timeline_events(ARYA, [("returns", datetime(300, 1, 1)), ("trains", datetime(299, 6, 1))])
+
+    merged = merge_knowledge_graphs([kg, other])
+
+    arya = merged.entity_info[merged.entity_id(ARYA)]
+    assert arya.confidence == 0.75
+    assert arya.mentions == {"a.txt": 5, "b.txt": 1}
+    assert arya.description == "The younger Stark daughter"
+    assert [(merged.entity_info[s].name, merged.entity_info[t].name) for s, t, *_ in merged.edges()] == [
+        ("Arya", "Braavos"), ("Jon", "Winterfell")]
+    timeline = merged.timeline[merged.entity_id(ARYA)]
+    assert [e["event"] for e in timeline] == ["is born", "leaves", "trains", "returns"]
+    # Stated order survives the merge, so each source's contradiction is still found
+    assert [c["conflicting_statements"] for c in detect_contradictions(merged)] == [
+        ["leaves", "is born"], ["returns", "trains"]]
+
+
+def test_document_graphs_are_built_once_per_content(tmp_path):
+    built = []
+
+    def build(text, source_doc):
+        built.append(source_doc)
+        kg = FictionKnowledgeGraph()
+        kg.add_entity({"type": "PERSON", "name": text}, source_doc)
+        return kg
+
+    cache = DocumentGraphCache(str(tmp_path / "documents"), build=build)
+    cache.get("Arya", "a.txt")
+    assert DocumentGraphCache(str(tmp_path / "documents"), build=build).get("Arya", "a.txt").entity_id(ARYA) == 0
+    assert built == ["a.txt"]
+    # The same text under another name is another document
+    cache.get("Arya", "b.txt")
+    assert built == ["a.txt", "b.txt"]
+
+    # A damaged file is rebuilt
+    with open(cache.path(cache.key("Arya", "a.txt")), "wb") as f:
+        f.write(b"FKG\x01garbage")
+    cache.get("Arya", "a.txt")
+    assert built == ["a.txt", "b.txt", "a.txt"]
+
+    universe = cache.universe_graph([("a.txt", "Arya"), ("c.txt", "Ned")])
+    assert len(universe.entity_info) == 2
+    cache.prune([("c.txt", "Ned")])
+    assert os.listdir(tmp_path / "documents") == [f"{cache.key('Ned', 'c.txt')}.fkg"]
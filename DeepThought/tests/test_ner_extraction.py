@@ -0,0 +1,161 @@
+import json
+import random
+import re
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from utils import ner_extraction
+from utils.ner_extraction import (DEFAULT_RELATION_PATTERNS, RelationExtractor, extract_relationships,
+                                   iter_text_chunks, stream_entities)
+
+
+def _triples(relationships):
+    return [(r["source"], r["relation"], r["target"]) for r in relationships]
+
+
+def _entities(text, *names):
+    return [{"start": text.index(name), "end": text.index(name) + len(name), "name": name} for name in names]
+
+
+def test_conjunctions_stay_out_of_names():
+    text = "Mary is the sister of John and Alice and Bob are allies"
+
+    assert _triples(extract_relationships(text)) == [("Mary", "sister", "John"), ("Alice", "allies", "Bob")]
+    assert _triples(extract_relationships(text, _entities(text, "Mary", "John", "Alice", "Bob"))) == [
+        ("Mary", "sister", "John"), ("Alice", "allies", "Bob")]
+
+
+def test_multi_word_names():
+    text = "Jon Snow and Arya Stark are allies. Later Jon Snow is the brother of Arya Stark."
+
+    assert _triples(extract_relationships(text)) == [
+        ("Jon Snow", "allies", "Arya Stark"), ("Jon Snow", "brother", "Arya Stark")]
+
+
+def test_endpoints_are_the_entities_next_to_the_keyword():
+    text = "At dawn the Night King is the father of Craster's sons."
+    entities = _entities(text, "the Night King", "Craster")
+
+    assert _triples(extract_relationships(text, entities)) == [("the Night King", "father", "Craster")]
+    # An already-parsed Doc brings its own entities
+    doc = SimpleNamespace(text=text, ents=[SimpleNamespace(start_char=e["start"], end_char=e["end"], text=e["name"])
+                                           for e in entities])
+    assert _triples(extract_relationships(doc)) == [("the Night King", "father", "Craster")]
+
+
+def test_keywords_match_in_any_case_and_names_lose_stop_words():
+    assert _triples(extract_relationships("Later Ned IS THE FATHER OF Arya.")) == [("Ned", "father", "Arya")]
+    assert _triples(extract_relationships("MARY IS THE SISTER OF JOHN")) == [("MARY", "sister", "JOHN")]
+    assert extract_relationships("he is the father of nobody") == []
+
+
+def test_overlapping_relationships_of_different_types_are_all_found():
+    text = "Mary is the sister of John and Bob are allies"
+
+    found = extract_relationships(text)
+
+    assert _triples(found) == [("Mary", "sister", "John"), ("John", "allies", "Bob")]
+    assert [r["type"] for r in found] == ["FAMILY", "RELATION"]
+    assert [r["start"] for r in found] == [0, text.index("John")]
+
+
+def test_patterns_without_a_leading_keyword(tmp_path):
+    path = tmp_path / "patterns.json"
+    path.write_text(json.dumps(DEFAULT_RELATION_PATTERNS + [
+        {"type": "EVENT", "pattern": r"(?P<relation>wedding) of {source} and {target}"}]))
+    extractor = RelationExtractor.from_json(str(path))
+
+    found = extractor.extract("At the Wedding of Robb Stark and Talisa, Ned is the father of Robb.")
+
+    assert _triples(found) == [("Robb Stark", "wedding", "Talisa"), ("Ned", "father", "Robb")]
+    with pytest.raises(ValueError):
+        extractor.register("BAD", "{source} knows {target}")
+
+
+def _best_time(extractor, text, runs=3):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        found = extractor.extract(text)
+        times.append(time.perf_counter() - start)
+    assert len(found) == 1
+    return min(times)
+
+
+def test_scan_cost_does_not_grow_with_relation_types():
+    rng = random.Random(0)
+    words = "the night was cold and Arya walked with Jon past the Wall while Sansa is in Winterfell".split()
+    text = " ".join(rng.choice(words) for _ in range(50000)) + ". Ned is the father of Arya."
+    keywords = ["serves", "fears", "trains", "guards", "rules", "loves", "hates", "follows", "teaches", "betrays"]
+    many = DEFAULT_RELATION_PATTERNS + [
+        {"type": f"T{i}", "pattern": f"{{source}} {keyword} (?P<relation>{keyword}) {{target}}"}
+        for i, keyword in enumerate(keywords * 4)]
+
+    few_time = _best_time(RelationExtractor(DEFAULT_RELATION_PATTERNS), text)
+    many_time = _best_time(RelationExtractor(many), text)
+
+    # 21 times the patterns; one pass per type would take about 20 times as long
+    assert many_time < 2 * few_time
+
+
+def test_chunks_end_at_the_best_boundary_and_cover_the_text():
+    paragraphs = "First part.\n\nSecond part is longer. It has two sentences.\nThen a line"
+    words = "word " * 30
+
+    for text, limit, first in [(paragraphs, 20, "First part.\n\n"),
+                               (paragraphs[13:], 35, "Second part is longer. "),
+                               (words, 12, "word word ")]:
+        chunks = list(iter_text_chunks(text, limit))
+        assert chunks[0][1] == first
+        assert all(len(chunk) <= limit for _, chunk in chunks)
+        assert "".join(chunk for _, chunk in chunks) == text
+        assert all(text[offset:offset + len(chunk)] == chunk for offset, chunk in chunks)
+    # No boundary in the second half: cut at the limit
+    assert [chunk for _, chunk in iter_text_chunks("x" * 25, 10)] == ["x" * 10, "x" * 10, "x" * 5]
+
+
+def test_chunks_of_streamed_pieces_have_offsets_into_their_concatenation():
+    text = " ".join(f"Sentence {i} is here." for i in range(200))
+    pieces = [text[i:i + 97] for i in range(0, len(text), 97)]
+
+    streamed = list(iter_text_chunks(iter(pieces), 250))
+
+    assert streamed == list(iter_text_chunks(text, 250))
+    assert all(text[offset:offset + len(chunk)] == chunk for offset, chunk in streamed)
+    assert list(iter_text_chunks("", 10)) == []
+
+
+class StubNLP:
+    """nlp.pipe over (text, context) tuples; entities are capitalized words, PERSON unless in PLACES"""
+    PLACES = {"Winterfell", "Braavos"}
+
+    def __init__(self):
+        self.calls = []
+
+    def pipe(self, items, as_tuples=False, batch_size=None, n_process=None):
+        assert as_tuples
+        self.calls.append((batch_size, n_process))
+        for chunk, offset in items:
+            ents = [SimpleNamespace(text=m.group(), start_char=m.start(), end_char=m.end(),
+                                    label_="GPE" if m.group() in self.PLACES else "PERSON")
+                    for m in re.finditer(r"\b[A-Z][a-z]+\b", chunk)]
+            ents.append(SimpleNamespace(text="x", start_char=0, end_char=1, label_="CARDINAL"))
+            yield SimpleNamespace(text=chunk, ents=ents), offset
+
+
+def test_streamed_entities_have_offsets_into_the_full_text(monkeypatch):
+    nlp = StubNLP()
+    monkeypatch.setattr(ner_extraction, "get_nlp", lambda: nlp)
+    text = "".join(f"on day {i} Arya left Winterfell for Braavos. " for i in range(40))
+
+    entities = list(stream_entities(text, chunk_chars=100, batch_size=4, n_process=2))
+
+    assert nlp.calls == [(4, 2)]
+    assert len(entities) == 120
+    assert all(text[e["start"]:e["end"]] == e["name"] for e in entities)
+    assert [e["start"] for e in entities] == [m.start() for m in re.finditer(r"[A-Z][a-z]+", text)]
+    assert {(e["name"], e["type"]) for e in entities} == {("Arya", "PERSON"), ("Winterfell", "GPE"),
+                                                          ("Braavos", "GPE")}
+    assert all(e["name"] in e["context"] and e["context"] in text for e in entities)
@@ -0,0 +1,88 @@
+# utils/analysis_store.py
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Analyses kept decoded in memory per worker
+CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "32"))
+
+class AnalysisStore:
+    """Universe analysis results in SQLite, with an in-process LRU in front.
+
+    The database is shared by every worker process, so results survive
+    restarts and any worker can serve them. Each worker's LRU is dropped as
+    soon as another connection has written to the database (detected with
+    PRAGMA data_version), so it never serves a stale analysis.
+    """
+
+    def __init__(self, db_path, max_entries=CACHE_SIZE):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS analysis ("
+            "universe_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self._data_version = self._current_data_version()
+
+    def _current_data_version(self):
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _sync(self):
+        # data_version only changes for commits made by other connections
+        data_version = self._current_data_version()
+        if data_version != self._data_version:
+            self._cache.clear()
+            self._data_version = data_version
+
+    def _remember(self, universe_id, data):
+        self._cache[universe_id] = data
+        self._cache.move_to_end(universe_id)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def get(self, universe_id):
+        """Analysis for a universe, or None if it hasn't been analyzed"""
+        with self._lock:
+            self._sync()
+            if universe_id in self._cache:
+                self._cache.move_to_end(universe_id)
+                return self._cache[universe_id]
+            row = self._conn.execute(
+                "SELECT data FROM analysis WHERE universe_id = ?", (universe_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            data = json.loads(row[0])
+            self._remember(universe_id, data)
+            return data
+
+    def put(self, universe_id, data):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO analysis (universe_id, data, updated_at) VALUES (?, ?, ?)",
+                (universe_id, json.dumps(data), time.time())
+            )
+            self._conn.commit()
+            self._sync()
+            self._remember(universe_id, data)
+
+    def delete(self, universe_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM analysis WHERE universe_id = ?", (universe_id,))
+            self._conn.commit()
+            self._sync()
+            self._cache.pop(universe_id, None)
+
+    def universe_ids(self):
+        """Ids of the universes with a stored analysis, sorted"""
+        with self._lock:
+            rows = self._conn.execute("SELECT universe_id FROM analysis ORDER BY universe_id").fetchall()
+            return [row[0] for row in rows]
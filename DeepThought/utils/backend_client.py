@@ -0,0 +1,97 @@
+# utils/backend_client.py
+import asyncio
+import json
+import os
+import threading
+from concurrent.futures import Future
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.metrics import timed
+
+BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
+# Keep-alive connections held open to the backend
+POOL_SIZE = int(os.getenv("BACKEND_POOL_SIZE", "16"))
+# Distinct requests allowed in flight per universe; more fail fast with BackendBusy
+MAX_PER_UNIVERSE = int(os.getenv("BACKEND_MAX_PER_UNIVERSE", "4"))
+
+CONNECT_TIMEOUT = 5
+# Read timeouts per endpoint, sized for the LLM work each one does
+READ_TIMEOUTS = {
+    "file_uploaded": 600,
+    "files_uploaded": 3600,
+    "analyze": 600,
+    "chat_bot": 120,
+    "file_deleted": 60,
+    "folder_deleted": 30,
+    "refine_graph": 120,
+}
+DEFAULT_READ_TIMEOUT = 60
+
+class BackendBusy(Exception):
+    """Raised when a universe already has too many backend requests in flight"""
+
+class BackendClient:
+    """Pooled client for the backend API.
+
+    One keep-alive Session is shared by all Flask threads. Identical
+    concurrent requests (same endpoint and payload) are coalesced into a
+    single backend call, and each universe is limited to MAX_PER_UNIVERSE
+    distinct calls at once, so a slow LLM call can't tie up every worker.
+    """
+
+    def __init__(self, base_url=BACKEND_URL, pool_size=POOL_SIZE,
+                 max_per_universe=MAX_PER_UNIVERSE):
+        self.base_url = base_url.rstrip('/')
+        self.max_per_universe = max_per_universe
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._in_flight = {}
+        self._per_universe = {}
+        self._lock = threading.Lock()
+
+    def _call(self, endpoint, json_body, files):
+        timeout = (CONNECT_TIMEOUT, READ_TIMEOUTS.get(endpoint, DEFAULT_READ_TIMEOUT))
+        with timed("backend", endpoint):
+            return self.session.post(f"{self.base_url}/{endpoint}",
+                                     json=json_body, files=files, timeout=timeout)
+
+    def post(self, endpoint, universe, json=None, files=None):
+        """POST to a backend endpoint on behalf of a universe; returns the Response"""
+        key = (endpoint, universe, _payload_key(json, files))
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                if self._per_universe.get(universe, 0) >= self.max_per_universe:
+                    raise BackendBusy(f"Too many requests in progress for {universe}")
+                future = Future()
+                self._in_flight[key] = future
+                self._per_universe[universe] = self._per_universe.get(universe, 0) + 1
+        if not leader:
+            return future.result()
+
+        try:
+            future.set_result(self._call(endpoint, json, files))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+                self._per_universe[universe] -= 1
+                if not self._per_universe[universe]:
+                    del self._per_universe[universe]
+        return future.result()
+
+    async def post_async(self, endpoint, universe, json=None, files=None):
+        """Async variant of post() for async views; shares the pool and coalescing"""
+        return await asyncio.to_thread(self.post, endpoint, universe, json=json, files=files)
+
+def _payload_key(json_body, files):
+    return json.dumps([json_body, files], sort_keys=True, default=str)
+
+# Shared by every route in the process
+backend = BackendClient()
@@ -1,62 +1,291 @@
 # utils/document_manager.py
 import os
 import uuid
+import json
+import mmap
+import codecs
+import hashlib
+import sqlite3
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 
+CATALOG_FILE = "catalog.sqlite3"
+# Bytes per read when hashing, streaming or copying documents
+READ_CHUNK = 1 << 20
+# Ranks are floats so a document can be moved between two others by updating
+# only its own rank; when neighbours get this close the order is renumbered
+MIN_RANK_GAP = 1e-9
+
 class DocumentManager:
+    """Documents and their precedence order, persisted in a SQLite catalog.
+
+    Each document has a rank; the hierarchy is the documents ordered by rank,
+    so moving one document is a single-row update. The catalog records a
+    SHA-256 hash and size per document, unique together, so uploading the
+    same content twice returns the existing document. Records are always
+    read from the catalog, so several workers can share one storage_dir.
+    """
+
     def __init__(self, storage_dir="uploads"):
         self.storage_dir = storage_dir
-        self.documents = {}
-        self.hierarchy = []  # List of document IDs in order of precedence
         os.makedirs(storage_dir, exist_ok=True)
-    
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(storage_dir, CATALOG_FILE),
+                                     check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "id TEXT PRIMARY KEY, filename TEXT NOT NULL, filepath TEXT NOT NULL, "
+            "added_date TEXT NOT NULL, canonical INTEGER NOT NULL, metadata TEXT NOT NULL, "
+            "content_hash TEXT NOT NULL, size INTEGER NOT NULL, rank REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS documents_rank ON documents (rank)")
+        self._conn.execute("DROP INDEX IF EXISTS documents_hash")
+        self._conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS documents_content ON documents (content_hash, size)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _record(doc_id, filename, filepath, added_date, canonical, metadata, content_hash, size):
+        return {
+            "id": doc_id,
+            "filename": filename,
+            "filepath": filepath,
+            "added_date": datetime.fromisoformat(added_date),
+            "canonical": bool(canonical),
+            "metadata": json.loads(metadata),
+            "content_hash": content_hash,
+            "size": size
+        }
+
+    _COLUMNS = "id, filename, filepath, added_date, canonical, metadata, content_hash, size"
+
+    def get_document(self, doc_id):
+        """A document's record, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {self._COLUMNS} FROM documents WHERE id = ?", (doc_id,)
+            ).fetchone()
+        return self._record(*row) if row else None
+
+    @property
+    def documents(self):
+        """Document ID -> record, for every document in the catalog"""
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {self._COLUMNS} FROM documents").fetchall()
+        return {row[0]: self._record(*row) for row in rows}
+
+    def _exists(self, doc_id):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM documents WHERE id = ?", (doc_id,)).fetchone() is not None
+
+    @property
+    def hierarchy(self):
+        """Document IDs in order of precedence"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT id FROM documents ORDER BY rank")]
+
+    def _edge_rank(self, first):
+        query = "SELECT MIN(rank) FROM documents" if first else "SELECT MAX(rank) FROM documents"
+        rank = self._conn.execute(query).fetchone()[0]
+        if rank is None:
+            return 0.0
+        return rank - 1 if first else rank + 1
+
+    def _find_duplicate(self, content_hash, size):
+        row = self._conn.execute(
+            "SELECT id FROM documents WHERE content_hash = ? AND size = ?", (content_hash, size)
+        ).fetchone()
+        return row[0] if row else None
+
+    def find_duplicate(self, content_hash, size):
+        """ID of a document with this content, or None"""
+        with self._lock:
+            return self._find_duplicate(content_hash, size)
+
     def add_document(self, file, metadata=None, canonical=False):
-        """Add a document to the manager"""
+        """Add a document to the manager; returns its ID (an existing one for duplicate content)"""
         if not metadata:
             metadata = {}
-            
+
         doc_id = str(uuid.uuid4())
         filename = os.path.basename(file.filename)
         filepath = os.path.join(self.storage_dir, f"{doc_id}_{filename}")
-        
+
         # Save the file
         file.save(filepath)
-        
-        # Add to documents dictionary
-        self.documents[doc_id] = {
-            "id": doc_id,
-            "filename": filename,
-            "filepath": filepath,
-            "added_date": datetime.now(),
-            "canonical": canonical,
-            "metadata": metadata
-        }
-        
-        # Add to hierarchy (canonical documents go first)
-        if canonical:
-            self.hierarchy.insert(0, doc_id)
-        else:
-            self.hierarchy.append(doc_id)
-            
+        content_hash, size = file_digest(filepath)
+
+        with self._lock:
+            # The duplicate check, rank and insert are one write transaction, so
+            # concurrent uploads (from any worker) can't both add the same content
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                duplicate = self._find_duplicate(content_hash, size)
+                if duplicate is None:
+                    # Canonical documents go first
+                    self._conn.execute(
+                        "INSERT INTO documents (id, filename, filepath, added_date, canonical, metadata, "
+                        "content_hash, size, rank) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (doc_id, filename, filepath, datetime.now().isoformat(), int(canonical),
+                         json.dumps(metadata), content_hash, size, self._edge_rank(first=canonical))
+                    )
+                self._conn.commit()
+            except sqlite3.IntegrityError:
+                # Added by a connection that doesn't take the write lock first
+                self._conn.rollback()
+                duplicate = self._find_duplicate(content_hash, size)
+            except BaseException:
+                self._conn.rollback()
+                os.remove(filepath)
+                raise
+
+        if duplicate is not None:
+            os.remove(filepath)
+            return duplicate
         return doc_id
-    
+
+    def remove_document(self, doc_id):
+        """Remove a document from the catalog and delete its file"""
+        with self._lock:
+            row = self._conn.execute("SELECT filepath FROM documents WHERE id = ?", (doc_id,)).fetchone()
+            if row is None:
+                return False
+            self._conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+            self._conn.commit()
+        filepath = row[0]
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        return True
+
     def get_document_content(self, doc_id):
         """Get the content of a document"""
-        if doc_id not in self.documents:
+        record = self.get_document(doc_id)
+        if record is None:
             return None
-            
-        with open(self.documents[doc_id]["filepath"], "r", encoding="utf-8") as f:
+
+        with open(record["filepath"], "r", encoding="utf-8") as f:
             return f.read()
-    
+
+    def iter_document_content(self, doc_id, chunk_size=READ_CHUNK):
+        """Yield a document's text in pieces of about chunk_size bytes, never holding it whole"""
+        record = self.get_document(doc_id)
+        if record is None:
+            return
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        with open(record["filepath"], "rb") as f:
+            while True:
+                block = f.read(chunk_size)
+                if not block:
+                    break
+                text = decoder.decode(block)
+                if text:
+                    yield text
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+
+    def read_range(self, doc_id, start, end=None):
+        """Bytes [start, end) of a document (to the end if end is None)"""
+        record = self.get_document(doc_id)
+        if record is None:
+            return None
+        with open(record["filepath"], "rb") as f:
+            f.seek(start)
+            return f.read(-1 if end is None else max(0, end - start))
+
+    @contextmanager
+    def map_document(self, doc_id):
+        """A read-only mmap of a document, e.g. for regex scans over large texts.
+
+        Pages are loaded by the OS as they are touched. Empty files map to b"".
+        """
+        record = self.get_document(doc_id)
+        if record is None:
+            raise KeyError(doc_id)
+        with open(record["filepath"], "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                yield b""
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield mapped
+
     def get_all_documents(self):
         """Get all documents in hierarchy order"""
-        return [self.documents[doc_id] for doc_id in self.hierarchy]
-    
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {self._COLUMNS} FROM documents ORDER BY rank").fetchall()
+        return [self._record(*row) for row in rows]
+
+    def move_document(self, doc_id, before=None, after=None):
+        """Move a document directly before or after another one (to the front if neither is given).
+
+        Only the moved document's rank changes, unless repeated moves have
+        left no room between its new neighbours.
+        """
+        if not self._exists(doc_id):
+            raise ValueError(f"Document ID {doc_id} not found")
+        anchor = before or after
+        if anchor is not None and (anchor == doc_id or not self._exists(anchor)):
+            raise ValueError(f"Document ID {anchor} not found")
+        with self._lock:
+            rank = self._new_rank(doc_id, anchor, after is not None)
+            if rank is None:
+                self._renumber()
+                rank = self._new_rank(doc_id, anchor, after is not None)
+            self._conn.execute("UPDATE documents SET rank = ? WHERE id = ?", (rank, doc_id))
+            self._conn.commit()
+
+    def _new_rank(self, doc_id, anchor, after):
+        # A rank between the anchor and its neighbour on that side; None if they're too close
+        if anchor is None:
+            return self._edge_rank(first=True)
+        anchor_rank = self._conn.execute("SELECT rank FROM documents WHERE id = ?", (anchor,)).fetchone()[0]
+        if after:
+            neighbour = self._conn.execute(
+                "SELECT MIN(rank) FROM documents WHERE rank > ? AND id != ?", (anchor_rank, doc_id)
+            ).fetchone()[0]
+            step = 1
+        else:
+            neighbour = self._conn.execute(
+                "SELECT MAX(rank) FROM documents WHERE rank < ? AND id != ?", (anchor_rank, doc_id)
+            ).fetchone()[0]
+            step = -1
+        if neighbour is None:
+            return anchor_rank + step
+        if abs(neighbour - anchor_rank) < MIN_RANK_GAP:
+            return None
+        return (neighbour + anchor_rank) / 2
+
+    def _renumber(self):
+        ids = [row[0] for row in self._conn.execute("SELECT id FROM documents ORDER BY rank")]
+        self._conn.executemany("UPDATE documents SET rank = ? WHERE id = ?",
+                               [(float(i), doc_id) for i, doc_id in enumerate(ids)])
+        self._conn.commit()
+
     def set_hierarchy(self, new_hierarchy):
         """Update the document hierarchy"""
         # Verify all IDs exist
         for doc_id in new_hierarchy:
-            if doc_id not in self.documents:
+            if not self._exists(doc_id):
                 raise ValueError(f"Document ID {doc_id} not found")
-                
-        self.hierarchy = new_hierarchy
\ No newline at end of file
+
+        # Every document keeps a rank, so any left out follow the listed ones
+        # in their current order
+        listed = set(new_hierarchy)
+        order = list(new_hierarchy) + [d for d in self.hierarchy if d not in listed]
+        with self._lock:
+            self._conn.executemany("UPDATE documents SET rank = ? WHERE id = ?",
+                                   [(float(i), doc_id) for i, doc_id in enumerate(order)])
+            self._conn.commit()
+
+def file_digest(filepath):
+    """(SHA-256 hex digest, size in bytes) of a file, read in chunks"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(READ_CHUNK), b""):
+            digest.update(block)
+            size += len(block)
+    return digest.hexdigest(), size
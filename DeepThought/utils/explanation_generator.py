@@ -1,19 +1,57 @@
 # utils/explanation_generator.py
 import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
 from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_core.messages import AIMessage
 from langchain_core.prompts import PromptTemplate
 from langchain_core.runnables import Runnable
 
+# Optional replacement for the Gemini client factory (e.g. a local stand-in)
+_llm_factory = None
+# One client shared by every call, created on first use
+_llm = None
+_llm_lock = threading.Lock()
+
+# Concurrent LLM calls per generate_explanations() batch
+EXPLANATION_CONCURRENCY = int(os.getenv("EXPLANATION_CONCURRENCY", "4"))
+# Contradictions packed into one prompt: at most this many, and this many
+# characters of contradiction text, so prompt and answers fit the context window
+MAX_PACKED = 8
+PACK_CHARS = 6000
+# Explanations cached in memory, keyed by contradiction text and world context
+CACHE_SIZE = int(os.getenv("EXPLANATION_CACHE_SIZE", "256"))
+# Stands in for an explanation whose LLM call failed; not cached, so it's retried
+FALLBACK_EXPLANATION = "No explanation could be generated for this contradiction right now. Please try again later."
+
+_explanations = OrderedDict()
+_cache_lock = threading.Lock()
+
+def set_llm_factory(factory):
+    """Use `factory()` instead of Gemini for every generated explanation; None restores Gemini"""
+    global _llm_factory, _llm
+    with _llm_lock:
+        _llm_factory = factory
+        _llm = None
+
 def get_llm():
-    return ChatGoogleGenerativeAI(
-        model="gemini-2.0-flash",
-        google_api_key=os.getenv("GEMINI_API_KEY"),
-        temperature=0.7,
-    )
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                if _llm_factory is not None:
+                    _llm = _llm_factory()
+                else:
+                    _llm = ChatGoogleGenerativeAI(
+                        model="gemini-2.0-flash",
+                        google_api_key=os.getenv("GEMINI_API_KEY"),
+                        temperature=0.7,
+                    )
+    return _llm
 
-def generate_explanation(contradiction, world_context=""):
-    """Generate an in-universe explanation for a detected contradiction"""
-    prompt = PromptTemplate.from_template("""
+EXPLANATION_PROMPT = PromptTemplate.from_template("""
 You are a lore master and narrative continuity expert for fictional universes. 
 Given this contradiction in a fictional narrative:
 
@@ -34,12 +72,130 @@ Please provide:
 
 If it's genuinely impossible to reconcile within reasonable narrative conventions, explain why.
 """)
-    chain: Runnable = prompt | get_llm()
-    
-    return chain.invoke({
-        "contradiction": contradiction["description"],
-        "world_context": world_context
-    })
+
+PACKED_EXPLANATION_PROMPT = PromptTemplate.from_template("""
+You are a lore master and narrative continuity expert for fictional universes. 
+Given these numbered contradictions in a fictional narrative:
+
+{contradictions}
+
+{world_context}
+
+For *each* contradiction, provide:
+1. An immersive, in-universe explanation that could reconcile it using common narrative tropes (time travel or temporal anomalies, alternate timelines/universes, clones, twins or doppelgangers, hidden identities or disguises, magical/technological phenomena, unreliable narrators or misunderstandings).
+2. A "behind the scenes" analysis of how significant it is and potential ways the author could address it with minimal disruption to established canon.
+If one is genuinely impossible to reconcile within reasonable narrative conventions, explain why.
+
+Format the output strictly as a JSON list with one object per contradiction: {{"index": <its number>, "explanation": "<both parts, as markdown>"}}.
+
+JSON Explanations:
+""")
+
+def _cache_key(description, world_context):
+    return hashlib.sha256(f"{description}\0{world_context}".encode('utf-8')).hexdigest()
+
+def _cached(key):
+    with _cache_lock:
+        if key in _explanations:
+            _explanations.move_to_end(key)
+            return _explanations[key]
+    return None
+
+def _remember(key, explanation):
+    with _cache_lock:
+        _explanations[key] = explanation
+        _explanations.move_to_end(key)
+        while len(_explanations) > CACHE_SIZE:
+            _explanations.popitem(last=False)
+
+def generate_explanation(contradiction, world_context=""):
+    """Generate an in-universe explanation for a detected contradiction"""
+    key = _cache_key(contradiction["description"], world_context)
+    explanation = _cached(key)
+    if explanation is None:
+        chain: Runnable = EXPLANATION_PROMPT | get_llm()
+        explanation = chain.invoke({
+            "contradiction": contradiction["description"],
+            "world_context": world_context
+        })
+        _remember(key, explanation)
+    return explanation
+
+def _pack(descriptions):
+    # Greedy packing in order; anything longer than PACK_CHARS goes alone
+    groups, group, size = [], [], 0
+    for description in descriptions:
+        if group and (len(group) >= MAX_PACKED or size + len(description) > PACK_CHARS):
+            groups.append(group)
+            group, size = [], 0
+        group.append(description)
+        size += len(description)
+    if group:
+        groups.append(group)
+    return groups
+
+def _parse_packed(response, count):
+    text = getattr(response, "content", response)
+    text = text.strip().removeprefix("```json").removeprefix("```").removesuffix("```")
+    try:
+        items = json.loads(text)
+    except ValueError:
+        return {}
+    answers = {}
+    for item in items if isinstance(items, list) else []:
+        if isinstance(item, dict) and isinstance(item.get("index"), int) and item.get("explanation"):
+            if 1 <= item["index"] <= count:
+                answers[item["index"] - 1] = AIMessage(content=item["explanation"])
+    return answers
+
+def generate_explanations(contradictions, world_context="", max_concurrency=EXPLANATION_CONCURRENCY):
+    """Explanations for many contradictions, in the same order.
+
+    Cached explanations are reused and duplicates explained once. The rest
+    are packed several to a prompt and sent concurrently (at most
+    max_concurrency calls at a time) over the shared client; any the packed
+    answer leaves out are explained one by one. A failed call only affects
+    its own contradictions, which get FALLBACK_EXPLANATION.
+    """
+    descriptions = [c["description"] for c in contradictions]
+    found, pending = {}, []
+    for description in dict.fromkeys(descriptions):
+        explanation = _cached(_cache_key(description, world_context))
+        if explanation is None:
+            pending.append(description)
+        else:
+            found[description] = explanation
+
+    config = {"max_concurrency": max_concurrency}
+    groups = _pack(pending)
+    packed = [g for g in groups if len(g) > 1]
+    single = [g[0] for g in groups if len(g) == 1]
+    if packed:
+        chain: Runnable = PACKED_EXPLANATION_PROMPT | get_llm()
+        responses = chain.batch([{
+            "contradictions": "\n\n".join(f"{i}. {d}" for i, d in enumerate(group, 1)),
+            "world_context": world_context
+        } for group in packed], config=config, return_exceptions=True)
+        for group, response in zip(packed, responses):
+            answers = {} if isinstance(response, Exception) else _parse_packed(response, len(group))
+            for index, description in enumerate(group):
+                if index in answers:
+                    found[description] = answers[index]
+                    _remember(_cache_key(description, world_context), answers[index])
+                else:
+                    single.append(description)
+    if single:
+        chain: Runnable = EXPLANATION_PROMPT | get_llm()
+        responses = chain.batch([{"contradiction": d, "world_context": world_context} for d in single],
+                                config=config, return_exceptions=True)
+        for description, response in zip(single, responses):
+            if isinstance(response, Exception):
+                print(f"Explanation failed: {response}")
+                found[description] = AIMessage(content=FALLBACK_EXPLANATION)
+            else:
+                found[description] = response
+                _remember(_cache_key(description, world_context), response)
+    return [found[description] for description in descriptions]
 
 def generate_speculative_boundaries(knowledge_graph):
     """Generate an analysis of what's firmly established vs. what's open to interpretation"""
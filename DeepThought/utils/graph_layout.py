@@ -0,0 +1,171 @@
+# utils/graph_layout.py
+import json
+import math
+import os
+import random
+import threading
+
+from utils.graph_render import graph_hash
+
+LAYOUT_FILE = "graph_layout.json"
+# Iterations for a layout from scratch, and for placing new nodes among fixed ones
+FULL_ITERATIONS = 50
+INCREMENTAL_ITERATIONS = 15
+# Above this share of new nodes the whole graph is relaid out (seeded, not fixed)
+RELAYOUT_FRACTION = 0.5
+# Force-directed layout is O(n^2) per iteration; larger graphs start from a
+# spectral layout, get a few refinement iterations, and new nodes are only
+# placed next to their neighbours
+LARGE_GRAPH_NODES = 500
+LARGE_GRAPH_ITERATIONS = 5
+
+def _build_graph(knowledge_graph):
+    import networkx as nx
+
+    G = nx.Graph()
+    for node in knowledge_graph.get('nodes', []):
+        G.add_node(node['id'])
+    for edge in knowledge_graph.get('edges', []):
+        if edge['source'] in G and edge['target'] in G:
+            G.add_edge(edge['source'], edge['target'])
+    return G
+
+def layout_extent(node_count):
+    """Pixels per layout unit, so node spacing stays readable as graphs grow"""
+    return max(200, round(80 * math.sqrt(max(node_count, 1))))
+
+def compute_layout(knowledge_graph, previous=None, seed=42):
+    """Node positions (id -> [x, y], roughly within [-1, 1]) for a knowledge graph.
+
+    Nodes that already have a position in `previous` keep it; new nodes start
+    next to their placed neighbours and only they are moved. If most of the
+    graph is new, everything is relaid out, seeded from the old positions.
+
+    Returns (positions, relaid_out).
+    """
+    import networkx as nx
+
+    G = _build_graph(knowledge_graph)
+    if G.number_of_nodes() == 0:
+        return {}, True
+    previous = {n: p for n, p in (previous or {}).items() if n in G}
+    new_nodes = [n for n in G if n not in previous]
+    if previous and not new_nodes:
+        return previous, False
+
+    k = 0.4 if G.number_of_nodes() < 100 else None
+    large = G.number_of_nodes() > LARGE_GRAPH_NODES
+    if not previous:
+        if large:
+            pos = nx.spring_layout(G, pos=nx.spectral_layout(G),
+                                   iterations=LARGE_GRAPH_ITERATIONS, seed=seed)
+        else:
+            pos = nx.spring_layout(G, k=k, iterations=FULL_ITERATIONS, seed=seed)
+        return {n: [float(x), float(y)] for n, (x, y) in pos.items()}, True
+
+    rng = random.Random(seed)
+    initial = dict(previous)
+    for node in new_nodes:
+        placed = [initial[m] for m in G.neighbors(node) if m in initial]
+        if placed:
+            cx = sum(p[0] for p in placed) / len(placed)
+            cy = sum(p[1] for p in placed) / len(placed)
+        else:
+            cx, cy = rng.uniform(-1, 1), rng.uniform(-1, 1)
+        initial[node] = [cx + rng.uniform(-0.05, 0.05), cy + rng.uniform(-0.05, 0.05)]
+
+    relaid_out = len(new_nodes) > RELAYOUT_FRACTION * G.number_of_nodes()
+    if relaid_out:
+        iterations = LARGE_GRAPH_ITERATIONS if large else FULL_ITERATIONS
+        pos = nx.spring_layout(G, k=k, pos=initial, iterations=iterations, seed=seed)
+    elif large:
+        pos = initial
+    else:
+        pos = nx.spring_layout(G, k=k, pos=initial, fixed=list(previous),
+                               iterations=INCREMENTAL_ITERATIONS, seed=seed)
+    return {n: [float(x), float(y)] for n, (x, y) in pos.items()}, relaid_out
+
+def compact_layout(knowledge_graph, positions, version, extent):
+    """Compact JSON payload for client-side drawing.
+
+    Types and relationship names are listed once and referenced by index;
+    coordinates are rounded pixels (`extent` pixels per layout unit).
+    """
+    types, type_index = [], {}
+    relationships, relationship_index = [], {}
+
+    def intern(value, values, index):
+        if value not in index:
+            index[value] = len(values)
+            values.append(value)
+        return index[value]
+
+    nodes, node_index = [], {}
+    for node in knowledge_graph.get('nodes', []):
+        if node['id'] not in positions or node['id'] in node_index:
+            continue
+        x, y = positions[node['id']]
+        node_index[node['id']] = len(nodes)
+        nodes.append([node['id'], intern(node.get('type', 'Other'), types, type_index),
+                      round(x * extent), round(y * extent)])
+
+    edges = []
+    for edge in knowledge_graph.get('edges', []):
+        if edge['source'] in node_index and edge['target'] in node_index:
+            edges.append([node_index[edge['source']], node_index[edge['target']],
+                          intern(edge.get('relationship', ''), relationships, relationship_index)])
+
+    return {
+        "version": version,
+        "types": types,
+        "relationships": relationships,
+        "nodes": nodes,
+        "edges": edges
+    }
+
+class GraphLayoutStore:
+    """Per-universe graph layouts, persisted next to the universe's files.
+
+    Each universe keeps the positions of its last layout, so when analysis
+    adds nodes the layout is updated rather than recomputed and the existing
+    nodes stay where the reader last saw them.
+    """
+
+    def __init__(self, universes_dir):
+        self.universes_dir = universes_dir
+        self._layouts = {}
+        self._lock = threading.Lock()
+
+    def _path(self, universe_name):
+        return os.path.join(self.universes_dir, universe_name, LAYOUT_FILE)
+
+    def _load(self, universe_name):
+        if universe_name not in self._layouts:
+            try:
+                with open(self._path(universe_name), 'r') as f:
+                    self._layouts[universe_name] = json.load(f)
+            except (OSError, ValueError):
+                self._layouts[universe_name] = {"version": None, "positions": {}, "extent": None}
+        return self._layouts[universe_name]
+
+    def get(self, universe_name, knowledge_graph):
+        """Compact layout for the universe's current knowledge graph"""
+        version = graph_hash(knowledge_graph)
+        with self._lock:
+            stored = self._load(universe_name)
+            if stored["version"] != version:
+                positions, relaid_out = compute_layout(knowledge_graph, stored["positions"])
+                # Keep the scale of an incrementally updated layout so nodes don't shift
+                extent = stored.get("extent")
+                if relaid_out or not extent:
+                    extent = layout_extent(len(positions))
+                stored = {"version": version, "positions": positions, "extent": extent}
+                self._layouts[universe_name] = stored
+                if os.path.isdir(os.path.join(self.universes_dir, universe_name)):
+                    with open(self._path(universe_name), 'w') as f:
+                        json.dump(stored, f)
+        return compact_layout(knowledge_graph, stored["positions"], version, stored["extent"])
+
+    def forget(self, universe_name):
+        with self._lock:
+            self._layouts.pop(universe_name, None)
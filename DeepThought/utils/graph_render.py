@@ -0,0 +1,157 @@
+# utils/graph_render.py
+import base64
+import hashlib
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+# Worker processes for matplotlib rendering; each owns its own matplotlib state
+RENDER_WORKERS = int(os.getenv("GRAPH_RENDER_WORKERS", "2"))
+# Rendered images kept in memory (one per knowledge graph version)
+CACHE_SIZE = int(os.getenv("GRAPH_CACHE_SIZE", "64"))
+
+NODE_COLORS = {
+    'Character': '#4a6cf7',  # Primary color
+    'Location': '#00d4d7',   # Accent color
+    'Object': '#ff6b6b',     # Danger color
+    'Other': '#6c757d'       # Secondary color
+}
+
+def graph_hash(knowledge_graph):
+    """Stable hash of a knowledge graph, used as the image cache key"""
+    payload = json.dumps(knowledge_graph, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def render_graph_image(knowledge_graph):
+    """Render a NetworkX visualization of the knowledge graph as a PNG data URL.
+
+    Runs inside a worker process; uses an explicit Figure rather than pyplot's
+    global state.
+    """
+    if not knowledge_graph or 'nodes' not in knowledge_graph or 'edges' not in knowledge_graph:
+        return None
+
+    import matplotlib
+    matplotlib.use('Agg')  # Use non-interactive backend
+    import matplotlib.patches as mpatches
+    import networkx as nx
+    from matplotlib.figure import Figure
+
+    # Create a NetworkX graph
+    G = nx.Graph()
+    node_labels = {}
+    node_color_map = []
+
+    # Add nodes to graph
+    for node in knowledge_graph['nodes']:
+        G.add_node(node['id'])
+        node_labels[node['id']] = node['id']
+        node_type = node.get('type', 'Other')
+        node_color_map.append(NODE_COLORS.get(node_type, NODE_COLORS['Other']))
+
+    # Add edges to graph
+    for edge in knowledge_graph['edges']:
+        if edge['source'] in node_labels and edge['target'] in node_labels:
+            G.add_edge(edge['source'], edge['target'],
+                       label=edge.get('relationship', ''))
+
+    fig = Figure(figsize=(12, 10))
+    ax = fig.add_subplot()
+
+    # Position nodes using spring layout
+    pos = nx.spring_layout(G, k=0.4, iterations=50)
+
+    nx.draw_networkx_nodes(G, pos, ax=ax,
+                           node_size=900,
+                           node_color=node_color_map,
+                           alpha=0.9,
+                           edgecolors='white',
+                           linewidths=2.0)
+    nx.draw_networkx_edges(G, pos, ax=ax, width=1.5, alpha=0.7, edge_color='#d0d0d0')
+    nx.draw_networkx_labels(G, pos, ax=ax, font_size=10, font_family='sans-serif',
+                            font_weight='bold', font_color='white')
+
+    # Draw edge labels (relationships)
+    edge_labels = nx.get_edge_attributes(G, 'label')
+    nx.draw_networkx_edge_labels(G, pos, ax=ax, edge_labels=edge_labels,
+                                 font_size=8, font_color='#333333',
+                                 bbox=dict(facecolor='white', edgecolor='none',
+                                           alpha=0.7, boxstyle='round,pad=0.2'))
+
+    legend_elements = [
+        mpatches.Patch(color=color, label=label) for label, color in NODE_COLORS.items()
+    ]
+    ax.legend(handles=legend_elements, loc='upper right', fontsize=10)
+    ax.axis('off')
+    ax.set_title('Knowledge Graph Visualization', fontsize=16, pad=20)
+
+    # Save figure to BytesIO and convert to base64 for embedding in HTML
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', bbox_inches='tight',
+                dpi=100, facecolor='#fcfcff')
+    image_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+    return f"data:image/png;base64,{image_base64}"
+
+class GraphImageCache:
+    """Rendered graph images keyed by knowledge graph hash.
+
+    Renders happen in a process pool, so Flask threads only wait on a future
+    and concurrent renders don't serialize on matplotlib. Each graph version is
+    rendered at most once; concurrent requests for it share the same future.
+    """
+
+    def __init__(self, workers=RENDER_WORKERS, max_entries=CACHE_SIZE):
+        self.workers = workers
+        self.max_entries = max_entries
+        self._images = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def _store(self, key, future):
+        with self._lock:
+            self._pending.pop(key, None)
+            if future.exception() is not None:
+                return
+            self._images[key] = future.result()
+            self._images.move_to_end(key)
+            while len(self._images) > self.max_entries:
+                self._images.popitem(last=False)
+
+    def prerender(self, knowledge_graph):
+        """Start rendering a graph in the background; returns its cache key"""
+        key = graph_hash(knowledge_graph)
+        with self._lock:
+            if key in self._images or key in self._pending:
+                return key
+            future = self._get_executor().submit(render_graph_image, knowledge_graph)
+            self._pending[key] = future
+        future.add_done_callback(lambda f: self._store(key, f))
+        return key
+
+    def get(self, knowledge_graph, timeout=None):
+        """Return the rendered image, waiting for (or starting) its render if needed"""
+        key = self.prerender(knowledge_graph)
+        with self._lock:
+            if key in self._images:
+                self._images.move_to_end(key)
+                return self._images[key]
+            future = self._pending.get(key)
+        if future is None:
+            # Render finished between prerender() and the lookup above
+            with self._lock:
+                return self._images.get(key)
+        return future.result(timeout=timeout)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
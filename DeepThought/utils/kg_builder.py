@@ -0,0 +1,298 @@
+# utils/kg_builder.py
+import json
+import math
+import os
+import threading
+import zlib
+from collections import Counter, defaultdict
+
+from utils.knowledge_graph import (DocumentGraphCache, FictionKnowledgeGraph, contradictions_by_candidate,
+                                   merge_knowledge_graphs)
+from utils.ner_extraction import stream_entities, extract_relationships, get_nlp
+
+# Per-universe cache directory: one .fkg graph per file (in DOCUMENTS_DIR),
+# their merge with its contradictions, and the LLM's answers
+CACHE_DIR = "knowledge_graph_cache"
+DOCUMENTS_DIR = "documents"
+UNIVERSE_GRAPH = "universe.fkg"
+UNIVERSE_STATE = "universe.json"
+REFINEMENTS_FILE = "refinements.json"
+# Items below this confidence are sent to the LLM for refinement
+REFINE_THRESHOLD = float(os.getenv("KG_REFINE_THRESHOLD", "0.6"))
+# Upper bound on candidates per refinement call, lowest confidence first
+MAX_REFINE_ITEMS = int(os.getenv("KG_MAX_REFINE_ITEMS", "60"))
+# Confidence of a pattern-matched relationship whose endpoints NER also found
+PATTERN_CONFIDENCE = 0.9
+
+# spaCy labels that become graph nodes, with the node type the UI shows
+NODE_TYPES = {
+    "PERSON": "Character",
+    "GPE": "Location",
+    "LOC": "Location",
+    "ORG": "Organization",
+    "EVENT": "Event",
+    "WORK_OF_ART": "Object",
+    "ARTIFACT": "Object",
+    "ABILITY": "Ability",
+    "SPECIES": "Species",
+}
+
+_available = None
+# One build at a time per universe, since builds rewrite its cache file
+_universe_locks = defaultdict(threading.Lock)
+
+def local_graph_available():
+    """Whether the spaCy model loads, i.e. graphs can be built locally"""
+    global _available
+    if _available is None:
+        try:
+            get_nlp()
+            _available = True
+        except (ImportError, OSError) as e:
+            print(f"Local knowledge graph disabled: {e}")
+            _available = False
+    return _available
+
+def _mention_confidence(mentions, share):
+    # One mention under a single label scores 0.5; repeated, consistently
+    # labelled names approach 0.95
+    return round(share * min(0.95, 0.5 + 0.15 * math.log2(mentions)), 2)
+
+def document_graph(text, source_doc):
+    """Knowledge graph for one document from spaCy NER and the relation patterns.
+
+    Entities are counted once per NER mention and keep the passage of their
+    first mention as description; relationship endpoints are PERSON entities.
+    """
+    all_entities = list(stream_entities(text))
+    # Anchored to the NER spans, so endpoints are entity names
+    relationships = extract_relationships(text, all_entities)
+    kg = FictionKnowledgeGraph()
+    for entity in all_entities:
+        if entity["type"] not in NODE_TYPES:
+            continue
+        record = kg.entity_info[kg.add_entity(entity, source_doc)]
+        if record.description is None:
+            record.description = entity["context"].strip()
+    for rel in relationships:
+        kg.add_relationship({"type": "PERSON", "name": rel["source"]}, rel["relation"],
+                            {"type": "PERSON", "name": rel["target"]}, source_doc)
+    return kg
+
+def graph_view(kg):
+    """A document_graph (or a merge of several) as {"nodes": [...], "edges": [...]},
+    the format get_knowledge_graph serves.
+
+    Node confidence grows with the number of mentions and drops when NER
+    labels the same name inconsistently; relationships whose endpoints NER
+    never found as entities are low confidence ("unresolved").
+    """
+    # add_relationship counts each endpoint as a mention; what's left are NER mentions
+    endpoints = Counter()
+    for source_id, target_id, _, _, _ in kg.edges():
+        endpoints[source_id] += 1
+        endpoints[target_id] += 1
+    labels = defaultdict(Counter)
+    contexts = {}
+    for entity_id, record in kg.entity_info.items():
+        count = sum(record.mentions.values()) - endpoints[entity_id]
+        if count > 0:
+            labels[record.name][record.type] += count
+        if record.description:
+            contexts.setdefault(record.name, record.description)
+
+    nodes = {}
+    for info in kg.entity_info.values():
+        name = info.name
+        if name in nodes:
+            continue
+        counts = labels.get(name)
+        if counts:
+            label, count = counts.most_common(1)[0]
+            total = sum(counts.values())
+            confidence = _mention_confidence(total, count / total)
+        else:
+            # Only seen as a relationship endpoint
+            label, confidence = info.type, 0.4
+        nodes[name] = {
+            "id": name,
+            "type": NODE_TYPES.get(label, "Other"),
+            "description": contexts.get(name, ""),
+            "confidence": confidence,
+        }
+
+    edges = {}
+    for source_id, target_id, relation, _, _ in kg.edges():
+        source = kg.entity_info[source_id].name
+        target = kg.entity_info[target_id].name
+        resolved = source in labels and target in labels
+        edges[(source, target, relation)] = {
+            "source": source,
+            "target": target,
+            "relationship": relation,
+            "confidence": PATTERN_CONFIDENCE if resolved else 0.5,
+        }
+    return {"nodes": list(nodes.values()), "edges": list(edges.values())}
+
+def _node_key(node):
+    return f"node:{node['id']}"
+
+def _edge_key(edge):
+    return f"edge:{edge['source']}|{edge['relationship']}|{edge['target']}"
+
+class TieredGraphBuilder:
+    """Builds a universe's knowledge graph locally, asking the LLM only about what's uncertain.
+
+    Each file's document_graph is cached as a .fkg file keyed by content
+    hash, so unchanged files are never re-parsed; the universe graph merges
+    them. The merged graph is kept too: while files are only added, new ones
+    are merged into it and only the facts they add are checked for
+    contradictions (left in `contradictions` after build). Nodes and edges
+    below REFINE_THRESHOLD go to `refine`
+    (one call for all of them) and the answers are cached per item, so an
+    edit that introduces no new uncertain items needs no LLM call at all.
+
+    `refine` takes {"nodes": [...], "edges": [...]} candidates and returns
+    the same structure with corrected items carrying a 'keep' flag.
+    """
+
+    def __init__(self, universe_path, refine=None, threshold=REFINE_THRESHOLD,
+                 max_refine_items=MAX_REFINE_ITEMS):
+        self.universe_path = universe_path
+        self.refine = refine
+        self.threshold = threshold
+        self.max_refine_items = max_refine_items
+        self.cache_dir = os.path.join(universe_path, CACHE_DIR)
+        self.documents = DocumentGraphCache(os.path.join(self.cache_dir, DOCUMENTS_DIR), build=document_graph)
+        self.contradictions = []
+
+    def _refinements_path(self):
+        return os.path.join(self.cache_dir, REFINEMENTS_FILE)
+
+    def _load_refinements(self):
+        try:
+            with open(self._refinements_path(), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_refinements(self, refinements):
+        with open(self._refinements_path(), 'w') as f:
+            json.dump(refinements, f)
+
+    def _load_universe(self, keys):
+        # The merged graph of earlier builds, the document keys it covers and
+        # its contradictions by fact; None if a document it covers has
+        # changed or is gone, since facts can't be taken out of a graph
+        try:
+            with open(os.path.join(self.cache_dir, UNIVERSE_STATE), 'r') as f:
+                state = json.load(f)
+            if not set(state["documents"]) <= set(keys):
+                return None
+            kg = FictionKnowledgeGraph.load(os.path.join(self.cache_dir, UNIVERSE_GRAPH))
+        except (OSError, ValueError, KeyError, zlib.error):
+            return None
+        found = {tuple(candidate): results for candidate, results in state["contradictions"]}
+        return kg, state["documents"], found
+
+    def _save_universe(self, kg, keys, found):
+        kg.save(os.path.join(self.cache_dir, UNIVERSE_GRAPH))
+        state = {"documents": keys, "contradictions": [[list(c), results] for c, results in found.items() if results]}
+        with open(os.path.join(self.cache_dir, UNIVERSE_STATE), 'w') as f:
+            json.dump(state, f)
+
+    def _read(self, file_name):
+        with open(os.path.join(self.universe_path, file_name), 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def _uncertain(self, graph, refinements):
+        nodes = [n for n in graph["nodes"]
+                 if n["confidence"] < self.threshold and _node_key(n) not in refinements]
+        edges = [e for e in graph["edges"]
+                 if e["confidence"] < self.threshold and _edge_key(e) not in refinements]
+        nodes.sort(key=lambda n: n["confidence"])
+        edges.sort(key=lambda e: e["confidence"])
+        nodes = nodes[:self.max_refine_items]
+        edges = edges[:max(0, self.max_refine_items - len(nodes))]
+        return nodes, edges
+
+    def _request_refinements(self, graph, refinements):
+        nodes, edges = self._uncertain(graph, refinements)
+        if not (nodes or edges) or self.refine is None:
+            return 0
+        descriptions = {n["id"]: n["description"] for n in graph["nodes"]}
+        candidates = {
+            "nodes": [{"id": n["id"], "type": n["type"], "context": n["description"]} for n in nodes],
+            "edges": [{"source": e["source"], "target": e["target"], "relationship": e["relationship"],
+                       "context": descriptions.get(e["source"], "")} for e in edges]
+        }
+        result = self.refine(candidates)
+        if not isinstance(result, dict) or "error" in result:
+            print(f"Graph refinement failed: {result}")
+            return 0
+        answered = {}
+        for item in result.get("nodes", []):
+            if isinstance(item, dict) and "id" in item:
+                answered[_node_key(item)] = item
+        for item in result.get("edges", []):
+            if isinstance(item, dict) and {"source", "target", "relationship"} <= item.keys():
+                answered[_edge_key(item)] = item
+        # Candidates the LLM skipped are recorded too, so they aren't asked about again
+        for node in nodes:
+            refinements[_node_key(node)] = answered.get(_node_key(node), {"keep": True})
+        for edge in edges:
+            refinements[_edge_key(edge)] = answered.get(_edge_key(edge), {"keep": True})
+        return len(nodes) + len(edges)
+
+    def _apply(self, graph, refinements):
+        # Answers only apply while an item is still uncertain; once the text
+        # makes it confident, the local result stands
+        nodes = []
+        for node in graph["nodes"]:
+            answer = refinements.get(_node_key(node)) if node["confidence"] < self.threshold else None
+            if answer is None:
+                nodes.append(node)
+            elif answer.get("keep", True):
+                nodes.append({**node, **{k: answer[k] for k in ("type", "description", "confidence") if answer.get(k)}})
+        kept = {n["id"] for n in nodes}
+        edges = []
+        for edge in graph["edges"]:
+            if edge["source"] not in kept or edge["target"] not in kept:
+                continue
+            answer = refinements.get(_edge_key(edge)) if edge["confidence"] < self.threshold else None
+            if answer is None:
+                edges.append(edge)
+            elif answer.get("keep", True):
+                edges.append({**edge, **{k: answer[k] for k in ("confidence",) if answer.get(k)}})
+        return {"nodes": nodes, "edges": edges}
+
+    def build(self, file_names=None):
+        """The universe's knowledge graph, from its .txt files unless file_names is given"""
+        if file_names is None:
+            file_names = sorted(f for f in os.listdir(self.universe_path) if f.endswith('.txt'))
+        with _universe_locks[os.path.abspath(self.universe_path)]:
+            documents = [(f, self._read(f)) for f in file_names]
+            keys = [self.documents.key(text, f) for f, text in documents]
+            universe = self._load_universe(keys)
+            if universe is None:
+                kg = merge_knowledge_graphs(self.documents.get(text, f) for f, text in documents)
+                merged, found = keys, {}
+            else:
+                kg, merged, found = universe
+                done = set(merged)
+                for (f, text), key in zip(documents, keys):
+                    if key not in done:
+                        kg.merge(self.documents.get(text, f))
+                        merged.append(key)
+            # merge() marks the facts it adds as candidates, so only those are checked
+            found.update(contradictions_by_candidate(kg, incremental=True))
+            self._save_universe(kg, merged, found)
+            self.contradictions = [{**c, "confidence": PATTERN_CONFIDENCE}
+                                   for results in found.values() for c in results]
+            graph = graph_view(kg)
+            # Forget files that are gone or changed, so the cache doesn't grow with edits
+            self.documents.prune(documents)
+            refinements = self._load_refinements()
+            self._request_refinements(graph, refinements)
+            self._save_refinements(refinements)
+        return self._apply(graph, refinements)
@@ -1,37 +1,168 @@
 # utils/knowledge_graph.py
-from collections import defaultdict
-import networkx as nx
-from datetime import datetime
+import hashlib
+import json
+import math
+import os
+import struct
+import sys
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict
+from types import MappingProxyType
+from datetime import date, datetime
+
+LOCATION_TYPES = ("GPE", "LOC")
+
+_NO_ATTRIBUTES = MappingProxyType({})
+
+# Serialized graphs: MAGIC, then zlib-compressed (header length, edge count),
+# JSON header (entities, interned strings, timelines) and the raw edge arrays
+MAGIC = b"FKG\x01"
+_COUNTS = struct.Struct("<II")
+
+def _encode_timestamp(timestamp):
+    # JSON has no dates; they are tagged so from_bytes restores the same type
+    if isinstance(timestamp, datetime):
+        return {"datetime": timestamp.isoformat()}
+    if isinstance(timestamp, date):
+        return {"date": timestamp.isoformat()}
+    return timestamp
+
+def _decode_timestamp(value):
+    if isinstance(value, dict):
+        if "datetime" in value:
+            return datetime.fromisoformat(value["datetime"])
+        return date.fromisoformat(value["date"])
+    return value
+
+class EntityRecord:
+    """One entity. Supports record["name"]-style access like the old info dicts."""
+    __slots__ = ("type", "name", "mentions", "_attributes", "first_appearance", "confidence", "description")
+
+    def __init__(self, type, name, first_appearance=None, confidence=1.0, description=None):
+        self.type = type
+        self.name = name
+        # Mentions per source document
+        self.mentions = Counter()
+        self._attributes = None
+        self.first_appearance = first_appearance
+        self.confidence = confidence
+        # Free text about the entity, e.g. the passage it was first found in
+        self.description = description
+
+    @property
+    def attributes(self):
+        """attribute -> list of AttributeValue; created on the first attribute"""
+        return self._attributes if self._attributes is not None else _NO_ATTRIBUTES
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+class AttributeValue:
+    __slots__ = ("value", "source", "confidence")
+
+    def __init__(self, value, source=None, confidence=1.0):
+        self.value = value
+        self.source = source
+        self.confidence = confidence
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+class _EntityInfoView:
+    """Read-only mapping of entity id -> EntityRecord over the graph's records"""
+
+    def __init__(self, records):
+        self._records = records
+
+    def __getitem__(self, entity_id):
+        return self._records[entity_id]
+
+    def __contains__(self, entity_id):
+        return isinstance(entity_id, int) and 0 <= entity_id < len(self._records)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(range(len(self._records)))
+
+    def get(self, entity_id, default=None):
+        return self._records[entity_id] if entity_id in self else default
+
+    def keys(self):
+        return range(len(self._records))
+
+    def values(self):
+        return iter(self._records)
+
+    def items(self):
+        return enumerate(self._records)
 
 class FictionKnowledgeGraph:
+    """Knowledge graph with a compact core.
+
+    Entities are interned to integer ids (0, 1, ...) and stored once as
+    EntityRecords; edges live in parallel arrays and are indexed CSR-style
+    (offsets + targets, built lazily) for successor lookups. Relation names
+    and source documents are interned too. A NetworkX MultiDiGraph is only
+    built when `graph` is read.
+    """
+
     def __init__(self):
-        self.graph = nx.MultiDiGraph()
-        self.entity_info = {}
-        self.timeline = defaultdict(list)
-        
+        self._ids = {}
+        self._records = []
+        self.entity_info = _EntityInfoView(self._records)
+        # Interned relation names and source documents (index 0 is None)
+        self._strings = [None]
+        self._string_ids = {None: 0}
+        self._edge_src = array('i')
+        self._edge_dst = array('i')
+        self._edge_relation = array('i')
+        self._edge_doc = array('i')
+        self._edge_confidence = array('f')
+        self._csr = None
+        self._nx_graph = None
+        self._timeline = defaultdict(list)
+        # (timestamp, order) of each entity's events, kept sorted and parallel
+        # to its timeline for bisection. "order" is an event's stated position,
+        # i.e. the order it was added in, which timeline contradictions compare
+        # against; it also keeps events with equal timestamps in stated order
+        self._timeline_keys = defaultdict(list)
+        # Entities with events bulk-appended since their timeline was last sorted
+        self._unsorted = set()
+        # Facts added since the last contradiction check, as (kind, entity_id[, attribute])
+        self.candidates = set()
+
+    def _intern(self, value):
+        index = self._string_ids.get(value)
+        if index is None:
+            index = self._string_ids[value] = len(self._strings)
+            self._strings.append(value)
+        return index
+
+    def entity_id(self, entity):
+        """Integer id of an entity ({"type": ..., "name": ...}), or None if it isn't in the graph"""
+        return self._ids.get((entity["type"], entity["name"]))
+
+    @staticmethod
+    def entity_key(record):
+        """The "TYPE:name" label of an entity, as used for NetworkX nodes"""
+        return f"{record.type}:{record.name}"
+
     def add_entity(self, entity, source_doc=None, confidence=1.0):
-        """Add an entity to the graph with metadata"""
-        entity_id = f"{entity['type']}:{entity['name']}"
+        """Add an entity to the graph with metadata; returns its integer id"""
+        key = (entity["type"], entity["name"])
+        entity_id = self._ids.get(key)
         
-        if entity_id not in self.entity_info:
-            self.entity_info[entity_id] = {
-                "type": entity["type"],
-                "name": entity["name"],
-                "mentions": [],
-                "attributes": defaultdict(list),
-                "first_appearance": source_doc,
-                "confidence": confidence
-            }
+        if entity_id is None:
+            entity_id = self._ids[key] = len(self._records)
+            self._records.append(EntityRecord(entity["type"], entity["name"], source_doc, confidence))
+            self._nx_graph = None
         
         if source_doc:
-            self.entity_info[entity_id]["mentions"].append(source_doc)
-            
-        # Add to graph if not present
-        if not self.graph.has_node(entity_id):
-            self.graph.add_node(entity_id, 
-                               type=entity["type"], 
-                               name=entity["name"],
-                               confidence=confidence)
+            self._records[entity_id].mentions[source_doc] += 1
         
         return entity_id
             
@@ -40,32 +171,291 @@ class FictionKnowledgeGraph:
         source_id = self.add_entity(source_entity, source_doc, confidence)
         target_id = self.add_entity(target_entity, source_doc, confidence)
         
-        self.graph.add_edge(source_id, target_id, 
-                          relation=relation, 
-                          source=source_doc,
-                          confidence=confidence)
+        self._edge_src.append(source_id)
+        self._edge_dst.append(target_id)
+        self._edge_relation.append(self._intern(relation))
+        self._edge_doc.append(self._intern(source_doc))
+        self._edge_confidence.append(confidence)
+        self._csr = None
+        self._nx_graph = None
+        if source_entity["type"] == "PERSON" and target_entity["type"] in LOCATION_TYPES:
+            self.candidates.add(("Location", source_id))
+
+    def _edge_index(self):
+        # Counting sort of edge positions by source: offsets[i]:offsets[i+1]
+        # are the positions of entity i's out-edges, in insertion order
+        if self._csr is None:
+            offsets = array('i', [0]) * (len(self._records) + 1)
+            for source_id in self._edge_src:
+                offsets[source_id + 1] += 1
+            for i in range(len(self._records)):
+                offsets[i + 1] += offsets[i]
+            fill = array('i', offsets)
+            order = array('i', [0]) * len(self._edge_src)
+            for position, source_id in enumerate(self._edge_src):
+                order[fill[source_id]] = position
+                fill[source_id] += 1
+            self._csr = (offsets, order)
+        return self._csr
+
+    def successors(self, entity_id):
+        """Ids of the entities entity_id has edges to (each once, in edge order)"""
+        offsets, order = self._edge_index()
+        seen = {}
+        for position in order[offsets[entity_id]:offsets[entity_id + 1]]:
+            seen.setdefault(self._edge_dst[position], None)
+        return list(seen)
+
+    def edges(self, entity_id=None):
+        """(source_id, target_id, relation, source_doc, confidence) for every edge,
+        or only entity_id's out-edges"""
+        if entity_id is None:
+            positions = range(len(self._edge_src))
+        else:
+            offsets, order = self._edge_index()
+            positions = order[offsets[entity_id]:offsets[entity_id + 1]]
+        for position in positions:
+            yield (self._edge_src[position], self._edge_dst[position],
+                   self._strings[self._edge_relation[position]],
+                   self._strings[self._edge_doc[position]],
+                   self._edge_confidence[position])
+
+    def edge_count(self):
+        return len(self._edge_src)
+
+    @property
+    def graph(self):
+        """A NetworkX MultiDiGraph view keyed by entity id, built on demand and cached until the next change"""
+        if self._nx_graph is None:
+            import networkx as nx
+
+            graph = nx.MultiDiGraph()
+            for entity_id, record in enumerate(self._records):
+                graph.add_node(entity_id, type=record.type, name=record.name,
+                               confidence=record.confidence)
+            for source_id, target_id, relation, source_doc, confidence in self.edges():
+                graph.add_edge(source_id, target_id, relation=relation,
+                               source=source_doc, confidence=confidence)
+            self._nx_graph = graph
+        return self._nx_graph
     
     def add_attribute(self, entity, attribute, value, source_doc=None, confidence=1.0):
         """Add an attribute to an entity"""
         entity_id = self.add_entity(entity, source_doc, confidence)
-        self.entity_info[entity_id]["attributes"][attribute].append({
-            "value": value,
-            "source": source_doc,
-            "confidence": confidence
-        })
+        record = self._records[entity_id]
+        if record._attributes is None:
+            record._attributes = {}
+        record._attributes.setdefault(attribute, []).append(AttributeValue(value, source_doc, confidence))
+        self.candidates.add(("Attribute", entity_id, attribute))
     
+    @property
+    def timeline(self):
+        """entity id -> its events sorted by timestamp (events with equal timestamps in stated order)"""
+        # Bulk appends are sorted in on the first read after them, one sort
+        # per entity however many events were added
+        for entity_id in self._unsorted:
+            timeline = self._timeline[entity_id]
+            # Stable, and linear in the common case of an already-sorted timeline
+            # followed by a sorted run of new events
+            timeline.sort(key=lambda x: x["timestamp"])
+            self._timeline_keys[entity_id] = [(e["timestamp"], e["order"]) for e in timeline]
+        self._unsorted.clear()
+        return self._timeline
+
     def add_timeline_event(self, entity, event, timestamp, source_doc=None, confidence=1.0):
-        """Add a timeline event for an entity"""
+        """Add a timeline event for an entity, inserted in timestamp order"""
         entity_id = self.add_entity(entity, source_doc, confidence)
-        self.timeline[entity_id].append({
+        timeline = self._timeline[entity_id]
+        record = {
             "event": event,
             "timestamp": timestamp,
             "source": source_doc,
-            "confidence": confidence
-        })
-        
-        # Sort timeline events by timestamp
-        self.timeline[entity_id].sort(key=lambda x: x["timestamp"])
+            "confidence": confidence,
+            "order": len(timeline)
+        }
+        if entity_id in self._unsorted:
+            # Sorted with the pending bulk events on the next read
+            timeline.append(record)
+        else:
+            # Bisection finds the place in O(log n); the new event has the
+            # highest order, so it goes after events with the same timestamp
+            keys = self._timeline_keys[entity_id]
+            key = (timestamp, record["order"])
+            position = bisect_right(keys, key)
+            keys.insert(position, key)
+            timeline.insert(position, record)
+        self.candidates.add(("Timeline", entity_id))
+
+    def add_timeline_events(self, entity, events, source_doc=None, confidence=1.0):
+        """Add many timeline events for an entity.
+
+        `events` are (event, timestamp) pairs or dicts with 'event' and
+        'timestamp' (and optionally 'source' and 'confidence'). They are
+        appended and the timeline is sorted once, when next read.
+        """
+        entity_id = self.add_entity(entity, source_doc, confidence)
+        timeline = self._timeline[entity_id]
+        for item in events:
+            if isinstance(item, dict):
+                timeline.append({
+                    "event": item["event"],
+                    "timestamp": item["timestamp"],
+                    "source": item.get("source", source_doc),
+                    "confidence": item.get("confidence", confidence),
+                    "order": len(timeline)
+                })
+            else:
+                event, timestamp = item
+                timeline.append({
+                    "event": event,
+                    "timestamp": timestamp,
+                    "source": source_doc,
+                    "confidence": confidence,
+                    "order": len(timeline)
+                })
+        self._unsorted.add(entity_id)
+        self.candidates.add(("Timeline", entity_id))
+
+    def events_between(self, entity, start=None, end=None):
+        """Timeline events for an entity with start <= timestamp <= end (either bound may be None)"""
+        entity_id = self.entity_id(entity)
+        timeline = self.timeline
+        if entity_id is None or entity_id not in timeline:
+            return []
+        keys = self._timeline_keys[entity_id]
+        # (start,) sorts before and (end, inf) after every key with that timestamp
+        lo = 0 if start is None else bisect_left(keys, (start,))
+        hi = len(keys) if end is None else bisect_right(keys, (end, math.inf))
+        return timeline[entity_id][lo:hi]
+
+    def merge(self, other):
+        """Merge another graph into this one and return self.
+
+        Entities are matched by type and name; their mentions are summed and
+        confidences combined as independent evidence (1 - (1-a)(1-b)).
+        Edges, attribute values and timeline events are added with their
+        provenance, and become candidates for the next incremental check.
+        """
+        remap = array('i')
+        for record in other._records:
+            key = (record.type, record.name)
+            entity_id = self._ids.get(key)
+            if entity_id is None:
+                entity_id = self._ids[key] = len(self._records)
+                mine = EntityRecord(record.type, record.name, record.first_appearance, record.confidence,
+                                    record.description)
+                self._records.append(mine)
+            else:
+                mine = self._records[entity_id]
+                mine.confidence = 1 - (1 - mine.confidence) * (1 - record.confidence)
+                if mine.first_appearance is None:
+                    mine.first_appearance = record.first_appearance
+                if mine.description is None:
+                    mine.description = record.description
+            mine.mentions.update(record.mentions)
+            for attribute, values in record.attributes.items():
+                if mine._attributes is None:
+                    mine._attributes = {}
+                mine._attributes.setdefault(attribute, []).extend(
+                    AttributeValue(v.value, v.source, v.confidence) for v in values)
+                self.candidates.add(("Attribute", entity_id, attribute))
+            remap.append(entity_id)
+
+        for source_id, target_id, relation, source_doc, confidence in other.edges():
+            source_id, target_id = remap[source_id], remap[target_id]
+            self._edge_src.append(source_id)
+            self._edge_dst.append(target_id)
+            self._edge_relation.append(self._intern(relation))
+            self._edge_doc.append(self._intern(source_doc))
+            self._edge_confidence.append(confidence)
+            if (self._records[source_id].type == "PERSON"
+                    and self._records[target_id].type in LOCATION_TYPES):
+                self.candidates.add(("Location", source_id))
+
+        for entity_id, events in other.timeline.items():
+            if events:
+                record = other._records[entity_id]
+                # In stated order, so the events keep their relative order here
+                stated = sorted(events, key=lambda e: e.get("order", 0))
+                self.add_timeline_events({"type": record.type, "name": record.name}, stated)
+        self._csr = None
+        self._nx_graph = None
+        return self
+
+    def to_bytes(self):
+        """Compact binary serialization; see from_bytes()"""
+        header = json.dumps({
+            "entities": [
+                [r.type, r.name, r.mentions,
+                 {a: [[v.value, v.source, v.confidence] for v in values] for a, values in r.attributes.items()},
+                 r.first_appearance, r.confidence, r.description]
+                for r in self._records
+            ],
+            "strings": self._strings,
+            "timeline": [[entity_id, [{**e, "timestamp": _encode_timestamp(e["timestamp"])} for e in events]]
+                         for entity_id, events in self.timeline.items() if events]
+        }, separators=(',', ':')).encode('utf-8')
+        arrays = [self._edge_src, self._edge_dst, self._edge_relation, self._edge_doc, self._edge_confidence]
+        if sys.byteorder == 'big':
+            arrays = [array(a.typecode, a) for a in arrays]
+            for a in arrays:
+                a.byteswap()
+        body = _COUNTS.pack(len(header), len(self._edge_src)) + header + b"".join(a.tobytes() for a in arrays)
+        return MAGIC + zlib.compress(body)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """A graph from to_bytes() output"""
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError("Not a serialized FictionKnowledgeGraph")
+        body = zlib.decompress(data[len(MAGIC):])
+        header_length, edge_count = _COUNTS.unpack_from(body)
+        offset = _COUNTS.size
+        header = json.loads(body[offset:offset + header_length])
+        offset += header_length
+
+        kg = cls()
+        for type_, name, mentions, attributes, first_appearance, confidence, description in header["entities"]:
+            record = EntityRecord(type_, name, first_appearance, confidence, description)
+            record.mentions.update(mentions)
+            if attributes:
+                record._attributes = {a: [AttributeValue(*v) for v in values] for a, values in attributes.items()}
+            kg._ids[(type_, name)] = len(kg._records)
+            kg._records.append(record)
+        kg._strings = header["strings"]
+        kg._string_ids = {value: index for index, value in enumerate(kg._strings)}
+        for name in ("_edge_src", "_edge_dst", "_edge_relation", "_edge_doc", "_edge_confidence"):
+            values = getattr(kg, name)
+            size = values.itemsize * edge_count
+            values.frombytes(body[offset:offset + size])
+            if sys.byteorder == 'big':
+                values.byteswap()
+            offset += size
+        for entity_id, events in header["timeline"]:
+            for event in events:
+                event["timestamp"] = _decode_timestamp(event["timestamp"])
+            kg._timeline[entity_id] = events
+            kg._timeline_keys[entity_id] = [(e["timestamp"], e["order"]) for e in events]
+        return kg
+
+    def save(self, path):
+        # Written to a temporary file first so readers never see a partial graph
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(self.to_bytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls.from_bytes(f.read())
+
+def merge_knowledge_graphs(graphs):
+    """One graph combining several (e.g. per-document) graphs; see FictionKnowledgeGraph.merge"""
+    merged = FictionKnowledgeGraph()
+    for kg in graphs:
+        merged.merge(kg)
+    return merged
 
 def build_knowledge_graph(entities_data, source_doc=None):
     """Build a knowledge graph from extracted entities and relationships"""
@@ -83,57 +473,150 @@ def build_knowledge_graph(entities_data, source_doc=None):
     
     return kg
 
-def detect_contradictions(knowledge_graph):
-    """Detect various types of contradictions in the knowledge graph"""
+def _extract_document_graph(text, source_doc):
+    from utils.ner_extraction import extract_entities_from_text
+
+    return build_knowledge_graph(extract_entities_from_text(text), source_doc)
+
+class DocumentGraphCache:
+    """Per-document knowledge graphs saved in cache_dir, keyed by content hash.
+
+    The key also covers the document name, which the graph records in its
+    mentions. A universe graph is assembled by merging the cached parts, so
+    only new or changed documents are extracted again.
+    """
+
+    def __init__(self, cache_dir, build=_extract_document_graph):
+        self.cache_dir = cache_dir
+        self.build = build
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(text, source_doc=None):
+        digest = hashlib.sha256(text.encode('utf-8'))
+        digest.update(b"\0" + (source_doc or "").encode('utf-8'))
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.fkg")
+
+    def get(self, text, source_doc=None):
+        """The document's graph, extracted and saved on the first request"""
+        path = self.path(self.key(text, source_doc))
+        try:
+            return FictionKnowledgeGraph.load(path)
+        except (OSError, ValueError, zlib.error):
+            kg = self.build(text, source_doc)
+            kg.save(path)
+            return kg
+
+    def universe_graph(self, documents):
+        """Merged graph of (source_doc, text) pairs"""
+        return merge_knowledge_graphs(self.get(text, source_doc) for source_doc, text in documents)
+
+    def prune(self, documents):
+        """Delete cached graphs other than those of (source_doc, text) pairs"""
+        keep = {f"{self.key(text, source_doc)}.fkg" for source_doc, text in documents}
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".fkg") and name not in keep:
+                os.remove(os.path.join(self.cache_dir, name))
+
+def _location_contradiction(knowledge_graph, person_id):
+    # Driven by the character's own out-edges rather than every location
+    char_locations = []
+    for target_id in knowledge_graph.successors(person_id):
+        info = knowledge_graph.entity_info[target_id]
+        if info.type in LOCATION_TYPES:
+            char_locations.append(info.name)
+    if len(char_locations) > 1:
+        name = knowledge_graph.entity_info[person_id].name
+        return {
+            "type": "Location",
+            "description": f"{name} appears in multiple locations simultaneously: {', '.join(char_locations)}.",
+            "conflicting_statements": [f"{name} is in {location}" for location in char_locations[:2]]
+        }
+    return None
+
+def _timeline_contradictions(knowledge_graph, entity_id):
+    # The timeline is sorted by timestamp; a contradiction is a document
+    # stating an event before one that, by timestamp, happened earlier
+    by_source = defaultdict(list)
+    for event in knowledge_graph.timeline.get(entity_id, []):
+        by_source[event["source"]].append(event)
     contradictions = []
-    
-    # Check for character location contradictions
-    characters = [entity for entity_id, entity in knowledge_graph.entity_info.items() 
-                 if entity["type"] == "PERSON"]
-    
-    locations = [entity for entity_id, entity in knowledge_graph.entity_info.items()
-                if entity["type"] in ["GPE", "LOC"]]
-    
-    # Example contradiction detection: Character in multiple locations
-    for character in characters:
-        char_locations = []
-        for loc in locations:
-            # Check if this character is connected to this location
-            if knowledge_graph.graph.has_edge(f"PERSON:{character['name']}", f"{loc['type']}:{loc['name']}"):
-                char_locations.append(loc["name"])
-        
-        if len(char_locations) > 1:
-            contradictions.append({
-                "type": "Location",
-                "description": f"{character['name']} appears in multiple locations simultaneously: {', '.join(char_locations)}."
-            })
-    
-    # Check for timeline contradictions
-    for entity_id, timeline in knowledge_graph.timeline.items():
-        if len(timeline) <= 1:
-            continue
-            
-        # Check for impossible timeline sequences
-        for i in range(len(timeline) - 1):
-            if timeline[i]["timestamp"] > timeline[i+1]["timestamp"]:
-                entity_name = knowledge_graph.entity_info[entity_id]["name"]
+    for events in by_source.values():
+        stated = sorted(events, key=lambda e: e.get("order", 0))
+        for first, second in zip(stated, stated[1:]):
+            if first["timestamp"] > second["timestamp"]:
+                entity_name = knowledge_graph.entity_info[entity_id].name
                 contradictions.append({
                     "type": "Timeline",
-                    "description": f"Timeline contradiction for {entity_name}: {timeline[i]['event']} occurs after {timeline[i+1]['event']}."
-                })
-    
-    # Check for attribute contradictions
-    for entity_id, info in knowledge_graph.entity_info.items():
-        for attribute, values in info["attributes"].items():
-            if len(values) <= 1:
-                continue
-                
-            # Check for different values of the same attribute
-            unique_values = set(item["value"] for item in values)
-            if len(unique_values) > 1:
-                contradictions.append({
-                    "type": "Attribute",
-                    "description": f"{info['name']} has conflicting {attribute} values: {', '.join(unique_values)}."
+                    "description": f"Timeline contradiction for {entity_name}: {first['event']} occurs after {second['event']}.",
+                    "conflicting_statements": [first["event"], second["event"]]
                 })
-    
-    return contradictions
\ No newline at end of file
+    return contradictions
+
+def _attribute_contradiction(knowledge_graph, entity_id, attribute):
+    info = knowledge_graph.entity_info[entity_id]
+    values = info.attributes.get(attribute, [])
+    if len(values) <= 1:
+        return None
+    # Check for different values of the same attribute
+    unique_values = set(item.value for item in values)
+    if len(unique_values) > 1:
+        return {
+            "type": "Attribute",
+            "description": f"{info.name} has conflicting {attribute} values: {', '.join(unique_values)}.",
+            "conflicting_statements": [f"{info.name}'s {attribute} is {value}" for value in sorted(unique_values)[:2]]
+        }
+    return None
+
+def contradictions_by_candidate(knowledge_graph, incremental=False):
+    """Contradictions per fact checked, as {(kind, entity_id[, attribute]): [contradiction, ...]}.
+
+    Every fact examined has an entry, empty if it is consistent, so a caller
+    keeping earlier results can replace exactly what was re-checked. See
+    detect_contradictions for `incremental`.
+    """
+    if incremental:
+        candidates = knowledge_graph.candidates
+    else:
+        candidates = set()
+        for entity_id, entity in knowledge_graph.entity_info.items():
+            if entity.type == "PERSON":
+                candidates.add(("Location", entity_id))
+            for attribute in entity.attributes:
+                candidates.add(("Attribute", entity_id, attribute))
+        for entity_id in knowledge_graph.timeline:
+            candidates.add(("Timeline", entity_id))
+    knowledge_graph.candidates = set()
+
+    found = {}
+    for candidate in sorted(candidates):
+        kind = candidate[0]
+        if kind == "Location":
+            contradiction = _location_contradiction(knowledge_graph, candidate[1])
+            found[candidate] = [contradiction] if contradiction else []
+        elif kind == "Timeline":
+            found[candidate] = _timeline_contradictions(knowledge_graph, candidate[1])
+        else:
+            contradiction = _attribute_contradiction(knowledge_graph, candidate[1], candidate[2])
+            found[candidate] = [contradiction] if contradiction else []
+    return found
+
+def detect_contradictions(knowledge_graph, incremental=False):
+    """Detect various types of contradictions in the knowledge graph
+
+    With incremental=True only the facts added since the last check are
+    examined (the graph's candidate set), so re-checking after adding a book
+    costs time proportional to what the book added. Either mode clears the
+    candidate set.
+    """
+    found = contradictions_by_candidate(knowledge_graph, incremental)
+    contradictions = []
+    # Location, then timeline, then attribute contradictions
+    for kind in ("Location", "Timeline", "Attribute"):
+        for candidate, results in found.items():
+            if candidate[0] == kind:
+                contradictions.extend(results)
+    return contradictions
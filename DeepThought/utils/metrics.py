@@ -0,0 +1,38 @@
+# utils/metrics.py
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+STAGE_SECONDS = Histogram(
+    "deepthought_ui_stage_seconds",
+    "Duration of frontend stages: backend calls and graph rendering",
+    ["stage", "endpoint"],
+    buckets=STAGE_BUCKETS,
+)
+
+@contextmanager
+def timed(stage, endpoint=""):
+    """Time a frontend stage, e.g. timed("backend", "chat_bot") or timed("render_graph")"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage=stage, endpoint=endpoint).observe(time.perf_counter() - start)
+
+def render_metrics():
+    """Prometheus exposition, aggregated across workers if PROMETHEUS_MULTIPROC_DIR is set"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
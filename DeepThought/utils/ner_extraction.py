@@ -1,67 +1,306 @@
 # utils/ner_extraction.py
-import spacy
-from spacy.pipeline import EntityRuler
+import os
 import re
+import json
+import threading
+from bisect import bisect_right
+from collections import defaultdict
 
-nlp = spacy.load("en_core_web_sm")
+MODEL_NAME = "en_core_web_sm"
+# Components NER doesn't need; excluded at load so they cost neither time nor memory.
+# The tagger and attribute_ruler stay: the ARTIFACT pattern matches on POS.
+EXCLUDED_COMPONENTS = ["parser", "lemmatizer"]
+# Characters per chunk handed to spaCy; well below nlp.max_length (1,000,000)
+CHUNK_CHARS = int(os.getenv("NER_CHUNK_CHARS", "20000"))
+# Chunks per nlp.pipe batch, and worker processes (1 = in-process)
+BATCH_SIZE = int(os.getenv("NER_BATCH_SIZE", "8"))
+N_PROCESS = int(os.getenv("NER_PROCESSES", "1"))
+CONTEXT_CHARS = 50
 
-# Add custom entity patterns for fiction-specific elements
-# New SpaCy API requires adding the ruler with a name
-if "entity_ruler" not in nlp.pipe_names:
-    ruler = nlp.add_pipe("entity_ruler", before="ner")
-else:
-    ruler = nlp.get_pipe("entity_ruler")
+ENTITY_LABELS = {"PERSON", "ORG", "GPE", "LOC", "EVENT", "WORK_OF_ART", "DATE", "TIME", "ABILITY", "SPECIES", "ARTIFACT"}
 
+# Custom entity patterns for fiction-specific elements
 patterns = [
     {"label": "ABILITY", "pattern": [{"LOWER": {"IN": ["telekinesis", "telepathy", "invisibility", "flight"]}}]},
     {"label": "SPECIES", "pattern": [{"LOWER": {"IN": ["elf", "dwarf", "alien", "vampire", "werewolf"]}}]},
     {"label": "ARTIFACT", "pattern": [{"LOWER": {"IN": ["sword", "ring", "wand", "amulet"]}}, {"LOWER": "of"}, {"POS": "PROPN"}]}
 ]
-ruler.add_patterns(patterns)
+
+_nlp = None
+_nlp_lock = threading.Lock()
+
+def get_nlp():
+    """The spaCy pipeline for NER, loaded on first use"""
+    global _nlp
+    if _nlp is None:
+        with _nlp_lock:
+            if _nlp is None:
+                import spacy
+
+                nlp = spacy.load(MODEL_NAME, exclude=EXCLUDED_COMPONENTS)
+                # New SpaCy API requires adding the ruler with a name
+                if "entity_ruler" not in nlp.pipe_names:
+                    ruler = nlp.add_pipe("entity_ruler", before="ner")
+                else:
+                    ruler = nlp.get_pipe("entity_ruler")
+                ruler.add_patterns(patterns)
+                _nlp = nlp
+    return _nlp
+
+# Preferred places to end a chunk, best first, so entities aren't cut in half
+_BOUNDARIES = ("\n\n", "\n", ". ", " ")
+
+def _split_point(buffer, limit):
+    for boundary in _BOUNDARIES:
+        cut = buffer.rfind(boundary, limit // 2, limit)
+        if cut != -1:
+            return cut + len(boundary)
+    return limit
+
+def iter_text_chunks(text, chunk_chars=CHUNK_CHARS):
+    """Yield (offset, chunk) pieces of at most chunk_chars characters.
+
+    `text` is a string or an iterable of consecutive strings (e.g. a file read
+    in blocks); offsets are positions in their concatenation. Chunks end at
+    paragraph, line, sentence or word boundaries where possible.
+    """
+    pieces = [text] if isinstance(text, str) else text
+    buffer, offset = "", 0
+    for piece in pieces:
+        buffer += piece
+        while len(buffer) >= chunk_chars:
+            cut = _split_point(buffer, chunk_chars)
+            yield offset, buffer[:cut]
+            buffer, offset = buffer[cut:], offset + cut
+    if buffer:
+        yield offset, buffer
+
+def stream_entities(text, chunk_chars=CHUNK_CHARS, batch_size=BATCH_SIZE, n_process=N_PROCESS):
+    """Yield entities from text of any length with bounded memory.
+
+    Chunks are run through nlp.pipe (optionally over several processes). Each
+    entity carries global character offsets 'start' and 'end' into the full
+    text, plus up to CONTEXT_CHARS of surrounding context.
+    """
+    nlp = get_nlp()
+    docs = nlp.pipe(
+        ((chunk, offset) for offset, chunk in iter_text_chunks(text, chunk_chars)),
+        as_tuples=True,
+        batch_size=batch_size,
+        n_process=n_process,
+    )
+    for doc, offset in docs:
+        chunk = doc.text
+        for ent in doc.ents:
+            if ent.label_ in ENTITY_LABELS:
+                yield {
+                    "type": ent.label_,
+                    "name": ent.text,
+                    "start": offset + ent.start_char,
+                    "end": offset + ent.end_char,
+                    "context": chunk[max(0, ent.start_char - CONTEXT_CHARS):ent.end_char + CONTEXT_CHARS]
+                }
 
 def extract_entities_from_text(text):
-    doc = nlp(text)
-    entities = []
-    
-    # Extract standard named entities
-    for ent in doc.ents:
-        if ent.label_ in ["PERSON", "ORG", "GPE", "LOC", "EVENT", "WORK_OF_ART", "DATE", "TIME", "ABILITY", "SPECIES", "ARTIFACT"]:
-            entities.append({
-                "type": ent.label_, 
-                "name": ent.text,
-                "context": text[max(0, ent.start_char-50):min(len(text), ent.end_char+50)]
-            })
+    entities = list(stream_entities(text))
     
     # Extract relationships using simple patterns (to be expanded)
-    relationships = extract_relationships(text)
+    relationships = extract_relationships(text, entities)
     
     return {"entities": entities, "relationships": relationships}
 
-def extract_relationships(text):
-    relationships = []
-    
-    # Simple patterns for character relationships
-    family_patterns = [
-        (r"(\w+) is the (father|mother|brother|sister|son|daughter) of (\w+)", "FAMILY"),
-        (r"(\w+) and (\w+) are (married|siblings|cousins|enemies|allies)", "RELATION")
-    ]
-    
-    for pattern, rel_type in family_patterns:
-        matches = re.finditer(pattern, text, re.IGNORECASE)
-        for match in matches:
-            if rel_type == "FAMILY":
-                entity1, relation, entity2 = match.groups()
-                relationships.append({
-                    "source": entity1,
-                    "relation": relation,
-                    "target": entity2
-                })
-            else:
-                entity1, entity2, relation = match.groups()
-                relationships.append({
-                    "source": entity1,
-                    "relation": relation,
-                    "target": entity2
-                })
-    
-    return relationships
\ No newline at end of file
+# Relation pattern registry. Patterns are regexes over raw text with {source}
+# and {target} placeholders for entity names and a named 'relation' group;
+# they match case-insensitively, like the original patterns, except for the
+# names: a placeholder matches a run of up to four capitalized words, so
+# ordinary words ("and", "then") never become part of a name. Each endpoint
+# is then resolved to the NER entity at its keyword side (see
+# RelationExtractor.extract).
+ENTITY_NAME = r"(?-i:[A-Z][\w'-]*+(?:[ ][A-Z][\w'-]*+){0,3})"
+# The scan: a run of capitalized words and the word after it, if any
+_NAME_RUN = re.compile(r"\b[A-Z][\w'-]*+(?:[ ][A-Z][\w'-]*+)*+(?:(?=[ ]+([\w'-]+)))?")
+# Patterns starting "{source} keyword " are looked up by their keyword
+_KEYWORD_ANCHOR = re.compile(r"\{source\}[ ]([A-Za-z]+)[ ]")
+
+DEFAULT_RELATION_PATTERNS = [
+    {"type": "FAMILY", "pattern": r"{source} is the (?P<relation>father|mother|brother|sister|son|daughter) of {target}"},
+    {"type": "RELATION", "pattern": r"{source} and {target} are (?P<relation>married|siblings|cousins|enemies|allies)"}
+]
+
+# Sentence-opening adverbs that spaCy does not count as stop words
+_NARRATIVE_WORDS = {"later", "suddenly", "finally", "yesterday", "today", "tomorrow", "soon", "eventually", "meanwhile"}
+_stop_words = None
+
+def _get_stop_words():
+    global _stop_words
+    if _stop_words is None:
+        try:
+            from spacy.lang.en.stop_words import STOP_WORDS
+            _stop_words = STOP_WORDS | _NARRATIVE_WORDS
+        except ImportError:
+            _stop_words = frozenset(_NARRATIVE_WORDS)
+    return _stop_words
+
+def _trim_name(name, keep_end):
+    # Without NER: the non-stop-word run next to the relation keyword
+    # ("Then John" -> "John"), else the single word next to it
+    words = name.split(" ")
+    stop_words = _get_stop_words()
+    ordered = words[::-1] if keep_end else words
+    run = []
+    for word in ordered:
+        if word.lower() in stop_words:
+            break
+        run.append(word)
+    if not run:
+        return ordered[0]
+    return " ".join(run[::-1] if keep_end else run)
+
+class RelationExtractor:
+    """Extracts relationships with every registered pattern in a single scan.
+
+    The text is scanned once for runs of capitalized words (candidate
+    sources). Patterns of the form "{source} keyword ..." (all the defaults)
+    are indexed by that keyword, so at each run only the patterns whose
+    keyword follows it are tried: the scan costs the same however many
+    relation types there are. Other patterns are matched by one combined
+    alternation. Relationships of different types that overlap in the text
+    are all found.
+    """
+
+    def __init__(self, relation_patterns=None):
+        self.relation_patterns = []
+        self._compiled = None
+        for entry in relation_patterns or []:
+            self.register(entry["type"], entry["pattern"])
+
+    @classmethod
+    def from_json(cls, path):
+        """Load a registry: a JSON list of {"type": ..., "pattern": ...} objects"""
+        with open(path, 'r') as f:
+            return cls(json.load(f))
+
+    def register(self, rel_type, pattern):
+        """Add a relation pattern; it must use {source}, {target} and (?P<relation>...)"""
+        if "{source}" not in pattern or "{target}" not in pattern or "(?P<relation>" not in pattern:
+            raise ValueError(f"Relation pattern for {rel_type} needs {{source}}, {{target}} and a 'relation' group")
+        self.relation_patterns.append({"type": rel_type, "pattern": pattern})
+        self._compiled = None
+
+    def _compile(self):
+        # (regexes, keyword -> pattern indices, alternation of the other patterns)
+        if self._compiled is None:
+            regexes, by_keyword, other = [], defaultdict(list), []
+            for index, entry in enumerate(self.relation_patterns):
+                pattern = entry["pattern"]
+                # A placeholder that ends the pattern has its keyword before it,
+                # so its start is the side to resolve; otherwise its end
+                keep_end = {
+                    "source": not pattern.endswith("{source}"),
+                    "target": not pattern.endswith("{target}"),
+                }
+                body = (pattern
+                        .replace("{source}", f"(?P<source>{ENTITY_NAME})")
+                        .replace("{target}", f"(?P<target>{ENTITY_NAME})"))
+                regexes.append((re.compile(body + r"\b", re.IGNORECASE), keep_end))
+                anchor = _KEYWORD_ANCHOR.match(pattern)
+                if anchor:
+                    by_keyword[anchor.group(1).lower()].append(index)
+                else:
+                    # Group names must be unique across the alternation; the
+                    # pattern's own regex extracts the groups once it's found
+                    body = (pattern
+                            .replace("{source}", ENTITY_NAME)
+                            .replace("{target}", ENTITY_NAME)
+                            .replace("(?P<relation>", "(?:"))
+                    other.append(f"(?P<p{index}>{body})")
+            # Zero-width, so a match doesn't hide overlapping ones
+            other = re.compile(r"\b(?=" + "|".join(other) + r"\b)", re.IGNORECASE) if other else None
+            self._compiled = (regexes, dict(by_keyword), other)
+        return self._compiled
+
+    @staticmethod
+    def _endpoint(match, group, keep_end, spans, starts):
+        # The entity covering the endpoint's character next to the relation
+        # keyword, found by bisecting the sorted entity starts
+        start, end = match.span(group)
+        position = end - 1 if keep_end else start
+        i = bisect_right(starts, position) - 1
+        if i >= 0 and spans[i][1] > position:
+            return spans[i][2]
+        return _trim_name(match.group(group), keep_end)
+
+    def _keyword_matches(self, text, regexes, by_keyword):
+        for run in _NAME_RUN.finditer(text):
+            # The run's words and the word after it; any of them after the
+            # first may be a keyword ("Mary Is the sister of ...")
+            words = run.group().split(" ")
+            offsets = [run.start()]
+            for word in words[:-1]:
+                offsets.append(offsets[-1] + len(word) + 1)
+            if run.group(1):
+                words.append(run.group(1))
+            tried = set()
+            for j in range(1, len(words)):
+                for index in by_keyword.get(words[j].lower(), ()):
+                    # A name is at most four words
+                    start = offsets[max(0, j - 4)]
+                    if (index, start) in tried:
+                        continue
+                    tried.add((index, start))
+                    match = regexes[index][0].match(text, start)
+                    if match:
+                        yield index, match
+
+    def _other_matches(self, text, regexes, other):
+        for found in other.finditer(text):
+            for name, value in found.groupdict().items():
+                if value is not None:
+                    index = int(name[1:])
+                    yield index, regexes[index][0].match(text, found.start())
+                    break
+
+    def extract(self, text, entities=None):
+        """Relationships in text (a string or an already-parsed spaCy Doc).
+
+        Endpoints are resolved to the NER entities at their keyword side, from
+        `entities` (dicts with 'start', 'end' and 'name', as stream_entities
+        yields) or the Doc's own; without one there, to the name run with any
+        stop words ("Then") next to it removed.
+        """
+        if entities is None and hasattr(text, "ents"):
+            entities = [{"start": e.start_char, "end": e.end_char, "name": e.text} for e in text.ents]
+        text = getattr(text, "text", text)
+        if not self.relation_patterns:
+            return []
+        spans = sorted((e["start"], e["end"], e["name"]) for e in entities or [])
+        starts = [span[0] for span in spans]
+        regexes, by_keyword, other = self._compile()
+        matches = list(self._keyword_matches(text, regexes, by_keyword))
+        if other is not None:
+            matches.extend(self._other_matches(text, regexes, other))
+        relationships = []
+        for index, match in matches:
+            keep_end = regexes[index][1]
+            relationships.append({
+                "source": self._endpoint(match, "source", keep_end["source"], spans, starts),
+                "relation": match.group("relation").lower(),
+                "target": self._endpoint(match, "target", keep_end["target"], spans, starts),
+                "type": self.relation_patterns[index]["type"],
+                "start": match.start()
+            })
+        relationships.sort(key=lambda r: r["start"])
+        return relationships
+
+_relation_extractor = None
+
+def get_relation_extractor():
+    """The shared extractor: RELATION_PATTERNS_FILE if set, else the defaults"""
+    global _relation_extractor
+    if _relation_extractor is None:
+        path = os.getenv("RELATION_PATTERNS_FILE")
+        _relation_extractor = RelationExtractor.from_json(path) if path else RelationExtractor(DEFAULT_RELATION_PATTERNS)
+    return _relation_extractor
+
+def extract_relationships(text, entities=None):
+    return get_relation_extractor().extract(text, entities)
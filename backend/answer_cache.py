@@ -0,0 +1,125 @@
+# answer_cache.py
+import os
+import re
+import json
+import hashlib
+import time
+from typing import List, Optional, Dict, Any
+
+import numpy as np
+
+# Cosine similarity a new question must reach to reuse a cached answer
+SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "256"))
+
+# Words that make a question lean on the previous exchanges ("what about her?")
+FOLLOW_UP_PATTERN = re.compile(
+    r"\b(he|she|they|him|her|them|his|hers|their|it|its|that|this|those|these|"
+    r"earlier|previous|previously|above|again|else|also)\b|^\s*(and|but|so|what about)\b",
+    re.IGNORECASE,
+)
+
+
+def is_follow_up(question: str) -> bool:
+    """Return True if the question probably depends on the conversation so far."""
+    return bool(FOLLOW_UP_PATTERN.search(question))
+
+
+def conversation_key(question: str, conversation_history: List) -> str:
+    """Key describing the conversation state an answer was produced in.
+
+    Standalone questions share one key so repeats hit the cache across sessions;
+    follow-up questions are keyed by the exact history they were asked after.
+    """
+    if not conversation_history or not is_follow_up(question):
+        return ""
+    serialized = json.dumps(conversation_history, sort_keys=True)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+class SemanticAnswerCache:
+    def __init__(
+        self,
+        cache_path: str,
+        universe_version: int,
+        threshold: float = SIMILARITY_THRESHOLD,
+        max_entries: int = MAX_ENTRIES,
+    ):
+        """Cache of chat answers for one universe, matched by question embedding.
+
+        Args:
+            cache_path: JSON file the cache is persisted to
+            universe_version: Version of the universe's file set; entries written
+                for any other version are discarded on load
+            threshold: Minimum cosine similarity for a cache hit
+            max_entries: Oldest entries are evicted beyond this size
+        """
+        self.cache_path = cache_path
+        self.universe_version = universe_version
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.entries = self._load()
+
+    def _load(self) -> List[Dict[str, Any]]:
+        try:
+            with open(self.cache_path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return []
+        if data.get("universe_version") != self.universe_version:
+            return []
+        return data.get("entries", [])
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        with open(self.cache_path, "w") as f:
+            json.dump(
+                {"universe_version": self.universe_version, "entries": self.entries}, f
+            )
+
+    def lookup(
+        self, question_vector: List[float], history_key: str = ""
+    ) -> Optional[Dict[str, Any]]:
+        """Return the closest cached entry above the threshold, or None."""
+        candidates = [e for e in self.entries if e["history_key"] == history_key]
+        if not candidates:
+            return None
+
+        query = np.asarray(question_vector, dtype=np.float32)
+        matrix = np.asarray([e["vector"] for e in candidates], dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+        similarities = matrix @ query / np.maximum(norms, 1e-12)
+
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+        return candidates[best]
+
+    def store(
+        self,
+        question: str,
+        question_vector: List[float],
+        history_key: str,
+        answer: str,
+        sources: List[Dict[str, Any]],
+    ):
+        """Add an answer to the cache and persist it."""
+        self.entries.append(
+            {
+                "question": question,
+                "vector": [float(x) for x in question_vector],
+                "history_key": history_key,
+                "answer": answer,
+                "sources": sources,
+                "created": time.time(),
+            }
+        )
+        if len(self.entries) > self.max_entries:
+            self.entries = self.entries[-self.max_entries :]
+        self._save()
+
+    def clear(self):
+        """Drop every cached answer, e.g. after the universe's files changed."""
+        self.entries = []
+        if os.path.exists(self.cache_path):
+            os.remove(self.cache_path)
@@ -1,12 +1,15 @@
 # app.py
 import os
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
 import io
 from utils import load_text_from_file, ensure_upload_folder, UPLOAD_FOLDER
-from processing import analyze_text
-from fin import file_deleted, folder_deleted, file_uploaded, chat_bot, analysis
+from metrics import render_metrics
+
+# processing and fin are imported inside the routes that need them: they pull in
+# LangChain, FAISS and the embedding model, which workers should not pay for at
+# startup or on lightweight routes such as / and /folder_deleted.
 
 load_dotenv()  # Load environment variables from .env
 
@@ -17,6 +20,19 @@ app.config["MAX_CONTENT_LENGTH"] = 50 * 1024 * 1024  # 50 MB limit (adjust as ne
 ALLOWED_EXTENSIONS = {"txt"}
 
 
+def warm_up():
+    """Load models and LLM clients ahead of the first request.
+
+    Optional: called at startup when DEEPTHOUGHT_WARMUP is set, or from a
+    server hook such as gunicorn's post_fork.
+    """
+    import fin
+    import processing
+
+    fin.warm_up()
+    processing.warm_up()
+
+
 def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -125,6 +141,8 @@ def analyze_fiction_api():
     )
 
     try:
+        from processing import analyze_text
+
         # Perform the analysis using the processing module on the combined text
         analysis_results = analyze_text(final_text_content)
         print(f"Analysis finished for combined content.")
@@ -156,12 +174,21 @@ def home():
     )
 
 
+@app.route("/metrics", methods=["GET"])
+def metrics_api():
+    """Prometheus scrape endpoint with per-stage timings and LLM token counts"""
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+
 @app.route("/file_deleted", methods=["POST"])
 def file_deleted_api():
     data = request.get_json()
-    file_id = data.get("file_name")
-    user_id = data.get("folder_path")
-    result = file_deleted(file_id, user_id)
+    file_name = data.get("file_name")
+    folder_path = data.get("folder_path")
+    from fin import file_deleted
+
+    result = file_deleted(folder_path, file_name)
     return jsonify(result)
 
 
@@ -169,6 +196,8 @@ def file_deleted_api():
 def folder_deleted_api():
     data = request.get_json()
     folder_id = data.get("folder_path")
+    from fin import folder_deleted
+
     result = folder_deleted(folder_id)
     return jsonify(result)
 
@@ -179,7 +208,43 @@ def file_uploaded_api():
     file_id = data.get("folder_path")
     user_id = data.get("file_name")
     print(file_id, user_id)
-    result = file_uploaded(file_id, user_id)
+    from fin import file_uploaded
+
+    result = file_uploaded(file_id, user_id, data.get("local_graph", False))
+    return jsonify(result)
+
+
+@app.route("/files_uploaded", methods=["POST"])
+def files_uploaded_api():
+    data = request.get_json()
+    folder_path = data.get("folder_path")
+    file_names = data.get("file_names", [])
+    print(folder_path, file_names)
+    from fin import files_uploaded
+
+    result = files_uploaded(folder_path, file_names, data.get("local_graph", False))
+    return jsonify(result)
+
+
+@app.route("/refine_graph", methods=["POST"])
+def refine_graph_api():
+    data = request.get_json()
+    candidates = data.get("candidates", {"nodes": [], "edges": []})
+    from fin import refine_graph
+
+    result = refine_graph(candidates)
+    return jsonify(result)
+
+
+@app.route("/set_precedence", methods=["POST"])
+def set_precedence_api():
+    data = request.get_json()
+    folder_path = data.get("folder_path")
+    order = data.get("order", [])
+    canonical = data.get("canonical", [])
+    from fin import set_precedence
+
+    result = set_precedence(folder_path, order, canonical)
     return jsonify(result)
 
 
@@ -189,6 +254,8 @@ def chat_bot_api():
     user_id = data.get("folder_path")
     message = data.get("message")
     print(user_id, message)
+    from fin import chat_bot
+
     result = chat_bot(user_id, message)
     print(result)
     return jsonify(result)
@@ -198,10 +265,15 @@ def chat_bot_api():
 def analysis_api():
     data = request.get_json()
     file_id = data.get("folder_path")
+    from fin import analysis
+
     result = analysis(file_id)
     return jsonify(result)
 
 
+if os.getenv("DEEPTHOUGHT_WARMUP"):
+    warm_up()
+
 if __name__ == "__main__":
     print("Starting Fictional Universe Consistency Kit API...")
     app.run(host="127.0.0.1", port=8000, debug=True)
@@ -0,0 +1,239 @@
+# benchmark.py
+"""Offline ingest/query benchmark for StoryVectorDatabase and analyze_text.
+
+Runs without a Gemini key: every LLM call goes to the local stand-in from
+fake_llm.py with a configurable latency distribution.
+
+    python benchmark.py --sizes 50000,200000,1000000 --latency lognormal:0.8,0.4
+    python benchmark.py --corpus pg1342.txt pg2701.txt --queries 50 --json out.json
+"""
+
+import os
+import io
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import contextlib
+from collections import defaultdict
+
+from fake_llm import FAKE_LLM_ENV
+
+NAMES = [
+    "Alaric",
+    "Brienne",
+    "Cassius",
+    "Delphine",
+    "Eamon",
+    "Fenna",
+    "Gideon",
+    "Hestia",
+]
+PLACES = ["Ravenmoor", "the Glass Citadel", "Saltmarsh", "the Ember Wastes", "Highkeep"]
+VERBS = ["travelled to", "fled from", "returned to", "spoke of", "defended", "burned"]
+TIMES = ["At dawn", "Years later", "On the third day", "That winter", "Before the war"]
+QUESTIONS = [
+    "Who is the main character?",
+    "Where did {name} travel after the war?",
+    "When did {name} return to {place}?",
+    "Is there a contradiction in where {name} was?",
+    "What happened at {place}?",
+    "Who did {name} speak of before the war?",
+]
+
+
+def synthetic_text(size: int, seed: int) -> str:
+    """Deterministic story-like text of roughly `size` characters."""
+    rng = random.Random(seed)
+    paragraphs = []
+    length = 0
+    while length < size:
+        sentences = [
+            f"{rng.choice(TIMES)}, {rng.choice(NAMES)} {rng.choice(VERBS)} {rng.choice(PLACES)}."
+            for _ in range(rng.randint(3, 8))
+        ]
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        length += len(paragraph) + 2
+    return "\n\n".join(paragraphs)[:size]
+
+
+def corpus_text(paths, size: int) -> str:
+    """First `size` characters of the given .txt files, repeated if too short."""
+    texts = []
+    for path in paths:
+        files = (
+            [
+                os.path.join(path, f)
+                for f in sorted(os.listdir(path))
+                if f.endswith(".txt")
+            ]
+            if os.path.isdir(path)
+            else [path]
+        )
+        for file_path in files:
+            with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+                texts.append(f.read())
+    combined = "\n\n".join(texts)
+    if not combined:
+        raise ValueError("Corpus is empty")
+    while len(combined) < size:
+        combined += "\n\n" + combined
+    return combined[:size]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+class SpanCollector:
+    """Timing listener that sums span durations by stage name."""
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    def __call__(self, name, seconds, labels):
+        self.totals[name] += seconds
+        self.counts[name] += 1
+
+    def reset(self):
+        self.totals.clear()
+        self.counts.clear()
+
+
+def run_size(size, args, collector, quiet):
+    import fin
+    import processing
+
+    text = (
+        corpus_text(args.corpus, size)
+        if args.corpus
+        else synthetic_text(size, args.seed)
+    )
+    workspace = tempfile.mkdtemp(prefix="deepthought-bench-")
+    universe_dir = os.path.join(workspace, "universe")
+    os.makedirs(universe_dir)
+    with open(os.path.join(universe_dir, "bench.txt"), "w", encoding="utf-8") as f:
+        f.write(text)
+
+    previous_cwd = os.getcwd()
+    os.chdir(workspace)  # StoryVectorDatabase stores its data under ./data
+    result = {"size": size}
+    try:
+        collector.reset()
+        start = time.perf_counter()
+        with quiet():
+            story_db = fin.StoryVectorDatabase(universe_dir)
+            story_db.process_file("bench.txt")
+        result["ingest_total"] = time.perf_counter() - start
+        result["chunks"] = len(story_db.vector_store.index_to_docstore_id)
+        result["ingest"] = dict(collector.totals)
+
+        # Measure retrieval + generation, not the answer cache
+        story_db.answer_cache.threshold = float("inf")
+        rng = random.Random(args.seed)
+        latencies = []
+        for _ in range(args.queries):
+            question = rng.choice(QUESTIONS).format(
+                name=rng.choice(NAMES), place=rng.choice(PLACES)
+            )
+            start = time.perf_counter()
+            with quiet():
+                story_db.query(question, use_conversation_history=False)
+            latencies.append(time.perf_counter() - start)
+        result["query_p50"] = percentile(latencies, 50)
+        result["query_p99"] = percentile(latencies, 99)
+
+        if not args.skip_analyze:
+            collector.reset()
+            start = time.perf_counter()
+            with quiet():
+                processing.analyze_text(text)
+            result["analyze_total"] = time.perf_counter() - start
+            result["analyze"] = dict(collector.totals)
+    finally:
+        os.chdir(previous_cwd)
+        shutil.rmtree(workspace, ignore_errors=True)
+    return result
+
+
+def print_report(results):
+    stages = ["split", "embed", "index", "llm", "save"]
+    header = ["chars", "chunks"] + stages
+    header += ["chunks/s", "ingest", "q_p50", "q_p99", "analyze"]
+    print(" ".join(f"{h:>10}" for h in header))
+    for r in results:
+        row = [f"{r['size']:>10}", f"{r['chunks']:>10}"]
+        row += [f"{r['ingest'].get(s, 0.0):>10.3f}" for s in stages]
+        embed_seconds = r["ingest"].get("embed", 0.0)
+        row += [
+            f"{r['chunks'] / embed_seconds if embed_seconds else 0.0:>10.1f}",
+            f"{r['ingest_total']:>10.3f}",
+            f"{r['query_p50']:>10.3f}",
+            f"{r['query_p99']:>10.3f}",
+            f"{r['analyze_total']:>10.3f}" if "analyze_total" in r else f"{'-':>10}",
+        ]
+        print(" ".join(row))
+    print("(all timings in seconds)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--corpus", nargs="*", help=".txt files or folders (default: synthetic text)"
+    )
+    parser.add_argument(
+        "--sizes",
+        default="20000,100000,500000",
+        help="Comma-separated corpus sizes in characters",
+    )
+    parser.add_argument(
+        "--queries", type=int, default=20, help="Queries per corpus size"
+    )
+    parser.add_argument(
+        "--latency",
+        default="fixed:0",
+        help="Stand-in LLM latency, e.g. lognormal:0.8,0.4",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--skip-analyze", action="store_true", help="Skip processing.analyze_text"
+    )
+    parser.add_argument("--json", help="Also write raw results to this file")
+    parser.add_argument(
+        "--verbose", action="store_true", help="Keep the pipeline's own prints"
+    )
+    args = parser.parse_args()
+
+    # Must be set before fin/processing are imported
+    os.environ[FAKE_LLM_ENV] = args.latency
+    import timing
+
+    def quiet():
+        if args.verbose:
+            return contextlib.nullcontext()
+        return contextlib.redirect_stdout(io.StringIO())
+
+    collector = SpanCollector()
+    timing.add_listener(collector)
+    results = [
+        run_size(int(size), args, collector, quiet) for size in args.sizes.split(",")
+    ]
+    timing.remove_listener(collector)
+
+    print_report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# chunking.py
+import hashlib
+import re
+import zlib
+from typing import Any, Dict, List
+
+# Chunk sizes in characters; chunks end at sentence or paragraph breaks
+MIN_CHUNK = 500
+MAX_CHUNK = 1500
+# A break past MIN_CHUNK ends a chunk when the hash of the text before it is
+# divisible by DIVISOR, i.e. on average at every DIVISOR-th candidate break
+DIVISOR = 4
+# Characters before a break that decide whether it is a cut
+WINDOW = 64
+# Sections (runs of chunks analysed together) in characters; a chunk ends a
+# section past SECTION_MIN when its hash is divisible by SECTION_DIVISOR
+SECTION_MIN = 8000
+SECTION_MAX = 24000
+SECTION_DIVISOR = 4
+
+# Candidate breaks: blank lines, line ends, and sentence ends (with any
+# closing quotes or brackets) followed by whitespace
+_BREAK = re.compile(r"\n\s*\n|(?<=[.!?])[\"'”’)\]]*\s+|\n")
+
+
+def chunk_hash(text: str) -> str:
+    """Stable short hash of a chunk's text (the same across processes and runs)."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def _is_cut(text: str, end: int, window: int, divisor: int) -> bool:
+    # crc32 rather than hash(), which is salted per process
+    return zlib.crc32(text[max(0, end - window) : end].encode("utf-8")) % divisor == 0
+
+
+def _forced_cut(text: str, start: int, min_size: int, max_size: int) -> int:
+    # No break in range: end at the last space, or mid-word as a last resort
+    space = text.rfind(" ", start + min_size, start + max_size)
+    return space + 1 if space != -1 else start + max_size
+
+
+def chunk_text(
+    text: str,
+    min_size: int = MIN_CHUNK,
+    max_size: int = MAX_CHUNK,
+    divisor: int = DIVISOR,
+    window: int = WINDOW,
+) -> List[Dict[str, Any]]:
+    """Split text into content-defined chunks.
+
+    Whether a break ends a chunk depends only on the text just before it, so
+    an edit changes the chunks around it and boundaries elsewhere stay put:
+    unchanged passages produce the same chunks, with the same hashes, as
+    before the edit.
+
+    Returns:
+        [{"text": ..., "start": offset in text, "hash": chunk_hash(text)}, ...]
+        in text order, skipping whitespace-only pieces.
+    """
+    ends = []
+    start, fallback = 0, None
+    for match in _BREAK.finditer(text):
+        end = match.end()
+        while end - start > max_size:
+            cut = fallback or _forced_cut(text, start, min_size, max_size)
+            ends.append(cut)
+            start, fallback = cut, None
+        if end - start < min_size:
+            continue
+        if _is_cut(text, end, window, divisor):
+            ends.append(end)
+            start, fallback = end, None
+        else:
+            # Where to cut if the chunk reaches max_size before a chosen break
+            fallback = end
+    while len(text) - start > max_size:
+        cut = fallback or _forced_cut(text, start, min_size, max_size)
+        ends.append(cut)
+        start, fallback = cut, None
+    ends.append(len(text))
+
+    chunks = []
+    start = 0
+    for end in ends:
+        piece = text[start:end]
+        if piece.strip():
+            chunks.append({"text": piece, "start": start, "hash": chunk_hash(piece)})
+        start = end
+    return chunks
+
+
+def group_chunks(
+    chunks: List[Dict[str, Any]],
+    min_size: int = SECTION_MIN,
+    max_size: int = SECTION_MAX,
+    divisor: int = SECTION_DIVISOR,
+) -> List[List[int]]:
+    """Group consecutive chunks into content-defined sections.
+
+    Like chunk boundaries, section boundaries depend only on the chunks'
+    hashes, so an edit changes the section it falls in and leaves the others
+    as they were.
+
+    Returns:
+        Lists of chunk indices, in text order.
+    """
+    sections, current, size = [], [], 0
+    for i, chunk in enumerate(chunks):
+        if current and size + len(chunk["text"]) > max_size:
+            sections.append(current)
+            current, size = [], 0
+        current.append(i)
+        size += len(chunk["text"])
+        if size >= min_size and int(chunk["hash"], 16) % divisor == 0:
+            sections.append(current)
+            current, size = [], 0
+    if current:
+        sections.append(current)
+    return sections
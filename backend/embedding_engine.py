@@ -0,0 +1,111 @@
+# embedding_engine.py
+import os
+import atexit
+import logging
+import threading
+import time
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from metrics import record_embedding_batch
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+# Texts per forward pass; larger batches amortize tokenizer/model overhead on CPU
+BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# Server worker processes on this machine (gunicorn reads the same variable);
+# each starts its own pool, so they split the CPU cores between them
+SERVER_WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+# Embedding processes per server worker for large jobs; defaults to this
+# worker's share of the CPU cores, 1 disables the pool
+PROCESSES = int(
+    os.getenv("EMBED_PROCESSES", str(max(1, (os.cpu_count() or 1) // SERVER_WORKERS)))
+)
+# Jobs smaller than this are embedded in-process; the pool's IPC isn't worth it
+MULTI_PROCESS_MIN_TEXTS = int(os.getenv("EMBED_MULTI_PROCESS_MIN", "256"))
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingEngine(Embeddings):
+    """Batched sentence-transformers embeddings with an optional CPU process pool.
+
+    Drop-in replacement for HuggingFaceEmbeddings (same model, same vectors),
+    so existing FAISS indexes stay valid. Large document batches are spread
+    over a multi-process pool; queries are always embedded in-process.
+    """
+
+    def __init__(
+        self,
+        model_name: str = MODEL_NAME,
+        batch_size: int = BATCH_SIZE,
+        processes: int = PROCESSES,
+        multi_process_min_texts: int = MULTI_PROCESS_MIN_TEXTS,
+    ):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.batch_size = batch_size
+        self.processes = processes
+        self.multi_process_min_texts = multi_process_min_texts
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        # Running totals for throughput reporting
+        self.chunks_embedded = 0
+        self.seconds_embedding = 0.0
+
+    def start_pool(self):
+        """Start the worker pool now instead of on the first large batch."""
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = self.model.start_multi_process_pool(
+                    target_devices=["cpu"] * self.processes
+                )
+                atexit.register(self.close)
+        return self._pool
+
+    def close(self):
+        """Stop the worker pool, if one was started."""
+        with self._pool_lock:
+            if self._pool is not None:
+                self.model.stop_multi_process_pool(self._pool)
+                self._pool = None
+
+    def _encode(self, texts: List[str]):
+        # Same preprocessing as HuggingFaceEmbeddings
+        texts = [text.replace("\n", " ") for text in texts]
+        if self.processes > 1 and len(texts) >= self.multi_process_min_texts:
+            return self.model.encode_multi_process(
+                texts, self.start_pool(), batch_size=self.batch_size
+            )
+        return self.model.encode(
+            texts, batch_size=self.batch_size, show_progress_bar=False
+        )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        start = time.perf_counter()
+        vectors = self._encode(texts)
+        elapsed = time.perf_counter() - start
+
+        self.chunks_embedded += len(texts)
+        self.seconds_embedding += elapsed
+        record_embedding_batch(len(texts), elapsed)
+        logger.debug(
+            "Embedded %d chunks in %.2fs (%.1f chunks/s)",
+            len(texts),
+            elapsed,
+            len(texts) / max(elapsed, 1e-9),
+        )
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        vectors = self.model.encode([text.replace("\n", " ")], show_progress_bar=False)
+        return vectors[0].tolist()
+
+    def throughput(self) -> float:
+        """Average document embedding throughput so far, in chunks per second."""
+        if not self.seconds_embedding:
+            return 0.0
+        return self.chunks_embedded / self.seconds_embedding
@@ -0,0 +1,198 @@
+# fake_llm.py
+import re
+import json
+import math
+import time
+import random
+import hashlib
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import SimpleChatModel
+from langchain_core.messages import BaseMessage
+from pydantic import PrivateAttr
+
+# Environment variable that swaps every Gemini client for the local stand-in,
+# e.g. DEEPTHOUGHT_FAKE_LLM="lognormal:0.8,0.4" or "fixed:0"
+FAKE_LLM_ENV = "DEEPTHOUGHT_FAKE_LLM"
+
+NAME_PATTERN = re.compile(r"\b[A-Z][a-z]{2,}\b")
+
+
+def parse_latency_spec(spec: str):
+    """Parse a latency distribution spec into (kind, params).
+
+    Supported forms: "fixed:S", "uniform:LOW,HIGH", "normal:MEAN,STDDEV" and
+    "lognormal:MEDIAN,SIGMA", all in seconds.
+    """
+    kind, _, raw_params = spec.partition(":")
+    params = [float(p) for p in raw_params.split(",") if p.strip()] or [0.0]
+    expected = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+    if kind not in expected or len(params) != expected[kind]:
+        raise ValueError(f"Invalid latency spec '{spec}'")
+    return kind, params
+
+
+def _names_in(prompt: str, limit: int) -> List[str]:
+    """Capitalized words from the prompt, most frequent first, for plausible output."""
+    counts = {}
+    for name in NAME_PATTERN.findall(prompt):
+        counts[name] = counts.get(name, 0) + 1
+    ranked = sorted(counts, key=lambda n: (-counts[n], n))
+    return ranked[:limit] or ["Narrator"]
+
+
+def _fake_knowledge_graph(names, digest):
+    nodes = [
+        {
+            "id": n,
+            "type": "Character",
+            "description": f"{n} ({digest})",
+            "confidence": 0.9,
+        }
+        for n in names
+    ]
+    edges = [
+        {
+            "source": a,
+            "target": b,
+            "relationship": "interacted_with",
+            "confidence": 0.8,
+        }
+        for a, b in zip(names, names[1:])
+    ]
+    return {"nodes": nodes, "edges": edges}
+
+
+def _fake_contradictions(names):
+    return [
+        {
+            "description": f"{names[0]} is placed in two locations at once.",
+            "conflicting_statements": [
+                f"'{names[0]} arrived.'",
+                f"'{names[0]} left.'",
+            ],
+            "confidence": 0.5,
+        }
+    ]
+
+
+def _fake_speculation(names):
+    return [
+        {
+            "element": f"{n}'s motives",
+            "category": "Speculation/Ambiguity",
+            "confidence": 0.7,
+        }
+        for n in names
+    ]
+
+
+def _fake_refinement(prompt):
+    """Keeps every candidate whose id looks like a name, at moderate confidence."""
+    start = prompt.find("Candidates:\n") + len("Candidates:\n")
+    end = prompt.rfind("JSON Refined Graph:")
+    try:
+        candidates = json.loads(prompt[start:end])
+    except ValueError:
+        candidates = {}
+    nodes = [
+        {
+            "id": node["id"],
+            "type": node.get("type", "Other"),
+            "description": node.get("description", ""),
+            "confidence": 0.75,
+            "keep": bool(NAME_PATTERN.match(node["id"])),
+        }
+        for node in candidates.get("nodes", [])
+    ]
+    edges = [
+        dict(edge, confidence=0.7, keep=True) for edge in candidates.get("edges", [])
+    ]
+    for edge in edges:
+        edge.pop("context", None)
+    return {"nodes": nodes, "edges": edges}
+
+
+def fake_response(prompt: str) -> str:
+    """Deterministic response shaped like what each prompt in the repo expects."""
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+    names = _names_in(prompt, 8)
+
+    if "JSON Refined Graph:" in prompt:
+        return json.dumps(_fake_refinement(prompt))
+    if "JSON Analysis Output:" in prompt:
+        return json.dumps(
+            {
+                "knowledge_graph": _fake_knowledge_graph(names, digest),
+                "contradictions": _fake_contradictions(names),
+                "speculation_boundaries": _fake_speculation(names),
+            }
+        )
+    if "JSON Output:" in prompt:
+        return json.dumps(_fake_knowledge_graph(names, digest))
+    if "JSON Contradiction List:" in prompt:
+        return json.dumps(_fake_contradictions(names))
+    if "JSON Speculation List:" in prompt:
+        return json.dumps(_fake_speculation(names))
+    if "POTENTIAL CONTRADICTIONS:" in prompt:
+        return "Potential contradictions:\n\n" + "\n".join(
+            f"**Contradiction:** {n} behaves inconsistently ({digest})."
+            for n in names[:3]
+        )
+
+    lines = "\n".join(f"*   **{n}:** mentioned in the provided text." for n in names)
+    return f"Stand-in response {digest}.\n\n{lines}"
+
+
+class FakeChatModel(SimpleChatModel):
+    """Local stand-in for ChatGoogleGenerativeAI used for offline benchmarking.
+
+    Responses are a deterministic function of the prompt; latency is drawn
+    from a seeded distribution so runs are reproducible.
+    """
+
+    latency: str = "fixed:0"
+    seed: int = 0
+    _rng: Any = PrivateAttr(default=None)
+
+    def model_post_init(self, __context: Any) -> None:
+        self._rng = random.Random(self.seed)
+        parse_latency_spec(self.latency)
+
+    @property
+    def _llm_type(self) -> str:
+        return "deepthought-fake"
+
+    def sample_latency(self) -> float:
+        kind, params = parse_latency_spec(self.latency)
+        if kind == "fixed":
+            value = params[0]
+        elif kind == "uniform":
+            value = self._rng.uniform(params[0], params[1])
+        elif kind == "normal":
+            value = self._rng.gauss(params[0], params[1])
+        else:
+            value = self._rng.lognormvariate(math.log(max(params[0], 1e-6)), params[1])
+        return max(value, 0.0)
+
+    def _call(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> str:
+        prompt = "\n".join(str(m.content) for m in messages)
+        time.sleep(self.sample_latency())
+        return fake_response(prompt)
+
+
+_fake_llms = {}
+
+
+def get_fake_llm(spec: str, seed: int = 0) -> FakeChatModel:
+    """Shared stand-in per spec, so latency samples follow one seeded sequence."""
+    key = (spec, seed)
+    if key not in _fake_llms:
+        _fake_llms[key] = FakeChatModel(latency=spec, seed=seed)
+    return _fake_llms[key]
@@ -1,27 +1,79 @@
 import os
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.docstore.document import Document
+import re
+import threading
 from typing import List, Optional, Dict, Any
 import json
-from dotenv import load_dotenv
-
-
-def get_llm():
-    load_dotenv()
-    google_api_key = os.getenv("GEMINI_API_KEY")
-    if not google_api_key:
-        raise EnvironmentError(
-            "GEMINI_API_KEY environment variable is not set. Please set it to use the LLM."
-        )
-
-    return ChatGoogleGenerativeAI(
-        model="gemini-2.0-flash",
-        google_api_key=google_api_key,
-        temperature=0.7,
-    )
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from answer_cache import SemanticAnswerCache, conversation_key
+from chunking import chunk_hash, chunk_text, group_chunks
+from metrics import record_llm_call
+from timing import span
+from vector_index import (
+    choose_index_kind,
+    index_kind,
+    migrate_vector_store,
+    remove_positions,
+    search_index,
+    search_ranges,
+    tombstones,
+    tune_index,
+)
+
+# Canonical-first retrieval: canon answers on its own when at least
+# CANON_MIN_HITS of its chunks reach CANON_SIMILARITY (cosine); otherwise all
+# chunks are ranked with similarity scaled by each file's precedence weight
+CANON_SIMILARITY = float(os.getenv("CANON_SIMILARITY", "0.6"))
+CANON_MIN_HITS = int(os.getenv("CANON_MIN_HITS", "2"))
+PRECEDENCE_STEP = 0.05
+MIN_PRECEDENCE_WEIGHT = 0.5
+# Candidates fetched per returned chunk before precedence re-ranking
+PRECEDENCE_FETCH_FACTOR = 4
+# File titles shorter than this ("a", "it") are common words, so a question
+# refers to them only by quoting them
+MIN_TITLE_LENGTH = 4
+
+# LangChain, FAISS and the embedding model are imported and built on first
+# use so that importing this module (and starting a worker) stays cheap.
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def _get_shared(name, factory):
+    """Return a process-wide object, creating it with factory() on first use."""
+    if name not in _shared:
+        with _shared_lock:
+            if name not in _shared:
+                _shared[name] = factory()
+    return _shared[name]
+
+
+def _create_embeddings():
+    from embedding_engine import EmbeddingEngine
+
+    # Batched all-MiniLM-L6-v2 (good for semantic search) with a CPU process pool
+    return EmbeddingEngine()
+
+
+def _faiss():
+    from langchain_community.vectorstores import FAISS
+
+    return FAISS
+
+
+def warm_up():
+    """Load the embedding model and vector store code ahead of the first request."""
+    embeddings = _get_shared("embeddings", _create_embeddings)
+    if embeddings.processes > 1:
+        embeddings.start_pool()
+    _faiss()
+
+
+def get_llm(universe: Optional[str] = None):
+    """A chat model whose calls go through the shared gateway, counted against `universe`."""
+    from llm_gateway import gateway
+
+    return gateway.llm(universe)
 
 
 def _extract_content_from_response(response_obj):
@@ -38,6 +90,25 @@ def _extract_content_from_response(response_obj):
         return str(response_obj)
 
 
+def _invoke_llm(llm, prompt: str, call: str):
+    """Invoke the LLM for a named call, recording its latency and token usage."""
+    with span("llm", call=call):
+        response = llm.invoke(prompt)
+    record_llm_call(call, prompt, response)
+    return response
+
+
+def _position_ranges(positions: List[int]) -> List[List[int]]:
+    """Sorted index positions as [start, end) ranges of consecutive positions."""
+    ranges = []
+    for position in positions:
+        if ranges and ranges[-1][1] == position:
+            ranges[-1][1] = position + 1
+        else:
+            ranges.append([position, position + 1])
+    return ranges
+
+
 class StoryVectorDatabase:
     def __init__(self, folder_path: str):
         """Initialize the story vector database for a specific folder.
@@ -56,20 +127,26 @@ class StoryVectorDatabase:
         # Store the folder path for processing files
         self.folder_path = folder_path
 
-        # Using HuggingFace's all-MiniLM-L6-v2 which is good for semantic search
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2"
-        )
+        # Shared per process so the model is loaded once, not per request
+        self.embeddings = _get_shared("embeddings", _create_embeddings)
         print(f"loaded embeddings")
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000, chunk_overlap=200, separators=["\n\n", "\n", ". ", " ", ""]
-        )
-        print(f"loaded text splitter")
         # Initialize or load the vector store
         self.vector_store = self._load_or_create_db()
         # Metadata storage for key information
         self.metadata_path = f"{self.db_path}/{self.folder_name}_metadata.json"
         self.metadata = self._load_or_create_metadata()
+        # Existing indexes are moved to the backend that suits their size
+        if self.vector_store is not None and self._maybe_migrate_index():
+            self._save_vector_store()
+        # Indexes built before per-file ranges were tracked get them once
+        if self.vector_store is not None and "file_ranges" not in self.metadata:
+            self._rebuild_file_ranges()
+            self._save_metadata()
+        # Semantic cache of chat answers, valid for the current set of files
+        self.answer_cache = SemanticAnswerCache(
+            f"{self.db_path}/{self.folder_name}_answer_cache.json",
+            self.metadata.get("universe_version", 0),
+        )
         # Conversation history
         self.conversation_history = []
         self.max_history_length = 5
@@ -81,11 +158,12 @@ class StoryVectorDatabase:
         """Load existing vector database or create a new one."""
         try:
             # Add allow_dangerous_deserialization=True parameter
-            vector_store = FAISS.load_local(
+            vector_store = _faiss().load_local(
                 self.db_path,
                 self.embeddings,
                 allow_dangerous_deserialization=True,
             )
+            tune_index(vector_store.index)
             return vector_store
         except Exception as e:
             print(f"Error loading vector database for {self.folder_name}: {e}")
@@ -107,10 +185,270 @@ class StoryVectorDatabase:
                 "potential_contradictions": [],
             }
 
+    def _target_index_kind(self) -> str:
+        """FAISS backend for this universe: the pinned one, else chosen by size."""
+        return self.metadata.get("pinned_index_backend") or choose_index_kind(
+            self.vector_store.index.ntotal
+        )
+
+    def _maybe_migrate_index(self, kind: Optional[str] = None) -> bool:
+        """Rebuild the FAISS index if it doesn't use the target backend.
+
+        Returns True if the in-memory index was rebuilt (and needs saving).
+        """
+        kind = kind or self._target_index_kind()
+        if kind == index_kind(self.vector_store.index):
+            return False
+        with span("migrate_index"):
+            return migrate_vector_store(self.vector_store, kind)
+
+    def migrate_index(self, kind: Optional[str] = None, pin: bool = False):
+        """Rebuild the FAISS index with the given backend, or the automatic one.
+
+        Args:
+            kind: One of vector_index.INDEX_KINDS; None picks by chunk count
+                and removes any pinned backend
+            pin: Keep `kind` regardless of later size changes
+        """
+        if self.vector_store is None:
+            return
+        if pin and kind:
+            self.metadata["pinned_index_backend"] = kind
+            self._save_metadata()
+        elif not kind and "pinned_index_backend" in self.metadata:
+            del self.metadata["pinned_index_backend"]
+            self._save_metadata()
+        if self._maybe_migrate_index(kind):
+            self._save_vector_store()
+
+    def _rebuild_file_ranges(self):
+        """Recompute each file's [start, end) index position ranges from the docstore."""
+        ranges = {}
+        docstore = self.vector_store.docstore
+        dead = set(tombstones(self.vector_store).tolist())
+        for position in range(self.vector_store.index.ntotal):
+            if position in dead:
+                continue
+            doc = docstore.search(self.vector_store.index_to_docstore_id[position])
+            file_ranges = ranges.setdefault(doc.metadata.get("file_id", "unknown"), [])
+            if file_ranges and file_ranges[-1][1] == position:
+                file_ranges[-1][1] = position + 1
+            else:
+                file_ranges.append([position, position + 1])
+        self.metadata["file_ranges"] = ranges
+
+    def _shift_file_ranges(
+        self, removed: List[List[int]], compacted: Optional[List[List[int]]] = None
+    ):
+        """Drop removed position ranges and close the gaps they leave behind.
+
+        A removed range may cover a whole file range or only part of one.
+        Gaps are those of the `compacted` ranges when given, since an index
+        may keep removed positions as tombstones (see remove_positions).
+        """
+        removed = sorted(removed)
+        compacted = removed if compacted is None else sorted(compacted)
+        shifted = {}
+        for file_id, file_ranges in self.metadata.get("file_ranges", {}).items():
+            kept = []
+            for start, end in file_ranges:
+                # The parts of [start, end) that weren't removed
+                pieces, cursor = [], start
+                for s, e in removed:
+                    if e <= cursor:
+                        continue
+                    if s >= end:
+                        break
+                    if s > cursor:
+                        pieces.append((cursor, s))
+                    cursor = e
+                if cursor < end:
+                    pieces.append((cursor, end))
+                for s, e in pieces:
+                    offset = sum(
+                        min(r_end, s) - r_start
+                        for r_start, r_end in compacted
+                        if r_start < s
+                    )
+                    if kept and kept[-1][1] == s - offset:
+                        kept[-1][1] = e - offset
+                    else:
+                        kept.append([s - offset, e - offset])
+            if kept:
+                shifted[file_id] = kept
+        self.metadata["file_ranges"] = shifted
+
+    def _remove_positions(self, positions: List[int]):
+        """Remove chunks from the index and from the files' position ranges."""
+        with span("index"):
+            compacted = remove_positions(self.vector_store, positions)
+        self._shift_file_ranges(
+            _position_ranges(sorted(positions)), _position_ranges(compacted)
+        )
+
+    def similarity_search_with_score(self, query, k: int = 5) -> List[Any]:
+        """(chunk, squared L2 distance) pairs nearest to query in the whole universe.
+
+        Args:
+            query: Question text, or an already embedded query vector
+            k: Number of chunks to return
+        """
+        if self.vector_store is None:
+            return []
+        vector = self.embeddings.embed_query(query) if isinstance(query, str) else query
+        with span("search"):
+            distances, positions = search_index(self.vector_store, vector, k)
+        return [
+            (
+                self.vector_store.docstore.search(
+                    self.vector_store.index_to_docstore_id[int(position)]
+                ),
+                float(distance),
+            )
+            for distance, position in zip(distances, positions)
+        ]
+
+    def similarity_search(self, query, k: int = 5) -> List[Any]:
+        """Chunks nearest to query in the whole universe."""
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def similarity_search_in_files(
+        self, query, file_ids: List[str], k: int = 5
+    ) -> List[Any]:
+        """Similarity search restricted to the chunks of the given files.
+
+        Only those files' vectors are scanned, so the cost does not grow with
+        the rest of the universe.
+
+        Args:
+            query: Question text, or an already embedded query vector
+            file_ids: Files to search in
+            k: Number of chunks to return
+        """
+        if self.vector_store is None:
+            return []
+        file_ranges = self.metadata.get("file_ranges", {})
+        ranges = [r for file_id in file_ids for r in file_ranges.get(file_id, [])]
+        vector = self.embeddings.embed_query(query) if isinstance(query, str) else query
+        with span("search"):
+            _, positions = search_ranges(self.vector_store.index, vector, ranges, k)
+        return [
+            self.vector_store.docstore.search(
+                self.vector_store.index_to_docstore_id[int(position)]
+            )
+            for position in positions
+        ]
+
+    def set_precedence(self, order: List[str], canonical: List[str]):
+        """Record the files' precedence (most authoritative first) and which are canon.
+
+        Files not in `order` rank after those that are. Cached answers are
+        dropped, since retrieval changes.
+        """
+        self.metadata["precedence"] = list(order)
+        self.metadata["canonical"] = list(canonical)
+        self._bump_universe_version()
+        os.makedirs(self.db_path, exist_ok=True)
+        self._save_metadata()
+
+    def _precedence_weights(self) -> Dict[str, float]:
+        order = list(self.metadata.get("precedence", []))
+        order += [f for f in self.metadata["files_processed"] if f not in order]
+        canonical = set(self.metadata.get("canonical", []))
+        weights = {}
+        for position, file_id in enumerate(order):
+            weights[file_id] = (
+                1.0
+                if file_id in canonical
+                else max(MIN_PRECEDENCE_WEIGHT, 1.0 - PRECEDENCE_STEP * (position + 1))
+            )
+        return weights
+
+    def precedence_search(self, vector, k: int = 5) -> List[Any]:
+        """Canonical-first retrieval.
+
+        Canonical files are searched on their own first; if enough of their
+        chunks are similar enough, only those are returned (often fewer than
+        k). Otherwise the whole universe is searched and ranked by similarity
+        times the chunk's file precedence weight.
+        """
+        canonical = [
+            f
+            for f in self.metadata.get("canonical", [])
+            if f in self.metadata.get("file_ranges", {})
+        ]
+        if canonical:
+            file_ranges = self.metadata["file_ranges"]
+            ranges = [r for file_id in canonical for r in file_ranges[file_id]]
+            with span("search"):
+                distances, positions = search_ranges(
+                    self.vector_store.index, vector, ranges, k
+                )
+            # The embedding model returns unit vectors, so the squared L2
+            # distance d gives cosine similarity as 1 - d / 2
+            hits = [
+                int(position)
+                for distance, position in zip(distances, positions)
+                if 1 - float(distance) / 2 >= CANON_SIMILARITY
+            ]
+            if len(hits) >= min(k, CANON_MIN_HITS):
+                return [
+                    self.vector_store.docstore.search(
+                        self.vector_store.index_to_docstore_id[position]
+                    )
+                    for position in hits
+                ]
+
+        weights = self._precedence_weights()
+        scored = self.similarity_search_with_score(
+            vector, k=k * PRECEDENCE_FETCH_FACTOR
+        )
+        ranked = sorted(
+            scored,
+            key=lambda pair: -(1 - float(pair[1]) / 2)
+            * weights.get(pair[0].metadata.get("file_id"), MIN_PRECEDENCE_WEIGHT),
+        )
+        return [doc for doc, _ in ranked[:k]]
+
+    def _files_mentioned(self, question: str) -> List[str]:
+        """Files a question explicitly refers to, as "Book N" (upload order) or by name.
+
+        Names are matched as whole words, or only in quotes when shorter than
+        MIN_TITLE_LENGTH.
+        """
+        files = self.metadata["files_processed"]
+        mentioned = []
+        for match in re.finditer(r"\bbook\s+(\d+)\b", question, re.IGNORECASE):
+            number = int(match.group(1))
+            if 1 <= number <= len(files):
+                mentioned.append(files[number - 1])
+        for file_id in files:
+            title = os.path.splitext(file_id)[0].replace("_", " ").strip()
+            if not title or file_id in mentioned:
+                continue
+            if len(title) >= MIN_TITLE_LENGTH:
+                pattern = rf"\b{re.escape(title)}\b"
+            else:
+                pattern = rf"[\"'“‘]{re.escape(title)}[\"'”’]"
+            if re.search(pattern, question, re.IGNORECASE):
+                mentioned.append(file_id)
+        return mentioned
+
+    def _save_vector_store(self):
+        with span("save"):
+            self.vector_store.save_local(self.db_path)
+
+    def _bump_universe_version(self):
+        """Record that the universe's file set changed and drop cached answers."""
+        self.metadata["universe_version"] = self.metadata.get("universe_version", 0) + 1
+        self.answer_cache.universe_version = self.metadata["universe_version"]
+        self.answer_cache.clear()
+
     def _save_metadata(self):
         """Save metadata to disk."""
-        with open(self.metadata_path, "w") as f:
-            json.dump(self.metadata, f, indent=2)
+        with span("save_metadata"):
+            with open(self.metadata_path, "w") as f:
+                json.dump(self.metadata, f, indent=2)
 
     def process_file(self, file_name: str, file_id: Optional[str] = None):
         """Process a text file and add it to the vector database.
@@ -119,12 +457,57 @@ class StoryVectorDatabase:
             file_name: Name of the file (not full path)
             file_id: Optional identifier for the file (defaults to filename)
         """
+        file_id = self._ingest_file(file_name, file_id)
+        if file_id is None:
+            return
+
+        self._maybe_migrate_index()
+        self._save_vector_store()
+        self._save_metadata()
+        self._reconcile_story_information()
+        print(
+            f"File {file_id} processed and added to vector database for folder {self.folder_name}."
+        )
+
+    def process_files(self, file_names: List[str]) -> List[str]:
+        """Process several text files, saving and reconciling once at the end.
+
+        Args:
+            file_names: Names of the files (not full paths)
+
+        Returns:
+            The ids of the files that were added
+        """
+        processed = []
+        for file_name in file_names:
+            file_id = self._ingest_file(file_name)
+            if file_id is not None:
+                processed.append(file_id)
+        if not processed:
+            return processed
+
+        self._maybe_migrate_index()
+        self._save_vector_store()
+        self._save_metadata()
+        self._reconcile_story_information()
+        print(
+            f"{len(processed)} files processed and added to vector database for folder {self.folder_name}."
+        )
+        return processed
+
+    def _ingest_file(
+        self, file_name: str, file_id: Optional[str] = None
+    ) -> Optional[str]:
+        """Index one file and extract its information, without saving or reconciling.
+
+        Returns the file id, or None if the file was missing or already processed.
+        """
         # Build full file path
         file_path = os.path.join(self.folder_path, file_name)
 
         if not os.path.exists(file_path):
             print(f"File {file_path} does not exist.")
-            return
+            return None
 
         if file_id is None:
             file_id = file_name
@@ -132,7 +515,7 @@ class StoryVectorDatabase:
         # Check if file was already processed
         if file_id in self.metadata["files_processed"]:
             print(f"File {file_id} already processed. Use update_file to modify.")
-            return
+            return None
 
         # Read the file
         with open(file_path, "r", encoding="utf-8") as f:
@@ -141,37 +524,54 @@ class StoryVectorDatabase:
         print(f"Raw text length: {len(raw_text)} characters")
         print(f"Raw text: {raw_text[:100]}...")  # Print first 100 characters
 
-        # Split text into chunks
-        docs = self.text_splitter.create_documents([raw_text])
-
-        # Add file metadata to each chunk
-        for i, doc in enumerate(docs):
-            doc.metadata = {
-                "file_id": file_id,
-                "chunk_id": i,
-                "total_chunks": len(docs),
-            }
-
-        # Create or add to vector store
-        if self.vector_store is None:
-            self.vector_store = FAISS.from_documents(docs, self.embeddings)
-            self.vector_store.save_local(self.db_path)
-        else:
-            self.vector_store.add_documents(docs)
-            self.vector_store.save_local(self.db_path)
+        # Content-defined chunks, so a later edit only touches the chunks around it
+        with span("split"):
+            chunks = chunk_text(raw_text)
+        file_range = self._index_chunks(file_id, chunks, range(len(chunks)))
 
         # Update metadata
         self.metadata["files_processed"].append(file_id)
+        self.metadata.setdefault("file_ranges", {})[file_id] = [file_range]
+        self.metadata.setdefault("chunk_hashes", {})[file_id] = [
+            chunk["hash"] for chunk in chunks
+        ]
+        self._bump_universe_version()
 
         # Extract key information using LLM
         self._extract_story_info(raw_text, file_id)
-
-        # Save updated metadata
-        self._save_metadata()
-        self._reconcile_story_information()
-        print(
-            f"File {file_id} processed and added to vector database for folder {self.folder_name}."
-        )
+        # Knowledge graph, contradictions and speculation for the universe view
+        self._analyze_file(raw_text, file_id, chunks)
+        return file_id
+
+    def _index_chunks(
+        self, file_id: str, chunks: List[Dict[str, Any]], chunk_ids
+    ) -> List[int]:
+        """Embed and append the chunks with the given ids; returns their [start, end) positions."""
+        texts = [chunks[i]["text"] for i in chunk_ids]
+        metadatas = [
+            {
+                "file_id": file_id,
+                "chunk_id": i,
+                "total_chunks": len(chunks),
+                "chunk_hash": chunks[i]["hash"],
+            }
+            for i in chunk_ids
+        ]
+        # Embed separately from indexing so each stage can be timed
+        with span("embed"):
+            vectors = self.embeddings.embed_documents(texts)
+
+        # Create or add to vector store; the chunks form one position range
+        text_embeddings = list(zip(texts, vectors))
+        start = 0 if self.vector_store is None else self.vector_store.index.ntotal
+        with span("index"):
+            if self.vector_store is None:
+                self.vector_store = _faiss().from_embeddings(
+                    text_embeddings, self.embeddings, metadatas=metadatas
+                )
+            else:
+                self.vector_store.add_embeddings(text_embeddings, metadatas=metadatas)
+        return [start, self.vector_store.index.ntotal]
 
     def process_folder(self):
         """Process all text files in the folder."""
@@ -181,16 +581,21 @@ class StoryVectorDatabase:
 
         print(f"Processing all files in folder: {self.folder_path}")
 
-        # Process all text files in the folder
-        for file_name in os.listdir(self.folder_path):
-            if file_name.endswith(".txt"):
-                self.process_file(file_name)
+        # Process all text files in the folder, reconciling once at the end
+        self.process_files(
+            [f for f in sorted(os.listdir(self.folder_path)) if f.endswith(".txt")]
+        )
 
         print(f"All files in folder {self.folder_name} processed.")
 
     def update_file(self, file_name: str, file_id: Optional[str] = None):
         """Update an existing file in the database.
 
+        The file's new chunks are diffed against the indexed ones by hash:
+        only new or changed chunks are embedded and sent for extraction.
+        Files indexed before chunk hashes were recorded are processed again
+        in full.
+
         Args:
             file_name: Name of the file (not full path)
             file_id: Optional identifier for the file (defaults to filename)
@@ -204,12 +609,21 @@ class StoryVectorDatabase:
         if file_id is None:
             file_id = file_name
 
-        # Remove existing entries for this file
-        if file_id in self.metadata["files_processed"]:
-            self._remove_file_entries(file_id)
+        if (
+            self.vector_store is not None
+            and file_id in self.metadata["files_processed"]
+            and file_id in self.metadata.get("chunk_hashes", {})
+        ):
+            if not self._update_file_chunks(file_path, file_id):
+                print(f"File {file_id} is unchanged.")
+                return
+        else:
+            # Remove existing entries for this file
+            if file_id in self.metadata["files_processed"]:
+                self._remove_file_entries(file_id)
 
-        # Process the file as new
-        self.process_file(file_name, file_id)
+            # Process the file as new
+            self.process_file(file_name, file_id)
 
         # Reconcile new information with existing data
         self._reconcile_story_information()
@@ -221,36 +635,96 @@ class StoryVectorDatabase:
             f"File {file_id} updated in vector database for folder {self.folder_name}."
         )
 
+    def _update_file_chunks(self, file_path: str, file_id: str) -> bool:
+        """Re-index only the chunks of an edited file that changed, and save.
+
+        Unchanged chunks keep their vectors, and extraction reuses the
+        answers for questions and sections whose text didn't change.
+
+        Returns False if no chunk changed.
+        """
+        with open(file_path, "r", encoding="utf-8") as f:
+            raw_text = f.read()
+        with span("split"):
+            chunks = chunk_text(raw_text)
+
+        # Indexed chunks by hash; chunk_hashes follows the file's positions
+        positions = [
+            p
+            for start, end in self.metadata["file_ranges"].get(file_id, [])
+            for p in range(start, end)
+        ]
+        indexed = defaultdict(list)
+        for position, digest in zip(positions, self.metadata["chunk_hashes"][file_id]):
+            indexed[digest].append(position)
+        kept, added = {}, []
+        for i, chunk in enumerate(chunks):
+            if indexed[chunk["hash"]]:
+                kept[i] = indexed[chunk["hash"]].pop(0)
+            else:
+                added.append(i)
+        stale = sorted(p for unmatched in indexed.values() for p in unmatched)
+        if not added and not stale:
+            return False
+        print(
+            f"Updating file {file_id}: {len(added)} new or changed chunks, "
+            f"{len(stale)} removed, {len(kept)} unchanged"
+        )
+
+        # Unchanged chunks only get their new place in the file
+        docstore = self.vector_store.docstore
+        for i, position in kept.items():
+            doc = docstore.search(self.vector_store.index_to_docstore_id[position])
+            doc.metadata["chunk_id"] = i
+            doc.metadata["total_chunks"] = len(chunks)
+
+        if stale:
+            self._remove_positions(stale)
+        file_ranges = self.metadata["file_ranges"].setdefault(file_id, [])
+        if added:
+            file_ranges.append(self._index_chunks(file_id, chunks, added))
+        self.metadata["chunk_hashes"][file_id] = [
+            self.vector_store.docstore.search(
+                self.vector_store.index_to_docstore_id[p]
+            ).metadata["chunk_hash"]
+            for start, end in file_ranges
+            for p in range(start, end)
+        ]
+        self._bump_universe_version()
+
+        # Unchanged questions and sections reuse their answers
+        self._extract_story_info(raw_text, file_id)
+        self._analyze_file(raw_text, file_id, chunks)
+
+        self._maybe_migrate_index()
+        self._save_vector_store()
+        self._save_metadata()
+        return True
+
     def _remove_file_entries(self, file_id: str):
         """Remove entries for a specific file from the vector database."""
         if self.vector_store is None:
             return
 
-        # Get all documents
-        all_docs = []
-        for doc_id in range(len(self.vector_store.docstore._dict)):
-            if doc_id in self.vector_store.docstore._dict:
-                doc = self.vector_store.docstore._dict[doc_id]
-                all_docs.append((doc_id, doc))
-
-        # Filter out documents from the file to be removed
-        docs_to_keep = [
-            (doc_id, doc)
-            for doc_id, doc in all_docs
-            if doc.metadata.get("file_id") != file_id
-        ]
-
-        # Create new vector store with remaining documents
-        if docs_to_keep:
-            new_docs = [doc for _, doc in docs_to_keep]
-            self.vector_store = FAISS.from_documents(new_docs, self.embeddings)
-            self.vector_store.save_local(self.db_path)
-        else:
-            self.vector_store = None
+        # Remove this file's position ranges from the index
+        removed = self.metadata.get("file_ranges", {}).get(file_id, [])
+        positions = [p for start, end in removed for p in range(start, end)]
+        if positions:
+            self._remove_positions(positions)
+            if self.vector_store.docstore._dict:
+                self._save_vector_store()
+            else:
+                self.vector_store = None
+                for name in ("index.faiss", "index.pkl"):
+                    if os.path.exists(os.path.join(self.db_path, name)):
+                        os.remove(os.path.join(self.db_path, name))
 
         # Update metadata
         if file_id in self.metadata["files_processed"]:
             self.metadata["files_processed"].remove(file_id)
+        for key in ("file_analysis", "section_analysis", "extractions", "chunk_hashes"):
+            self.metadata.get(key, {}).pop(file_id, None)
+        self._bump_universe_version()
 
         if file_id in self.metadata["character_info"]:
             del self.metadata["character_info"][file_id]
@@ -282,11 +756,18 @@ class StoryVectorDatabase:
         self._save_metadata()
 
     def _extract_story_info(self, text: str, file_id: str):
-        """Extract key information from the story using LLM."""
-        llm = get_llm()
-        character_docs = self.vector_store.similarity_search(
-            "character information", k=5
-        )
+        """Extract key information from the story using LLM.
+
+        Each answer is recorded with the hash of its prompt, which holds the
+        chunks it was given. When the file is edited, questions whose chunks
+        are unchanged keep their answers, so only those that see changed
+        text are asked again, and the file's results replace the old ones.
+        """
+        llm = get_llm(self.folder_name)
+        previous = self.metadata.setdefault("extractions", {}).get(file_id, {})
+        answers = {}
+        # Only this file's chunks are searched, however large the universe is
+        character_docs = self._context_docs("character information", file_id, k=5)
         character_context = "\n\n".join([doc.page_content for doc in character_docs])
         # Extract character information
         character_prompt = f"""
@@ -299,9 +780,10 @@ class StoryVectorDatabase:
         
         CHARACTERS:
         """
-        character_response = llm.invoke(character_prompt)
-        character_str = _extract_content_from_response(character_response)
-        timeline_docs = self.vector_store.similarity_search("timeline of events", k=5)
+        character_str = self._answer(
+            llm, "character", character_prompt, previous, answers
+        )
+        timeline_docs = self._context_docs("timeline of events", file_id, k=5)
         timeline_context = "\n\n".join([doc.page_content for doc in timeline_docs])
         # Extract timeline events
         timeline_prompt = f"""
@@ -313,12 +795,11 @@ class StoryVectorDatabase:
         
         TIMELINE:
         """
-        timeline_response = llm.invoke(timeline_prompt)
-        timeline_str = _extract_content_from_response(timeline_response)
+        timeline_str = self._answer(llm, "timeline", timeline_prompt, previous, answers)
 
         # Perform similarity search for contradiction-related chunks
-        contradiction_docs = self.vector_store.similarity_search(
-            "potential contradictions", k=5
+        contradiction_docs = self._context_docs(
+            "potential contradictions", file_id, k=5
         )
         contradiction_context = "\n\n".join(
             [doc.page_content for doc in contradiction_docs]
@@ -333,8 +814,9 @@ class StoryVectorDatabase:
         
         POTENTIAL CONTRADICTIONS:
         """
-        contradiction_response = llm.invoke(contradiction_prompt)
-        contradiction_str = _extract_content_from_response(contradiction_response)
+        contradiction_str = self._answer(
+            llm, "contradiction", contradiction_prompt, previous, answers
+        )
 
         contradictions = []
         for line in contradiction_str.split("\n"):
@@ -347,7 +829,7 @@ class StoryVectorDatabase:
         resolution_contexts = []
         for contradiction in contradictions:
             if contradiction.strip():  # Skip empty lines
-                related_docs = self.vector_store.similarity_search(contradiction, k=3)
+                related_docs = self._context_docs(contradiction, file_id, k=3)
                 resolution_contexts.extend([doc.page_content for doc in related_docs])
 
         # Combine all retrieved contexts
@@ -364,19 +846,132 @@ class StoryVectorDatabase:
 
         RESOLUTIONS:
         """
-        resolution_response = llm.invoke(resolution_prompt)
-        resolution_str = _extract_content_from_response(resolution_response)
+        resolution_str = self._answer(
+            llm, "resolution", resolution_prompt, previous, answers
+        )
         # Save to metadata
+        self.metadata["extractions"][file_id] = answers
         self.metadata["character_info"][file_id] = character_str
-        self.metadata["timeline_events"].append(
-            {"file_id": file_id, "events": timeline_str}
+        self._set_file_entry(
+            "timeline_events", {"file_id": file_id, "events": timeline_str}
         )
-        self.metadata["potential_contradictions"].append(
+        self._set_file_entry(
+            "potential_contradictions",
             {
                 "file_id": file_id,
                 "contradictions": contradiction_str,
                 "resolution": resolution_str,
-            }
+            },
+        )
+
+    def _context_docs(self, query, file_id: str, k: int) -> List[Any]:
+        """The file's chunks most similar to query, in story order.
+
+        Keeping story order means a prompt doesn't change when chunks that
+        are equally similar come back ranked differently.
+        """
+        docs = self.similarity_search_in_files(query, [file_id], k=k)
+        return sorted(docs, key=lambda doc: doc.metadata.get("chunk_id", 0))
+
+    def _answer(
+        self, llm, call: str, prompt: str, previous: Dict[str, Any], answers: Dict
+    ) -> str:
+        """The answer to a prompt, reusing the previous one if the prompt is unchanged."""
+        key = chunk_hash(prompt)
+        cached = previous.get(call)
+        if cached is not None and cached["key"] == key:
+            answer = cached["answer"]
+        else:
+            answer = _extract_content_from_response(_invoke_llm(llm, prompt, call))
+        answers[call] = {"key": key, "answer": answer}
+        return answer
+
+    def _set_file_entry(self, key: str, entry: Dict[str, Any]):
+        """Put a file's entry in a per-file metadata list, replacing any it had."""
+        entries = self.metadata[key]
+        file_id = entry["file_id"]
+        index = next(
+            (i for i, e in enumerate(entries) if e["file_id"] == file_id),
+            len(entries),
+        )
+        self.metadata[key] = (
+            entries[:index]
+            + [entry]
+            + [e for e in entries[index:] if e["file_id"] != file_id]
+        )
+
+    def _analyze_file(
+        self, text: str, file_id: str, chunks: Optional[List[Dict[str, Any]]] = None
+    ):
+        """Run the combined knowledge-graph/contradiction/speculation analysis for one file.
+
+        Given the file's chunks, each content-defined section is analysed on
+        its own and kept by hash: after an edit only changed sections are sent
+        again, and the results of sections that are gone drop out.
+        """
+        from llm_gateway import MAX_PER_UNIVERSE
+        from processing import analyze_document, merge_analyses
+
+        llm = get_llm(self.folder_name)
+        # Universes whose graph is built locally only need the other sections
+        include_graph = not self.metadata.get("local_graph", False)
+        file_analysis = self.metadata.setdefault("file_analysis", {})
+        if chunks is None:
+            file_analysis[file_id] = analyze_document(
+                text, llm, include_graph=include_graph
+            )
+            return
+
+        previous = self.metadata.setdefault("section_analysis", {}).get(file_id, {})
+        sections = {}
+        for section in group_chunks(chunks):
+            section_text = "".join(chunks[i]["text"] for i in section)
+            sections[chunk_hash(f"{include_graph}:{section_text}")] = section_text
+        missing = [key for key in sections if key not in previous]
+        with ThreadPoolExecutor(max_workers=MAX_PER_UNIVERSE) as pool:
+            fresh = dict(
+                zip(
+                    missing,
+                    pool.map(
+                        lambda key: analyze_document(
+                            sections[key], llm, include_graph=include_graph
+                        ),
+                        missing,
+                    ),
+                )
+            )
+        analyses = {key: previous.get(key) or fresh[key] for key in sections}
+        # Failed sections aren't kept, so the next update asks again
+        self.metadata["section_analysis"][file_id] = {
+            key: analysis
+            for key, analysis in analyses.items()
+            if isinstance(analysis.get("contradictions"), list)
+        }
+        file_analysis[file_id] = merge_analyses(analyses.values())
+
+    def universe_analysis(self) -> Dict[str, Any]:
+        """Knowledge graph, contradictions and speculation boundaries for the universe.
+
+        Merged from the per-file analyses made at ingestion; files processed
+        before those were recorded are analyzed once here.
+        """
+        from processing import merge_analyses
+
+        file_analysis = self.metadata.setdefault("file_analysis", {})
+        missing = [
+            f for f in self.metadata["files_processed"] if f not in file_analysis
+        ]
+        for file_id in missing:
+            file_path = os.path.join(self.folder_path, file_id)
+            if os.path.exists(file_path):
+                with open(file_path, "r", encoding="utf-8") as f:
+                    self._analyze_file(f.read(), file_id)
+        if missing:
+            self._save_metadata()
+        return merge_analyses(
+            file_analysis[f]
+            for f in self.metadata["files_processed"]
+            if f in file_analysis
         )
 
     def _reconcile_story_information(self):
@@ -384,7 +979,7 @@ class StoryVectorDatabase:
         if not self.metadata["files_processed"]:
             return
         print("Reconciling story information across all files...")
-        llm = get_llm()
+        llm = get_llm(self.folder_name)
 
         # Prepare all character information
         all_character_info = "\n\n".join(
@@ -404,7 +999,9 @@ class StoryVectorDatabase:
         
         RECONCILED CHARACTER LIST:
         """
-        reconciled_characters = llm.invoke(character_reconcile_prompt)
+        reconciled_characters = _invoke_llm(
+            llm, character_reconcile_prompt, "reconcile"
+        )
         print(f"Reconciled characters: {reconciled_characters}")
         self.metadata["reconciled_characters"] = _extract_content_from_response(
             reconciled_characters
@@ -428,7 +1025,7 @@ class StoryVectorDatabase:
         
         UNIFIED TIMELINE:
         """
-        unified_timeline = llm.invoke(timeline_reconcile_prompt)
+        unified_timeline = _invoke_llm(llm, timeline_reconcile_prompt, "reconcile")
         self.metadata["unified_timeline"] = _extract_content_from_response(
             unified_timeline
         )
@@ -454,9 +1051,7 @@ class StoryVectorDatabase:
                 resolution_contexts = []
                 for contradiction in contradictions:
                     if contradiction.strip():  # Skip empty lines
-                        related_docs = self.vector_store.similarity_search(
-                            contradiction, k=3
-                        )
+                        related_docs = self.similarity_search(contradiction, k=3)
                         resolution_contexts.extend(
                             [doc.page_content for doc in related_docs]
                         )
@@ -491,7 +1086,9 @@ class StoryVectorDatabase:
 
             UNIFIED RESOLUTION:
             """
-        unified_resolution = llm.invoke(contradiction_resolution_prompt)
+        unified_resolution = _invoke_llm(
+            llm, contradiction_resolution_prompt, "reconcile"
+        )
         self.metadata["overall_contradictions"] = all_contradictions
         self.metadata["overall_resolution"] = _extract_content_from_response(
             unified_resolution
@@ -515,8 +1112,34 @@ class StoryVectorDatabase:
         )
         print(f"Searching through {doc_count} documents")
 
-        # Get relevant documents
-        docs = self.vector_store.similarity_search(question, k=k)
+        # Embed the question once for both the answer cache and retrieval
+        with span("embed"):
+            question_vector = self.embeddings.embed_query(question)
+        history_key = (
+            conversation_key(question, self.conversation_history)
+            if use_conversation_history
+            else ""
+        )
+        cached = self.answer_cache.lookup(question_vector, history_key)
+        if cached is not None:
+            print(f"Answer cache hit (matched: {cached['question']})")
+            self._remember_exchange(question, cached["answer"])
+            return {
+                "answer": cached["answer"],
+                "sources": cached["sources"],
+                "cached": True,
+            }
+
+        # Get relevant documents, only from the books the question names if any
+        mentioned_files = self._files_mentioned(question)
+        if mentioned_files:
+            docs = self.similarity_search_in_files(
+                question_vector, mentioned_files, k=k
+            )
+        elif self.metadata.get("canonical") or self.metadata.get("precedence"):
+            docs = self.precedence_search(question_vector, k=k)
+        else:
+            docs = self.similarity_search(question_vector, k=k)
 
         if not docs:
             return {
@@ -536,7 +1159,7 @@ class StoryVectorDatabase:
             for doc in docs
         ]
 
-        llm = get_llm()
+        llm = get_llm(self.folder_name)
 
         # Check if we need to include metadata in the query
         if "character" in question.lower() or "who" in question.lower():
@@ -606,11 +1229,18 @@ class StoryVectorDatabase:
         DETAILED ANSWER:
         """
 
-        answer = llm.invoke(query_prompt)
+        answer = _invoke_llm(llm, query_prompt, "query")
         answer_str = _extract_content_from_response(answer)
 
-        # Update conversation history
-        self.conversation_history.append((question, answer_str))
+        self.answer_cache.store(
+            question, question_vector, history_key, answer_str, sources
+        )
+        self._remember_exchange(question, answer_str)
+        return {"answer": answer_str, "sources": sources}
+
+    def _remember_exchange(self, question: str, answer: str):
+        """Append a question/answer pair to the persisted conversation history."""
+        self.conversation_history.append((question, answer))
         # Keep only recent conversation history
         if len(self.conversation_history) > self.max_history_length:
             self.conversation_history = self.conversation_history[
@@ -618,14 +1248,13 @@ class StoryVectorDatabase:
             ]
         # Save conversation history
         self.save_conversation_history()
-        return {"answer": answer_str, "sources": sources}
 
     def get_story_summary(self) -> str:
         """Generate a summary of the entire story across all files."""
         if not self.metadata["files_processed"]:
             return "No story files have been processed yet."
 
-        llm = get_llm()
+        llm = get_llm(self.folder_name)
 
         # Get full chunks from vector store - more direct approach
         full_text_samples = []
@@ -641,7 +1270,7 @@ class StoryVectorDatabase:
             ]
 
             for query in search_queries:
-                docs = self.vector_store.similarity_search(query, k=2)
+                docs = self.similarity_search(query, k=2)
                 chunks = [doc.page_content for doc in docs]
                 full_text_samples.extend(chunks)
 
@@ -686,7 +1315,7 @@ class StoryVectorDatabase:
         COMPREHENSIVE STORY SUMMARY:
         """
 
-        summary = llm.invoke(summary_prompt)
+        summary = _invoke_llm(llm, summary_prompt, "summary")
         return _extract_content_from_response(summary)
 
     def save_conversation_history(self, file_path: str = None):
@@ -787,7 +1416,8 @@ def file_deleted(folder_path: str, file_name: str):
         f"File {file_name} deleted from vector database for folder {story_db.folder_name}."
     )
     return {
-        "message": f"File {file_name} deleted from vector database for folder {story_db.folder_name}."
+        "message": f"File {file_name} deleted from vector database for folder {story_db.folder_name}.",
+        "analysis": story_db.universe_analysis(),
     }
 
 
@@ -806,13 +1436,51 @@ def folder_deleted(folder_path: str):
     return {"message": f"Folder {full_path} deleted."}
 
 
-def file_uploaded(folder_path: str, file_name: str):
-    """Handle file upload event."""
+def file_uploaded(folder_path: str, file_name: str, local_graph: bool = False):
+    """Handle file upload event.
+
+    With local_graph the caller builds the knowledge graph itself, so the
+    per-file analysis leaves it out (remembered for the universe).
+    """
     story_db = StoryVectorDatabase(folder_path)
+    if local_graph:
+        story_db.metadata["local_graph"] = True
     story_db.process_file(file_name)
     print(f"File {file_name} uploaded and processed for folder {story_db.folder_name}.")
     return {
-        "message": f"File {file_name} uploaded and processed for folder {story_db.folder_name}."
+        "message": f"File {file_name} uploaded and processed for folder {story_db.folder_name}.",
+        "analysis": story_db.universe_analysis(),
+    }
+
+
+def files_uploaded(folder_path: str, file_names: List[str], local_graph: bool = False):
+    """Handle a batch upload: ingest every file, then reconcile and analyze once."""
+    story_db = StoryVectorDatabase(folder_path)
+    if local_graph:
+        story_db.metadata["local_graph"] = True
+    processed = story_db.process_files(file_names)
+    return {
+        "message": f"{len(processed)} files uploaded and processed for folder {story_db.folder_name}.",
+        "files": processed,
+        "analysis": story_db.universe_analysis(),
+    }
+
+
+def refine_graph(candidates: Dict[str, Any]):
+    """Handle a refinement request for the uncertain parts of a local knowledge graph."""
+    from processing import refine_graph as refine
+
+    return {"refinements": refine(candidates, get_llm())}
+
+
+def set_precedence(folder_path: str, order: List[str], canonical: List[str]):
+    """Handle a precedence update: files most authoritative first, and the canonical ones."""
+    story_db = StoryVectorDatabase(folder_path)
+    story_db.set_precedence(order, canonical)
+    return {
+        "message": f"Precedence updated for folder {story_db.folder_name}.",
+        "precedence": story_db.metadata["precedence"],
+        "canonical": story_db.metadata["canonical"],
     }
 
 
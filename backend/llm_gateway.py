@@ -0,0 +1,259 @@
+# llm_gateway.py
+import os
+import json
+import time
+import random
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+from langchain_core.runnables import Runnable
+
+load_dotenv()
+
+DEFAULT_MODEL = "gemini-2.0-flash"
+# LLM calls in flight at once, in total and per universe
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+MAX_PER_UNIVERSE = int(os.getenv("LLM_MAX_PER_UNIVERSE", "3"))
+# Token bucket: sustained request rate and burst size (0 disables rate limiting)
+REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "60"))
+BURST = int(os.getenv("LLM_BURST", "10"))
+# Retries of quota (429) and overload (503) errors, with full-jitter backoff
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+
+
+class TokenBucket:
+    """Blocking token bucket: `rate` tokens per second, holding at most `capacity`."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether an LLM error is a quota or overload error worth retrying."""
+    if getattr(error, "code", None) in (429, 503):
+        return True
+    if error.__class__.__name__ in (
+        "ResourceExhausted",
+        "TooManyRequests",
+        "ServiceUnavailable",
+    ):
+        return True
+    message = str(error).lower()
+    return "429" in message or "resource exhausted" in message or "quota" in message
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff, so retries from many threads spread out."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt))
+
+
+def _create_client(model: str, temperature: float):
+    # Offline stand-in for benchmarks, see fake_llm.py
+    from fake_llm import FAKE_LLM_ENV, get_fake_llm
+
+    fake_spec = os.getenv(FAKE_LLM_ENV)
+    if fake_spec:
+        return get_fake_llm(fake_spec)
+
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    google_api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+    if not google_api_key:
+        raise EnvironmentError(
+            "GEMINI_API_KEY environment variable is not set. Please set it to use the LLM."
+        )
+    # Retries are the gateway's job; the client's own would multiply them
+    return ChatGoogleGenerativeAI(
+        model=model,
+        google_api_key=google_api_key,
+        temperature=temperature,
+        max_retries=1,
+    )
+
+
+def _input_key(input: Any) -> str:
+    if isinstance(input, str):
+        return input
+    if hasattr(input, "to_string"):
+        return input.to_string()
+    return json.dumps(input, sort_keys=True, default=str)
+
+
+class LLMGateway:
+    """Single entry point for the backend's LLM calls.
+
+    Keeps one client (and so one connection pool) per model and temperature,
+    bounds concurrent calls globally and per universe, spaces requests with a
+    token bucket, retries quota errors with jittered backoff, and lets
+    identical prompts that are already in flight share one call.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = MAX_CONCURRENCY,
+        max_per_universe: int = MAX_PER_UNIVERSE,
+        requests_per_minute: float = REQUESTS_PER_MINUTE,
+        burst: int = BURST,
+        max_retries: int = MAX_RETRIES,
+    ):
+        self.max_per_universe = max_per_universe
+        self.max_retries = max_retries
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        # universe -> [semaphore, callers holding or waiting for it]; an entry
+        # is dropped when its last caller leaves, so idle universes cost nothing
+        self._universe_slots: Dict[str, List[Any]] = {}
+        self._bucket = (
+            TokenBucket(requests_per_minute / 60, burst)
+            if requests_per_minute > 0
+            else None
+        )
+        self._clients = {}
+        self._in_flight: Dict[Any, Future] = {}
+        self._lock = threading.Lock()
+
+    def client(self, model: str = DEFAULT_MODEL, temperature: float = 0.7):
+        """The shared client for a model and temperature, created on first use."""
+        key = (model, temperature)
+        with self._lock:
+            if key not in self._clients:
+                self._clients[key] = _create_client(model, temperature)
+            return self._clients[key]
+
+    def llm(
+        self,
+        universe: Optional[str] = None,
+        model: str = DEFAULT_MODEL,
+        temperature: float = 0.7,
+    ) -> "GatewayLLM":
+        """A LangChain-compatible model whose calls go through this gateway."""
+        return GatewayLLM(self, universe, model, temperature)
+
+    @contextmanager
+    def _universe_slot(self, universe: Optional[str]):
+        if universe is None:
+            yield
+            return
+        with self._lock:
+            entry = self._universe_slots.get(universe)
+            if entry is None:
+                entry = self._universe_slots[universe] = [
+                    threading.BoundedSemaphore(self.max_per_universe),
+                    0,
+                ]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._universe_slots[universe]
+
+    def _call(self, client, input: Any, universe: Optional[str], **kwargs):
+        for attempt in range(self.max_retries + 1):
+            # Waiting for a token or a retry holds no slot; slots bound only
+            # the requests actually in flight
+            if self._bucket is not None:
+                self._bucket.acquire()
+            try:
+                with self._universe_slot(universe), self._slots:
+                    return client.invoke(input, **kwargs)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                delay = backoff_delay(attempt)
+                print(
+                    f"LLM call rate-limited ({e.__class__.__name__}), retrying in {delay:.1f}s"
+                )
+                time.sleep(delay)
+
+    def invoke(
+        self,
+        input: Any,
+        universe: Optional[str] = None,
+        model: str = DEFAULT_MODEL,
+        temperature: float = 0.7,
+        **kwargs,
+    ):
+        """Call the model with `input` (a prompt, prompt value or messages)."""
+        client = self.client(model, temperature)
+        key = (
+            model,
+            temperature,
+            _input_key(input),
+            json.dumps(kwargs, sort_keys=True, default=str),
+        )
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+        if not leader:
+            return future.result()
+
+        try:
+            future.set_result(self._call(client, input, universe, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+        return future.result()
+
+
+class GatewayLLM(Runnable):
+    """Chat model stand-in bound to a universe, model and temperature.
+
+    A Runnable, so it works wherever the repo used a LangChain chat model:
+    llm.invoke(prompt), prompt | llm and LLMChain(llm=...).
+    """
+
+    def __init__(
+        self,
+        gateway: LLMGateway,
+        universe: Optional[str] = None,
+        model: str = DEFAULT_MODEL,
+        temperature: float = 0.7,
+    ):
+        self.gateway = gateway
+        self.universe = universe
+        self.model = model
+        self.temperature = temperature
+
+    def invoke(self, input: Any, config: Optional[dict] = None, **kwargs):
+        return self.gateway.invoke(
+            input,
+            universe=self.universe,
+            model=self.model,
+            temperature=self.temperature,
+            **kwargs,
+        )
+
+
+# Shared by every module in the process
+gateway = LLMGateway()
@@ -0,0 +1,83 @@
+# metrics.py
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+import timing
+
+# Buckets span quick local stages (split, save) up to slow Gemini calls
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+STAGE_SECONDS = Histogram(
+    "deepthought_stage_seconds",
+    "Duration of backend processing stages",
+    ["stage", "call"],
+    buckets=STAGE_BUCKETS,
+)
+LLM_CALLS = Counter(
+    "deepthought_llm_calls_total",
+    "Number of LLM calls",
+    ["call"],
+)
+LLM_TOKENS = Counter(
+    "deepthought_llm_tokens_total",
+    "LLM tokens sent (in) and received (out)",
+    ["call", "direction"],
+)
+EMBEDDED_CHUNKS = Counter(
+    "deepthought_embedded_chunks_total",
+    "Chunks embedded by the embedding engine",
+)
+EMBEDDING_THROUGHPUT = Gauge(
+    "deepthought_embedding_chunks_per_second",
+    "Throughput of the most recent document embedding batch",
+    multiprocess_mode="max",
+)
+
+
+def _record_span(name, seconds, labels):
+    STAGE_SECONDS.labels(stage=name, call=labels.get("call", "")).observe(seconds)
+
+
+timing.add_listener(_record_span)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) when the provider reports none."""
+    return max(1, len(text) // 4) if text else 0
+
+
+def record_llm_call(call: str, prompt: str, response):
+    """Count one LLM call and its tokens, preferring the provider's usage metadata."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    content = getattr(response, "content", response)
+    tokens_in = usage.get("input_tokens") or estimate_tokens(prompt)
+    tokens_out = usage.get("output_tokens") or estimate_tokens(str(content))
+    LLM_CALLS.labels(call=call).inc()
+    LLM_TOKENS.labels(call=call, direction="in").inc(tokens_in)
+    LLM_TOKENS.labels(call=call, direction="out").inc(tokens_out)
+
+
+def record_embedding_batch(chunks: int, seconds: float):
+    """Count embedded chunks and publish the batch's chunks/second."""
+    EMBEDDED_CHUNKS.inc(chunks)
+    if seconds > 0:
+        EMBEDDING_THROUGHPUT.set(chunks / seconds)
+
+
+def render_metrics():
+    """Prometheus exposition of all metrics, aggregated across workers if
+    PROMETHEUS_MULTIPROC_DIR is set (e.g. under gunicorn)."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
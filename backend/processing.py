@@ -1,30 +1,19 @@
 # processing.py
 import os
 import json
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain_community.vectorstores import FAISS
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
-from langchain.docstore.document import Document
+import threading
 from dotenv import load_dotenv
+from metrics import record_llm_call
+from timing import span
 
 load_dotenv()
 
 # --- Configuration ---
-API_KEY = os.getenv("GOOGLE_API_KEY")
-if not API_KEY:
-    raise ValueError("GOOGLE_API_KEY not found in environment variables.")
-
 MODEL_NAME = "gemini-2.0-flash" 
 CHUNK_SIZE = 2000 # Adjust based on typical document structure and context window needs
 CHUNK_OVERLAP = 200
 SIMILARITY_K = 5 # Number of relevant chunks to retrieve for context
 
-# --- Initialize Langchain Components ---
-embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001", google_api_key=API_KEY) # Standard embedding model
-llm = ChatGoogleGenerativeAI(model=MODEL_NAME, google_api_key=API_KEY, temperature=0.3) # Lower temp for more factual extraction
-
 # --- Prompt Templates ---
 
 # 1. Knowledge Graph Extraction
@@ -49,8 +38,6 @@ Context:
 
 JSON Output:
 """
-KG_PROMPT = PromptTemplate(template=KG_PROMPT_TEMPLATE, input_variables=["context"])
-kg_chain = LLMChain(llm=llm, prompt=KG_PROMPT)
 
 # 2. Contradiction Detection
 CONTRADICTION_PROMPT_TEMPLATE = """
@@ -80,8 +67,6 @@ Context:
 
 JSON Contradiction List:
 """
-CONTRADICTION_PROMPT = PromptTemplate(template=CONTRADICTION_PROMPT_TEMPLATE, input_variables=["context"])
-contradiction_chain = LLMChain(llm=llm, prompt=CONTRADICTION_PROMPT)
 
 # 3. Speculation Boundary Identification
 SPECULATION_PROMPT_TEMPLATE = """
@@ -109,8 +94,132 @@ Context:
 
 JSON Speculation List:
 """
-SPECULATION_PROMPT = PromptTemplate(template=SPECULATION_PROMPT_TEMPLATE, input_variables=["context"])
-speculation_chain = LLMChain(llm=llm, prompt=SPECULATION_PROMPT)
+
+# 4. Combined per-document analysis, run once per uploaded file during ingestion
+FILE_ANALYSIS_PROMPT_TEMPLATE = """
+Analyze the provided text context and return three results in one JSON object:
+
+1. "knowledge_graph": entities (characters, locations, organizations, key objects, rules, cultural elements, significant events) and their relationships.
+   An object with "nodes" (each with 'id' (unique name), 'type', 'description' and 'confidence') and "edges" (each with 'source', 'target', 'relationship' and 'confidence').
+2. "contradictions": internal inconsistencies in character actions, timelines, established rules, object properties or location descriptions.
+   A list of objects with 'description', 'conflicting_statements' (a list of quoted strings) and 'confidence' (how likely it is a *genuine* contradiction).
+3. "speculation_boundaries": key elements categorized as established or open to interpretation.
+   A list of objects with 'element', 'category' ('Fact' or 'Speculation/Ambiguity') and 'confidence'.
+
+All 'confidence' scores are floats between 0.0 and 1.0 based *solely* on the provided text. Do not invent information.
+Use empty lists when nothing is found.
+
+Example:
+{{
+  "knowledge_graph": {{
+    "nodes": [{{ "id": "Frodo Baggins", "type": "Character", "description": "A hobbit of the Shire.", "confidence": 0.95 }}],
+    "edges": [{{ "source": "Frodo Baggins", "target": "The Shire", "relationship": "lives_in", "confidence": 0.98 }}]
+  }},
+  "contradictions": [],
+  "speculation_boundaries": [{{ "element": "The exact power of the Ring.", "category": "Speculation/Ambiguity", "confidence": 0.9 }}]
+}}
+
+Strictly adhere to the JSON format. Do not include any explanations outside the JSON structure.
+
+Context:
+{context}
+
+JSON Analysis Output:
+"""
+
+# 5. Combined per-document analysis without the knowledge graph, for universes
+# whose graph is built locally (NER + relation patterns) by the frontend
+FILE_REVIEW_PROMPT_TEMPLATE = """
+Analyze the provided text context and return two results in one JSON object:
+
+1. "contradictions": internal inconsistencies in character actions, timelines, established rules, object properties or location descriptions.
+   A list of objects with 'description', 'conflicting_statements' (a list of quoted strings) and 'confidence' (how likely it is a *genuine* contradiction).
+2. "speculation_boundaries": key elements categorized as established or open to interpretation.
+   A list of objects with 'element', 'category' ('Fact' or 'Speculation/Ambiguity') and 'confidence'.
+
+All 'confidence' scores are floats between 0.0 and 1.0 based *solely* on the provided text. Do not invent information.
+Use empty lists when nothing is found.
+
+Example:
+{{
+  "contradictions": [],
+  "speculation_boundaries": [{{ "element": "The exact power of the Ring.", "category": "Speculation/Ambiguity", "confidence": 0.9 }}]
+}}
+
+Strictly adhere to the JSON format. Do not include any explanations outside the JSON structure.
+
+Context:
+{context}
+
+JSON Analysis Output:
+"""
+
+# 6. Refinement of the uncertain parts of a locally built knowledge graph
+REFINE_GRAPH_PROMPT_TEMPLATE = """
+A knowledge graph for a fictional universe was extracted automatically. The candidates below are the entities and relationships the extractor was unsure about, each with the text it was found in.
+
+For each candidate node, decide whether it is a real entity of the story. Return it with its 'id', the correct 'type' (e.g., 'Character', 'Location', 'Organization', 'Object', 'Event'), a brief 'description' and a 'confidence' (a float between 0.0 and 1.0). Set "keep" to false for anything that is not an entity (a common word, a fragment, a misread name).
+For each candidate edge, return its 'source', 'target', 'relationship', 'confidence' and "keep", the same way.
+
+Base every decision *solely* on the given context. Do not add entities or relationships that are not among the candidates.
+
+Format the output strictly as a JSON object with two keys, "nodes" and "edges". Do not include any explanations outside the JSON structure.
+
+Candidates:
+{candidates}
+
+JSON Refined Graph:
+"""
+
+ANALYSIS_SECTIONS = ("knowledge_graph", "contradictions", "speculation_boundaries")
+
+# --- Langchain Components (built on first use) ---
+# Deferred so that importing this module is cheap and does not need GOOGLE_API_KEY
+_components = {}
+_components_lock = threading.Lock()
+
+def get_components():
+    """Return the embeddings, LLM and analysis chains, creating them on first call."""
+    if _components:
+        return _components
+    with _components_lock:
+        if _components:
+            return _components
+        from langchain.prompts import PromptTemplate
+        from langchain.chains import LLMChain
+        from fake_llm import FAKE_LLM_ENV
+        from llm_gateway import gateway
+
+        api_key = os.getenv("GOOGLE_API_KEY")
+        fake_llm_spec = os.getenv(FAKE_LLM_ENV) # Offline stand-in for benchmarks
+        if not api_key and not fake_llm_spec:
+            raise ValueError("GOOGLE_API_KEY not found in environment variables.")
+
+        if fake_llm_spec:
+            from langchain_core.embeddings import DeterministicFakeEmbedding
+            embeddings = DeterministicFakeEmbedding(size=768)
+        else:
+            from langchain_google_genai import GoogleGenerativeAIEmbeddings
+            embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001", google_api_key=api_key) # Standard embedding model
+        # Calls go through the shared gateway (limits, rate limiting, retries); the
+        # gateway swaps in the offline stand-in itself when FAKE_LLM_ENV is set
+        llm = gateway.llm(model=MODEL_NAME, temperature=0.3) # Lower temp for more factual extraction
+
+        def chain(template):
+            return LLMChain(llm=llm, prompt=PromptTemplate(template=template, input_variables=["context"]))
+
+        _components.update(
+            embeddings=embeddings,
+            llm=llm,
+            kg_chain=chain(KG_PROMPT_TEMPLATE),
+            contradiction_chain=chain(CONTRADICTION_PROMPT_TEMPLATE),
+            speculation_chain=chain(SPECULATION_PROMPT_TEMPLATE),
+        )
+    return _components
+
+def warm_up():
+    """Create the Gemini clients and chains ahead of the first /analyze request."""
+    get_components()
 
 # --- Core Processing Function ---
 
@@ -133,6 +242,119 @@ def clean_json_output(response_text):
         # If already a Python object (dict/list), return as is
         return response_text
 
+def analyze_document(text: str, llm, include_graph: bool = True) -> dict:
+    """
+    Extracts knowledge graph, contradictions and speculation boundaries for one
+    document with a single LLM call.
+
+    Used during ingestion, where the document has already been split, embedded
+    and indexed, so nothing is re-split or re-embedded here.
+
+    Args:
+        text: The document's text.
+        llm: Chat model to call.
+        include_graph: False when the knowledge graph is built locally; the
+            prompt then leaves it out and an empty graph is returned.
+
+    Returns:
+        A dictionary with the same keys as analyze_text().
+    """
+    template = FILE_ANALYSIS_PROMPT_TEMPLATE if include_graph else FILE_REVIEW_PROMPT_TEMPLATE
+    prompt = template.format(context=text)
+    try:
+        with span("llm", call="file_analysis"):
+            response = llm.invoke(prompt)
+        record_llm_call("file_analysis", prompt, response)
+        parsed = clean_json_output(getattr(response, "content", response))
+    except Exception as e:
+        print(f"Error in file analysis: {e}")
+        return {section: {"error": str(e)} for section in ANALYSIS_SECTIONS}
+
+    if not isinstance(parsed, dict):
+        print("Error decoding file analysis JSON:", parsed)
+        error = {"error": "Failed to parse analysis JSON from LLM.", "raw_output": str(parsed)}
+        return {section: error for section in ANALYSIS_SECTIONS}
+    empty_graph = {"nodes": [], "edges": []}
+    return {
+        "knowledge_graph": parsed.get("knowledge_graph", empty_graph) if include_graph else empty_graph,
+        "contradictions": parsed.get("contradictions", []),
+        "speculation_boundaries": parsed.get("speculation_boundaries", []),
+    }
+
+def refine_graph(candidates: dict, llm) -> dict:
+    """
+    Asks the LLM about the uncertain nodes and edges of a locally built graph.
+
+    Only the candidates (with their context snippets) are sent, not the
+    document, so the prompt stays small.
+
+    Args:
+        candidates: {"nodes": [...], "edges": [...]} in knowledge-graph format,
+            each item with a 'context' snippet.
+        llm: Chat model to call.
+
+    Returns:
+        {"nodes": [...], "edges": [...]} with corrected items, each carrying a
+        'keep' flag, or {"error": ...} if the call or parsing failed.
+    """
+    prompt = REFINE_GRAPH_PROMPT_TEMPLATE.format(candidates=json.dumps(candidates, indent=1))
+    try:
+        with span("llm", call="graph_refinement"):
+            response = llm.invoke(prompt)
+        record_llm_call("graph_refinement", prompt, response)
+        parsed = clean_json_output(getattr(response, "content", response))
+    except Exception as e:
+        print(f"Error in graph refinement: {e}")
+        return {"error": str(e)}
+
+    if not isinstance(parsed, dict):
+        print("Error decoding graph refinement JSON:", parsed)
+        return {"error": "Failed to parse refinement JSON from LLM.", "raw_output": str(parsed)}
+    return {"nodes": parsed.get("nodes", []), "edges": parsed.get("edges", [])}
+
+def merge_analyses(analyses) -> dict:
+    """
+    Merges per-document analyses into one universe-wide analysis.
+
+    Nodes are merged by id and edges by (source, target, relationship), keeping
+    the highest confidence; contradictions and speculation boundaries are
+    concatenated in document order. Sections that failed for a document are
+    skipped.
+
+    Args:
+        analyses: Iterable of analyze_document() results.
+
+    Returns:
+        A dictionary with the same keys as analyze_text().
+    """
+    nodes, edges = {}, {}
+    contradictions, speculation = [], []
+    for analysis in analyses:
+        graph = analysis.get("knowledge_graph")
+        if isinstance(graph, dict) and "error" not in graph:
+            for node in graph.get("nodes", []):
+                if not isinstance(node, dict) or "id" not in node:
+                    continue
+                kept = nodes.get(node["id"])
+                if kept is None or node.get("confidence", 0) > kept.get("confidence", 0):
+                    nodes[node["id"]] = node
+            for edge in graph.get("edges", []):
+                if not isinstance(edge, dict):
+                    continue
+                key = (edge.get("source"), edge.get("target"), edge.get("relationship"))
+                kept = edges.get(key)
+                if kept is None or edge.get("confidence", 0) > kept.get("confidence", 0):
+                    edges[key] = edge
+        if isinstance(analysis.get("contradictions"), list):
+            contradictions.extend(analysis["contradictions"])
+        if isinstance(analysis.get("speculation_boundaries"), list):
+            speculation.extend(analysis["speculation_boundaries"])
+    return {
+        "knowledge_graph": {"nodes": list(nodes.values()), "edges": list(edges.values())},
+        "contradictions": contradictions,
+        "speculation_boundaries": speculation,
+    }
+
 def analyze_text(text: str) -> dict:
     """
     Analyzes the input text to extract knowledge graph, contradictions, and speculation boundaries.
@@ -146,14 +368,25 @@ def analyze_text(text: str) -> dict:
     if not text:
         return {"error": "Input text is empty."}
 
+    from langchain_community.vectorstores import FAISS
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from langchain.docstore.document import Document
+
     try:
+        components = get_components()
+        embeddings = components["embeddings"]
+        kg_chain = components["kg_chain"]
+        contradiction_chain = components["contradiction_chain"]
+        speculation_chain = components["speculation_chain"]
+
         # 1. Split text into manageable chunks
         text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=CHUNK_SIZE,
             chunk_overlap=CHUNK_OVERLAP,
             length_function=len,
         )
-        docs = [Document(page_content=chunk) for chunk in text_splitter.split_text(text)]
+        with span("split"):
+            docs = [Document(page_content=chunk) for chunk in text_splitter.split_text(text)]
         if not docs:
              return {"error": "Text could not be split into documents."}
 
@@ -161,7 +394,11 @@ def analyze_text(text: str) -> dict:
 
         # 2. Create Vector Store for context retrieval
         print("Creating vector store...")
-        vector_store = FAISS.from_documents(docs, embeddings)
+        texts = [doc.page_content for doc in docs]
+        with span("embed"):
+            vectors = embeddings.embed_documents(texts)
+        with span("index"):
+            vector_store = FAISS.from_embeddings(list(zip(texts, vectors)), embeddings)
         print("Vector store created.")
 
         # For simplicity in this example, we'll use the *entire* text as context
@@ -178,7 +415,9 @@ def analyze_text(text: str) -> dict:
 
         print("Extracting Knowledge Graph...")
         try:
-            kg_result_raw = kg_chain.run(context=full_context)
+            with span("llm", call="knowledge_graph"):
+                kg_result_raw = kg_chain.run(context=full_context)
+            record_llm_call("knowledge_graph", full_context, kg_result_raw)
             kg_result = clean_json_output(kg_result_raw)
             if isinstance(kg_result, (dict, list)):
                 results["knowledge_graph"] = kg_result
@@ -194,7 +433,9 @@ def analyze_text(text: str) -> dict:
 
         print("Detecting Contradictions...")
         try:
-            contradiction_result_raw = contradiction_chain.run(context=full_context)
+            with span("llm", call="contradiction"):
+                contradiction_result_raw = contradiction_chain.run(context=full_context)
+            record_llm_call("contradiction", full_context, contradiction_result_raw)
             contradiction_result = clean_json_output(contradiction_result_raw)
             if isinstance(contradiction_result, (dict, list)):
                 results["contradictions"] = contradiction_result
@@ -210,7 +451,9 @@ def analyze_text(text: str) -> dict:
 
         print("Identifying Speculation Boundaries...")
         try:
-            speculation_result_raw = speculation_chain.run(context=full_context)
+            with span("llm", call="speculation"):
+                speculation_result_raw = speculation_chain.run(context=full_context)
+            record_llm_call("speculation", full_context, speculation_result_raw)
             speculation_result = clean_json_output(speculation_result_raw)
             if isinstance(speculation_result, (dict, list)):
                 results["speculation_boundaries"] = speculation_result
@@ -0,0 +1,57 @@
+import hashlib
+import os
+import re
+import sys
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+# The backend's modules import each other as top-level modules (run from backend/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_llm import FAKE_LLM_ENV  # noqa: E402
+
+
+class HashEmbeddings(Embeddings):
+    """Offline bag-of-words embeddings: texts sharing words get similar vectors."""
+
+    def __init__(self, dim: int = 64):
+        self.dim = dim
+        self.documents_embedded = 0
+
+    def _vector(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.dim] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        self.documents_embedded += len(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+@pytest.fixture
+def embeddings():
+    return HashEmbeddings()
+
+
+@pytest.fixture
+def universe(tmp_path, monkeypatch, embeddings):
+    """An empty universe folder, with StoryVectorDatabase running offline in tmp_path."""
+    import fin
+    import llm_gateway
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv(FAKE_LLM_ENV, "fixed:0")
+    monkeypatch.setattr(llm_gateway.gateway, "_bucket", None)
+    monkeypatch.setattr(llm_gateway.gateway, "_clients", {})
+    monkeypatch.setitem(fin._shared, "embeddings", embeddings)
+    folder = tmp_path / "story"
+    folder.mkdir()
+    return folder
@@ -0,0 +1,83 @@
+import os
+
+from answer_cache import SemanticAnswerCache, conversation_key, is_follow_up
+
+
+def _cache(tmp_path, version=1, **kwargs):
+    return SemanticAnswerCache(
+        str(tmp_path / "cache" / "answers.json"), version, **kwargs
+    )
+
+
+def test_lookup_matches_above_threshold_only(tmp_path):
+    cache = _cache(tmp_path, threshold=0.95)
+    cache.store("who is the hero?", [1.0, 0.0], "", "Arya", [])
+
+    assert cache.lookup([0.99, 0.05])["answer"] == "Arya"
+    assert cache.lookup([0.6, 0.8]) is None
+
+
+def test_lookup_is_scoped_to_conversation_state(tmp_path):
+    cache = _cache(tmp_path)
+    cache.store("what about her?", [1.0, 0.0], "history-a", "Sansa", [])
+
+    assert cache.lookup([1.0, 0.0], "history-b") is None
+    assert cache.lookup([1.0, 0.0], "") is None
+    assert cache.lookup([1.0, 0.0], "history-a")["answer"] == "Sansa"
+
+
+def test_entries_persist_for_the_same_universe_version(tmp_path):
+    _cache(tmp_path, version=3).store("q", [0.0, 1.0], "", "a", [{"file_id": "b.txt"}])
+
+    reloaded = _cache(tmp_path, version=3)
+    assert reloaded.lookup([0.0, 1.0])["sources"] == [{"file_id": "b.txt"}]
+
+
+def test_new_universe_version_invalidates(tmp_path):
+    _cache(tmp_path, version=3).store("q", [0.0, 1.0], "", "a", [])
+
+    assert _cache(tmp_path, version=4).lookup([0.0, 1.0]) is None
+
+
+def test_clear_removes_entries_and_file(tmp_path):
+    cache = _cache(tmp_path)
+    cache.store("q", [1.0], "", "a", [])
+    cache.clear()
+
+    assert cache.lookup([1.0]) is None
+    assert not os.path.exists(cache.cache_path)
+
+
+def test_oldest_entries_are_evicted(tmp_path):
+    cache = _cache(tmp_path, max_entries=2)
+    for i, vector in enumerate(([1.0, 0.0], [0.0, 1.0], [-1.0, 0.0])):
+        cache.store(f"q{i}", vector, "", f"a{i}", [])
+
+    assert [e["answer"] for e in cache.entries] == ["a1", "a2"]
+    assert cache.lookup([1.0, 0.0]) is None
+
+
+def test_follow_ups_are_keyed_by_history():
+    history = [{"question": "Who is Arya?", "answer": "A Stark."}]
+
+    assert is_follow_up("What about her sister?")
+    assert not is_follow_up("Who rules the North?")
+    assert conversation_key("Who rules the North?", history) == ""
+    assert conversation_key("What about her sister?", []) == ""
+    key = conversation_key("What about her sister?", history)
+    assert key and key != conversation_key("What about her sister?", history + history)
+
+
+def test_query_reuses_answers_until_the_files_change(universe):
+    import fin
+
+    (universe / "a.txt").write_text("Arya rode north to Winterfell. " * 100)
+    db = fin.StoryVectorDatabase(str(universe))
+    db.process_file("a.txt")
+
+    assert "cached" not in db.query("Who rode north?")
+    assert db.query("Who rode north?")["cached"]
+
+    (universe / "b.txt").write_text("Sansa stayed in the capital. " * 100)
+    db.process_file("b.txt")
+    assert "cached" not in db.query("Who rode north?")
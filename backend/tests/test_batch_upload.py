@@ -0,0 +1,58 @@
+import fin
+
+
+def _count_reconciles(monkeypatch):
+    calls = []
+    reconcile = fin.StoryVectorDatabase._reconcile_story_information
+
+    def counted(self):
+        calls.append(self.folder_name)
+        return reconcile(self)
+
+    monkeypatch.setattr(
+        fin.StoryVectorDatabase, "_reconcile_story_information", counted
+    )
+    return calls
+
+
+def test_files_uploaded_reconciles_once_for_the_batch(universe, monkeypatch):
+    calls = _count_reconciles(monkeypatch)
+    (universe / "a.txt").write_text("Arya rode north to Winterfell. " * 50)
+    (universe / "b.txt").write_text("Sansa stayed in the capital. " * 50)
+
+    result = fin.files_uploaded(str(universe), ["a.txt", "b.txt"])
+
+    assert result["files"] == ["a.txt", "b.txt"]
+    assert "analysis" in result
+    assert calls == ["story"]
+    db = fin.StoryVectorDatabase(str(universe))
+    assert db.metadata["files_processed"] == ["a.txt", "b.txt"]
+    assert db.vector_store.index.ntotal == sum(
+        end - start
+        for ranges in db.metadata["file_ranges"].values()
+        for start, end in ranges
+    )
+
+
+def test_missing_and_known_files_are_skipped(universe, monkeypatch):
+    (universe / "a.txt").write_text("Arya rode north to Winterfell. " * 50)
+    fin.files_uploaded(str(universe), ["a.txt"])
+    calls = _count_reconciles(monkeypatch)
+
+    result = fin.files_uploaded(str(universe), ["a.txt", "missing.txt"])
+
+    assert result["files"] == []
+    assert calls == []
+
+
+def test_process_folder_ingests_every_text_file_in_one_batch(universe, monkeypatch):
+    calls = _count_reconciles(monkeypatch)
+    for name in ("b.txt", "a.txt"):
+        (universe / name).write_text(f"The tale of {name}. " * 50)
+    (universe / "notes.md").write_text("not a story")
+
+    db = fin.StoryVectorDatabase(str(universe))
+    db.process_folder()
+
+    assert db.metadata["files_processed"] == ["a.txt", "b.txt"]
+    assert calls == ["story"]
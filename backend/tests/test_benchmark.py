@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from benchmark import corpus_text, percentile, synthetic_text
+from fake_llm import FakeChatModel, fake_response, get_fake_llm, parse_latency_spec
+
+
+def test_synthetic_text_is_deterministic_and_sized():
+    text = synthetic_text(5000, seed=7)
+
+    assert len(text) == 5000
+    assert text == synthetic_text(5000, seed=7)
+    assert text != synthetic_text(5000, seed=8)
+
+
+def test_corpus_text_repeats_short_corpora(tmp_path):
+    (tmp_path / "a.txt").write_text("abc")
+    (tmp_path / "b.md").write_text("ignored")
+
+    assert corpus_text([str(tmp_path)], 10) == "abc\n\nabc\n\n"
+
+
+def test_percentile_is_nearest_rank():
+    values = [5, 1, 4, 2, 3]
+
+    assert percentile(values, 50) == 3
+    assert percentile(values, 100) == 5
+    assert percentile([], 95) == 0.0
+
+
+@pytest.mark.parametrize(
+    "spec, expected",
+    [
+        ("fixed:0.5", ("fixed", [0.5])),
+        ("uniform:0.1,0.3", ("uniform", [0.1, 0.3])),
+        ("lognormal:0.8,0.4", ("lognormal", [0.8, 0.4])),
+    ],
+)
+def test_parse_latency_spec(spec, expected):
+    assert parse_latency_spec(spec) == expected
+
+
+@pytest.mark.parametrize("spec", ["gamma:1,2", "uniform:1", "fixed:1,2"])
+def test_parse_latency_spec_rejects_unknown_forms(spec):
+    with pytest.raises(ValueError):
+        parse_latency_spec(spec)
+
+
+def test_latency_samples_are_seeded():
+    first = FakeChatModel(latency="uniform:0,1", seed=3)
+    second = FakeChatModel(latency="uniform:0,1", seed=3)
+
+    assert [first.sample_latency() for _ in range(5)] == [
+        second.sample_latency() for _ in range(5)
+    ]
+    assert FakeChatModel(latency="normal:0,5").sample_latency() >= 0.0
+
+
+def test_fake_llm_is_shared_per_spec():
+    assert get_fake_llm("fixed:0") is get_fake_llm("fixed:0")
+    assert get_fake_llm("fixed:0") is not get_fake_llm("fixed:0", seed=1)
+
+
+def test_fake_responses_match_the_prompt_format():
+    analysis = json.loads(fake_response("Arya met Sansa.\nJSON Analysis Output:"))
+    assert {"knowledge_graph", "contradictions", "speculation_boundaries"} <= set(
+        analysis
+    )
+    assert {"Arya", "Sansa"} <= {n["id"] for n in analysis["knowledge_graph"]["nodes"]}
+
+    prompt = "Who is Arya?"
+    assert fake_response(prompt) == fake_response(prompt)
+    assert get_fake_llm("fixed:0").invoke(prompt).content == fake_response(prompt)
@@ -0,0 +1,77 @@
+import random
+
+from chunking import MAX_CHUNK, MIN_CHUNK, chunk_text, group_chunks
+
+
+def _story(paragraphs=60, seed=1):
+    rng = random.Random(seed)
+    words = "Arya Sansa rode north sword winter wolf castle night river king".split()
+    return "\n\n".join(
+        " ".join(
+            " ".join(rng.choice(words) for _ in range(rng.randint(5, 15))) + "."
+            for _ in range(rng.randint(2, 8))
+        )
+        for _ in range(paragraphs)
+    )
+
+
+def test_chunks_cover_the_text_within_the_size_bounds():
+    text = _story()
+    chunks = chunk_text(text)
+
+    assert "".join(c["text"] for c in chunks) == text
+    assert [c["start"] for c in chunks] == [
+        sum(len(c["text"]) for c in chunks[:i]) for i in range(len(chunks))
+    ]
+    assert all(len(c["text"]) <= MAX_CHUNK for c in chunks)
+    assert all(len(c["text"]) >= MIN_CHUNK for c in chunks[:-1])
+    # Chunks end at a sentence or paragraph break
+    assert all(c["text"].rstrip().endswith(".") for c in chunks)
+
+
+def test_an_edit_only_changes_the_chunks_around_it():
+    text = _story()
+    middle = text.index(".", len(text) // 2) + 1
+    edited = text[:middle] + " Then the dragon came." + text[middle:]
+
+    before = [c["hash"] for c in chunk_text(text)]
+    after = [c["hash"] for c in chunk_text(edited)]
+
+    changed = set(after) - set(before)
+    assert 1 <= len(changed) <= 2
+    assert len(set(before) & set(after)) >= len(before) - 2
+
+
+def test_text_without_breaks_is_cut_at_spaces_then_mid_word():
+    spaced = chunk_text("word " * 1000)
+    assert all(c["text"].endswith(" ") for c in spaced[:-1])
+    assert all(len(c["text"]) <= MAX_CHUNK for c in spaced)
+
+    unbroken = chunk_text("x" * 4000)
+    assert [len(c["text"]) for c in unbroken] == [MAX_CHUNK, MAX_CHUNK, 1000]
+
+
+def test_whitespace_only_pieces_are_skipped():
+    assert chunk_text("") == []
+    assert chunk_text("   \n\n  ") == []
+
+
+def _contents(chunks, sections):
+    return {tuple(chunks[i]["hash"] for i in section) for section in sections}
+
+
+def test_sections_group_consecutive_chunks_stably():
+    chunks = chunk_text(_story(paragraphs=400))
+    sections = group_chunks(chunks, min_size=4000, max_size=12000)
+
+    assert [i for section in sections for i in section] == list(range(len(chunks)))
+    assert len(sections) > 2
+    for section in sections:
+        size = sum(len(chunks[i]["text"]) for i in section)
+        assert size <= 12000 or len(section) == 1
+
+    # Dropping the first chunk leaves the later sections' contents unchanged
+    shifted = group_chunks(chunks[1:], min_size=4000, max_size=12000)
+    assert len(_contents(chunks, sections) & _contents(chunks[1:], shifted)) >= (
+        len(sections) - 2
+    )
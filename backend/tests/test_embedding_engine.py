@@ -0,0 +1,108 @@
+import importlib
+
+import numpy as np
+
+import embedding_engine
+from embedding_engine import EmbeddingEngine
+
+
+class StubModel:
+    """Records how the engine drives sentence-transformers, without loading weights."""
+
+    def __init__(self):
+        self.calls = []
+        self.pools_started = 0
+        self.pools_stopped = 0
+
+    def encode(self, texts, batch_size=32, show_progress_bar=None):
+        self.calls.append(("encode", list(texts), batch_size))
+        return np.array([[len(t), 1.0] for t in texts], dtype=np.float32)
+
+    def start_multi_process_pool(self, target_devices):
+        self.pools_started += 1
+        return {"devices": target_devices}
+
+    def stop_multi_process_pool(self, pool):
+        self.pools_stopped += 1
+
+    def encode_multi_process(self, texts, pool, batch_size=32):
+        self.calls.append(("pool", list(texts), batch_size))
+        return np.array([[len(t), 2.0] for t in texts], dtype=np.float32)
+
+
+def _engine(**kwargs):
+    # Skips __init__, which loads the real model
+    engine = EmbeddingEngine.__new__(EmbeddingEngine)
+    engine.model = StubModel()
+    engine.batch_size = kwargs.get("batch_size", 16)
+    engine.processes = kwargs.get("processes", 2)
+    engine.multi_process_min_texts = kwargs.get("multi_process_min_texts", 4)
+    engine._pool = None
+    engine._pool_lock = embedding_engine.threading.Lock()
+    engine.chunks_embedded = 0
+    engine.seconds_embedding = 0.0
+    return engine
+
+
+def test_small_jobs_are_embedded_in_process():
+    engine = _engine()
+
+    vectors = engine.embed_documents(["a\nb", "cd"])
+
+    assert vectors == [[3.0, 1.0], [2.0, 1.0]]
+    assert engine.model.calls == [("encode", ["a b", "cd"], 16)]
+    assert engine.model.pools_started == 0
+
+
+def test_large_jobs_use_one_shared_pool():
+    engine = _engine(multi_process_min_texts=3)
+
+    engine.embed_documents(["x"] * 3)
+    engine.embed_documents(["y"] * 5)
+    engine.close()
+
+    assert [kind for kind, _, _ in engine.model.calls] == ["pool", "pool"]
+    assert engine.model.pools_started == 1
+    assert engine.model.pools_stopped == 1
+    assert engine._pool is None
+
+
+def test_single_process_never_starts_a_pool():
+    engine = _engine(processes=1, multi_process_min_texts=1)
+
+    engine.embed_documents(["x"] * 10)
+
+    assert engine.model.pools_started == 0
+
+
+def test_queries_are_always_in_process():
+    engine = _engine(multi_process_min_texts=0)
+
+    assert engine.embed_query("a\nb") == [3.0, 1.0]
+    assert engine.model.calls[0][0] == "encode"
+
+
+def test_throughput_counts_embedded_chunks():
+    engine = _engine()
+    assert engine.throughput() == 0.0
+    assert engine.embed_documents([]) == []
+
+    engine.embed_documents(["a", "b", "c"])
+
+    assert engine.chunks_embedded == 3
+    assert engine.throughput() > 0
+
+
+def test_default_pool_is_a_share_of_the_cores(monkeypatch):
+    monkeypatch.delenv("EMBED_PROCESSES", raising=False)
+    monkeypatch.setattr("os.cpu_count", lambda: 16)
+    try:
+        monkeypatch.setenv("WEB_CONCURRENCY", "4")
+        assert importlib.reload(embedding_engine).PROCESSES == 4
+        monkeypatch.setenv("WEB_CONCURRENCY", "32")
+        assert importlib.reload(embedding_engine).PROCESSES == 1
+        monkeypatch.setenv("EMBED_PROCESSES", "3")
+        assert importlib.reload(embedding_engine).PROCESSES == 3
+    finally:
+        monkeypatch.undo()
+        importlib.reload(embedding_engine)
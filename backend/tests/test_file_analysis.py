@@ -0,0 +1,76 @@
+import pytest
+
+import fin
+import processing
+from chunking import SECTION_MAX
+
+
+@pytest.fixture
+def analyzed(monkeypatch):
+    """Texts sent to analyze_document; the whole-text /analyze path must not run."""
+    texts = []
+    analyze = processing.analyze_document
+
+    def counted(text, llm, **kwargs):
+        texts.append(text)
+        return analyze(text, llm, **kwargs)
+
+    def analyze_text(text):
+        pytest.fail("the whole universe was analyzed again")
+
+    monkeypatch.setattr(processing, "analyze_document", counted)
+    monkeypatch.setattr(processing, "analyze_text", analyze_text)
+    return texts
+
+
+def _node_ids(analysis):
+    return {node["id"] for node in analysis["knowledge_graph"]["nodes"]}
+
+
+def test_uploads_return_the_universe_analysis(universe, analyzed):
+    (universe / "a.txt").write_text("Arya rode north to Winterfell with Nymeria. " * 50)
+    (universe / "b.txt").write_text("Sansa stayed in Kingslanding with Cersei. " * 50)
+
+    first = fin.file_uploaded(str(universe), "a.txt")["analysis"]
+    both = fin.files_uploaded(str(universe), ["b.txt"])["analysis"]
+
+    assert len(analyzed) == 2
+    assert {"Arya", "Winterfell", "Nymeria"} <= _node_ids(first)
+    assert not {"Sansa", "Cersei"} & _node_ids(first)
+    assert {"Arya", "Sansa", "Cersei"} <= _node_ids(both)
+    assert set(both) == {"knowledge_graph", "contradictions", "speculation_boundaries"}
+    # Stored per file, so a fresh worker serves the analysis without the LLM
+    assert fin.StoryVectorDatabase(str(universe)).universe_analysis() == both
+    assert len(analyzed) == 2
+
+
+def test_deleting_a_file_removes_its_analysis(universe, analyzed):
+    (universe / "a.txt").write_text("Arya rode north to Winterfell with Nymeria. " * 50)
+    (universe / "b.txt").write_text("Sansa stayed in Kingslanding with Cersei. " * 50)
+    fin.files_uploaded(str(universe), ["a.txt", "b.txt"])
+
+    analysis = fin.file_deleted(str(universe), "a.txt")["analysis"]
+
+    assert not {"Arya", "Winterfell", "Nymeria"} & _node_ids(analysis)
+    assert {"Sansa", "Kingslanding", "Cersei"} <= _node_ids(analysis)
+    db = fin.StoryVectorDatabase(str(universe))
+    assert list(db.metadata["file_analysis"]) == ["b.txt"]
+    assert db.universe_analysis() == analysis
+
+
+def test_large_files_are_analyzed_in_sections_and_merged(universe, analyzed):
+    first = "Tyrion drank wine at Casterly Rock and Tyrion laughed. " * 300
+    second = "Daenerys flew her dragons over Meereen and Daenerys won. " * 300
+    text = first + "\n\n" + second
+    (universe / "saga.txt").write_text(text)
+
+    analysis = fin.file_uploaded(str(universe), "saga.txt")["analysis"]
+
+    assert len(analyzed) >= 2
+    assert all(len(section) <= SECTION_MAX for section in analyzed)
+    assert sum(len(section) for section in analyzed) == len(text)
+    ids = [node["id"] for node in analysis["knowledge_graph"]["nodes"]]
+    assert {"Tyrion", "Daenerys"} <= set(ids)
+    assert len(ids) == len(set(ids))
+    sections = fin.StoryVectorDatabase(str(universe)).metadata["section_analysis"]
+    assert len(sections["saga.txt"]) == len(analyzed)
@@ -0,0 +1,98 @@
+import random
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import fin
+from test_incremental_update import _check_positions
+
+VOCABULARY = {
+    "a.txt": "Arya sword needle wolf north winter",
+    "b.txt": "Tyrion wine gold lion rock debt",
+    "c.txt": "Daenerys dragon fire egg sea queen",
+}
+
+
+def _text(words, seed, paragraphs=40):
+    rng = random.Random(seed)
+    words = words.split()
+    return "\n\n".join(
+        " ".join(rng.choice(words) for _ in range(rng.randint(20, 60))) + "."
+        for _ in range(paragraphs)
+    )
+
+
+@pytest.fixture
+def story_db(universe):
+    for seed, (name, words) in enumerate(VOCABULARY.items()):
+        (universe / name).write_text(_text(words, seed))
+    db = fin.StoryVectorDatabase(str(universe))
+    db.process_files(list(VOCABULARY))
+    return db
+
+
+def _nearest_in_file(db, query, file_id, k):
+    """Brute force: chunk ids of the file's k chunks nearest to the query."""
+    store = db.vector_store
+    query = np.array(db.embeddings.embed_query(query), dtype=np.float32)
+    scored = []
+    for start, end in db.metadata["file_ranges"][file_id]:
+        for position in range(start, end):
+            distance = float(np.sum((store.index.reconstruct(position) - query) ** 2))
+            doc = store.docstore.search(store.index_to_docstore_id[position])
+            scored.append((distance, doc.metadata["chunk_id"]))
+    return [chunk_id for _, chunk_id in sorted(scored)[:k]]
+
+
+def _chunk_ids(docs):
+    return [doc.metadata["chunk_id"] for doc in docs]
+
+
+def test_search_in_one_file_returns_its_nearest_chunks(story_db):
+    ranges = story_db.metadata["file_ranges"]
+    assert all(sum(end - start for start, end in ranges[f]) > 3 for f in VOCABULARY)
+    # The query matches a.txt best, but only b.txt is searched
+    docs = story_db.similarity_search_in_files("Arya wolf wine", ["b.txt"], k=3)
+
+    assert {doc.metadata["file_id"] for doc in docs} == {"b.txt"}
+    assert _chunk_ids(docs) == _nearest_in_file(story_db, "Arya wolf wine", "b.txt", 3)
+    both = story_db.similarity_search_in_files("dragon gold", ["b.txt", "c.txt"], k=50)
+    assert {doc.metadata["file_id"] for doc in both} == {"b.txt", "c.txt"}
+    assert story_db.similarity_search_in_files("dragon", ["missing.txt"], k=3) == []
+
+
+def test_ranges_shift_when_an_earlier_file_is_removed(story_db):
+    ranges = story_db.metadata["file_ranges"]
+    removed = sum(end - start for start, end in ranges["a.txt"])
+    expected = {
+        f: [[start - removed, end - removed] for start, end in ranges[f]]
+        for f in ("b.txt", "c.txt")
+    }
+
+    story_db._remove_file_entries("a.txt")
+
+    assert story_db.metadata["file_ranges"] == expected
+    _check_positions(story_db)
+    docs = story_db.similarity_search_in_files("dragon fire", ["c.txt"], k=3)
+    assert {doc.metadata["file_id"] for doc in docs} == {"c.txt"}
+    assert _chunk_ids(docs) == _nearest_in_file(story_db, "dragon fire", "c.txt", 3)
+    reloaded = fin.StoryVectorDatabase(story_db.folder_path)
+    assert reloaded.metadata["file_ranges"] == expected
+
+
+def test_partial_removals_close_only_the_compacted_gaps():
+    ranges = {"a": [[0, 4]], "b": [[4, 8], [10, 12]], "c": [[8, 10]]}
+    db = SimpleNamespace(metadata={"file_ranges": ranges})
+
+    fin.StoryVectorDatabase._shift_file_ranges(db, [[2, 5]])
+    assert db.metadata["file_ranges"] == {
+        "a": [[0, 2]],
+        "b": [[2, 5], [7, 9]],
+        "c": [[5, 7]],
+    }
+
+    # Tombstoned positions are dropped but nothing moves
+    db.metadata["file_ranges"] = ranges
+    fin.StoryVectorDatabase._shift_file_ranges(db, [[2, 5], [8, 10]], compacted=[])
+    assert db.metadata["file_ranges"] == {"a": [[0, 2]], "b": [[5, 8], [10, 12]]}
@@ -0,0 +1,142 @@
+import os
+
+import pytest
+
+import fin
+import processing
+from test_chunking import _story
+
+
+def _check_positions(db):
+    """Every file's position ranges hold exactly its chunks, in order."""
+    store = db.vector_store
+    covered = 0
+    for file_id, ranges in db.metadata["file_ranges"].items():
+        docs = [
+            store.docstore.search(store.index_to_docstore_id[p])
+            for start, end in ranges
+            for p in range(start, end)
+        ]
+        covered += len(docs)
+        assert {doc.metadata["file_id"] for doc in docs} == {file_id}
+        assert [d.metadata["chunk_hash"] for d in docs] == db.metadata["chunk_hashes"][
+            file_id
+        ]
+        text = "".join(
+            d.page_content for d in sorted(docs, key=lambda d: d.metadata["chunk_id"])
+        )
+        with open(os.path.join(db.folder_path, file_id), encoding="utf-8") as f:
+            assert text == f.read()
+    assert covered == store.index.ntotal
+
+
+@pytest.fixture
+def analyzed(monkeypatch):
+    """Sections sent to analyze_document."""
+    sections = []
+    analyze = processing.analyze_document
+
+    def counted(text, llm, **kwargs):
+        sections.append(text)
+        return analyze(text, llm, **kwargs)
+
+    monkeypatch.setattr(processing, "analyze_document", counted)
+    return sections
+
+
+@pytest.fixture
+def story_db(universe):
+    (universe / "a.txt").write_text(_story(paragraphs=200, seed=1))
+    (universe / "b.txt").write_text(_story(paragraphs=200, seed=2))
+    db = fin.StoryVectorDatabase(str(universe))
+    db.process_files(["a.txt", "b.txt"])
+    return db
+
+
+def _edit(universe, name):
+    text = (universe / name).read_text()
+    middle = text.index(".", len(text) // 2) + 1
+    (universe / name).write_text(
+        text[:middle] + " Then the dragon came." + text[middle:]
+    )
+
+
+def test_an_edit_embeds_and_analyzes_only_what_changed(
+    universe, story_db, embeddings, analyzed
+):
+    embedded = embeddings.documents_embedded
+    sections = len(story_db.metadata["section_analysis"]["a.txt"])
+    _edit(universe, "a.txt")
+
+    story_db.update_file("a.txt")
+
+    assert 1 <= embeddings.documents_embedded - embedded <= 2
+    assert 1 <= len(analyzed) < sections
+    _check_positions(story_db)
+    _check_positions(fin.StoryVectorDatabase(str(universe)))
+
+
+def test_unchanged_files_are_left_alone(universe, story_db, embeddings, analyzed):
+    embedded = embeddings.documents_embedded
+    version = story_db.metadata["universe_version"]
+
+    story_db.update_file("b.txt")
+
+    assert embeddings.documents_embedded == embedded
+    assert analyzed == []
+    assert story_db.metadata["universe_version"] == version
+
+
+def test_editing_an_earlier_file_shifts_the_later_ranges(universe, story_db):
+    b_ranges = story_db.metadata["file_ranges"]["b.txt"]
+    _edit(universe, "a.txt")
+
+    story_db.update_file("a.txt")
+
+    # a's changed chunks were removed from before b and re-added at the end
+    assert story_db.metadata["file_ranges"]["b.txt"] != b_ranges
+    assert len(story_db.metadata["file_ranges"]["a.txt"]) == 2
+    _check_positions(story_db)
+
+
+def test_re_extraction_replaces_the_files_results(universe, story_db):
+    _edit(universe, "b.txt")
+    story_db.update_file("b.txt")
+    _edit(universe, "a.txt")
+    story_db.update_file("a.txt")
+
+    for key in ("timeline_events", "potential_contradictions"):
+        assert [e["file_id"] for e in story_db.metadata[key]] == ["a.txt", "b.txt"]
+    assert set(story_db.metadata["extractions"]["a.txt"]) == {
+        "character",
+        "timeline",
+        "contradiction",
+        "resolution",
+    }
+
+
+def test_removing_a_file_clears_its_metadata_without_re_embedding(
+    universe, story_db, embeddings
+):
+    embedded = embeddings.documents_embedded
+
+    story_db._remove_file_entries("a.txt")
+
+    assert embeddings.documents_embedded == embedded
+    assert story_db.metadata["files_processed"] == ["b.txt"]
+    for key in (
+        "file_ranges",
+        "chunk_hashes",
+        "extractions",
+        "section_analysis",
+        "file_analysis",
+        "character_info",
+    ):
+        assert "a.txt" not in story_db.metadata[key]
+    for key in ("timeline_events", "potential_contradictions"):
+        assert [e["file_id"] for e in story_db.metadata[key]] == ["b.txt"]
+    assert story_db.metadata["file_ranges"]["b.txt"][0][0] == 0
+    _check_positions(story_db)
+
+    story_db._remove_file_entries("b.txt")
+    assert story_db.vector_store is None
@@ -0,0 +1,38 @@
+import json
+import os
+import subprocess
+import sys
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in a fresh interpreter: other tests have already imported FAISS and LangChain
+SCRIPT = """
+import json, sys
+import app
+
+client = app.app.test_client()
+responses = [
+    client.get("/").status_code,
+    client.post("/folder_deleted", json={"folder_path": "universes/story"}).status_code,
+]
+heavy = sorted({m.split(".")[0] for m in sys.modules} & {"langchain_community", "faiss"})
+print(json.dumps({"responses": responses, "heavy": heavy}))
+"""
+
+
+def test_lightweight_routes_do_not_load_langchain_or_faiss(tmp_path):
+    env = {k: v for k, v in os.environ.items() if k != "DEEPTHOUGHT_WARMUP"}
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [BACKEND, env.get("PYTHONPATH")]))
+
+    result = subprocess.run(
+        [sys.executable, "-c", SCRIPT],
+        cwd=tmp_path,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+
+    assert result.returncode == 0, result.stderr
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    assert report == {"responses": [200, 200], "heavy": []}
@@ -0,0 +1,170 @@
+import threading
+import time
+
+import pytest
+
+import llm_gateway
+from llm_gateway import DEFAULT_MODEL, LLMGateway, TokenBucket, is_retryable
+
+
+class QuotaError(Exception):
+    code = 429
+
+
+class ScriptedClient:
+    """Raises the scripted errors in turn, then answers with the prompt."""
+
+    def __init__(self, errors=(), wait=None):
+        self.errors = list(errors)
+        self.wait = wait
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def invoke(self, input, **kwargs):
+        with self._lock:
+            self.calls.append(input)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            if self.wait is not None:
+                self.wait.wait(5)
+            if self.errors:
+                raise self.errors.pop(0)
+            return f"answer to {input}"
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def _gateway(client, **kwargs):
+    gateway = LLMGateway(requests_per_minute=0, **kwargs)
+    gateway._clients[(DEFAULT_MODEL, 0.7)] = client
+    return gateway
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(llm_gateway.time, "sleep", delays.append)
+    return delays
+
+
+def _in_threads(target, *args_list):
+    threads = [threading.Thread(target=target, args=args) for args in args_list]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def test_retryable_errors():
+    assert is_retryable(QuotaError())
+    assert is_retryable(type("ResourceExhausted", (Exception,), {})())
+    assert is_retryable(Exception("429 Quota exceeded"))
+    assert not is_retryable(ValueError("bad prompt"))
+
+
+def test_quota_errors_are_retried_with_backoff(sleeps):
+    client = ScriptedClient([QuotaError(), QuotaError()])
+    gateway = _gateway(client)
+
+    assert gateway.invoke("q") == "answer to q"
+    assert len(client.calls) == 3
+    assert len(sleeps) == 2
+
+
+def test_other_errors_and_exhausted_retries_are_raised(sleeps):
+    with pytest.raises(ValueError):
+        _gateway(ScriptedClient([ValueError("bad")])).invoke("q")
+    assert sleeps == []
+
+    client = ScriptedClient([QuotaError()] * 3)
+    with pytest.raises(QuotaError):
+        _gateway(client, max_retries=2).invoke("q")
+    assert len(client.calls) == 3
+
+
+def test_backoff_holds_no_slot(monkeypatch):
+    client = ScriptedClient([QuotaError()])
+    gateway = _gateway(client, max_concurrency=1, max_per_universe=1)
+    during_backoff = []
+
+    def sleep(delay):
+        # Another call can take both slots while this one waits
+        during_backoff.append(gateway.invoke("other", universe="u"))
+        during_backoff.append(dict(gateway._universe_slots))
+
+    monkeypatch.setattr(llm_gateway.time, "sleep", sleep)
+
+    assert gateway.invoke("q", universe="u") == "answer to q"
+    assert during_backoff == ["answer to other", {}]
+    assert gateway._universe_slots == {}
+
+
+def test_identical_concurrent_prompts_share_one_call():
+    release = threading.Event()
+    client = ScriptedClient(wait=release)
+    gateway = _gateway(client)
+    results = []
+
+    threads = _in_threads(
+        lambda: results.append(gateway.invoke("q", universe="u")), *[()] * 4
+    )
+    while not client.calls:
+        time.sleep(0.01)
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert client.calls == ["q"]
+    assert results == ["answer to q"] * 4
+    assert gateway._in_flight == {}
+    # A later identical prompt is a new call
+    gateway.invoke("q")
+    assert client.calls == ["q", "q"]
+
+
+def test_calls_are_limited_per_universe():
+    release = threading.Event()
+    client = ScriptedClient(wait=release)
+    gateway = _gateway(client, max_per_universe=2)
+
+    threads = _in_threads(
+        lambda prompt: gateway.invoke(prompt, universe="u"),
+        *[(f"q{i}",) for i in range(5)],
+    )
+    time.sleep(0.1)
+    assert client.active == 2
+    # Other universes have their own slots
+    other = _in_threads(lambda: gateway.invoke("other", universe="v"), ())
+    time.sleep(0.1)
+    assert client.active == 3
+    release.set()
+    for thread in threads + other:
+        thread.join()
+
+    assert client.max_active == 3
+    assert len(client.calls) == 6
+    assert gateway._universe_slots == {}
+
+
+def test_token_bucket_spaces_requests_after_a_burst():
+    bucket = TokenBucket(rate=50, capacity=2)
+    start = time.monotonic()
+    for _ in range(4):
+        bucket.acquire()
+    # Two tokens from the burst, then one every 20 ms
+    assert time.monotonic() - start >= 0.035
+
+
+def test_llm_binds_universe_model_and_temperature():
+    client = ScriptedClient()
+    gateway = LLMGateway(requests_per_minute=0)
+    gateway._clients[("m", 0.2)] = client
+
+    llm = gateway.llm(universe="u", model="m", temperature=0.2)
+
+    assert llm.invoke("q") == "answer to q"
+    assert gateway.client("m", 0.2) is client
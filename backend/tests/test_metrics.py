@@ -0,0 +1,85 @@
+from types import SimpleNamespace
+
+import pytest
+from prometheus_client import REGISTRY
+
+import metrics
+import timing
+
+
+def _sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_span_reports_to_listeners_even_on_errors():
+    seen = []
+
+    def listener(name, seconds, labels):
+        seen.append((name, seconds, labels))
+
+    timing.add_listener(listener)
+    try:
+        with timing.span("embed"):
+            pass
+        with pytest.raises(RuntimeError):
+            with timing.span("llm", call="query"):
+                raise RuntimeError
+    finally:
+        timing.remove_listener(listener)
+    with timing.span("save"):
+        pass
+
+    assert [(name, labels) for name, _, labels in seen] == [
+        ("embed", {}),
+        ("llm", {"call": "query"}),
+    ]
+    assert all(seconds >= 0 for _, seconds, _ in seen)
+
+
+def test_spans_are_exported_as_stage_histograms():
+    before = _sample("deepthought_stage_seconds_count", stage="split", call="")
+    with timing.span("split"):
+        pass
+
+    assert _sample("deepthought_stage_seconds_count", stage="split", call="") == (
+        before + 1
+    )
+
+
+def test_llm_tokens_prefer_reported_usage():
+    before_in = _sample("deepthought_llm_tokens_total", call="t1", direction="in")
+    before_out = _sample("deepthought_llm_tokens_total", call="t1", direction="out")
+    response = SimpleNamespace(
+        content="ok", usage_metadata={"input_tokens": 120, "output_tokens": 7}
+    )
+    metrics.record_llm_call("t1", "prompt", response)
+
+    assert _sample("deepthought_llm_calls_total", call="t1") >= 1
+    assert (
+        _sample("deepthought_llm_tokens_total", call="t1", direction="in")
+        == before_in + 120
+    )
+    assert (
+        _sample("deepthought_llm_tokens_total", call="t1", direction="out")
+        == before_out + 7
+    )
+
+
+def test_llm_tokens_are_estimated_without_usage():
+    before = _sample("deepthought_llm_tokens_total", call="t2", direction="in")
+    metrics.record_llm_call("t2", "x" * 400, "plain text answer")
+
+    assert _sample("deepthought_llm_tokens_total", call="t2", direction="in") == (
+        before + 100
+    )
+    assert metrics.estimate_tokens("") == 0
+    assert metrics.estimate_tokens("abc") == 1
+
+
+def test_render_metrics_is_prometheus_text():
+    metrics.record_embedding_batch(10, 0.5)
+    body, content_type = metrics.render_metrics()
+
+    assert content_type.startswith("text/plain")
+    assert b"deepthought_embedding_chunks_per_second 20.0" in body
+    assert b"deepthought_embedded_chunks_total" in body
@@ -0,0 +1,62 @@
+import fin
+
+ARYA = "Arya rode north to Winterfell. "
+SANSA = "Sansa stayed in the capital. "
+
+
+def _db(universe, **files):
+    for name, text in files.items():
+        (universe / f"{name}.txt").write_text(text * 100)
+    db = fin.StoryVectorDatabase(str(universe))
+    db.process_files([f"{name}.txt" for name in files])
+    return db
+
+
+def _files(docs):
+    return [doc.metadata["file_id"] for doc in docs]
+
+
+def test_files_are_mentioned_by_book_number_or_title(universe):
+    db = fin.StoryVectorDatabase(str(universe))
+    db.metadata["files_processed"] = ["the_long_night.txt", "it.txt", "dawn.txt"]
+
+    assert db._files_mentioned("What happens in book 2?") == ["it.txt"]
+    assert db._files_mentioned("Who dies in The Long Night?") == ["the_long_night.txt"]
+    assert db._files_mentioned("Does it end well in Book 7?") == []
+    assert db._files_mentioned('Who narrates "It"?') == ["it.txt"]
+    assert db._files_mentioned("Is Dawn before book 1?") == [
+        "the_long_night.txt",
+        "dawn.txt",
+    ]
+    assert db._files_mentioned("What happens at dawning?") == []
+
+
+def test_canonical_files_answer_alone_when_they_match(universe):
+    db = _db(universe, canon=ARYA, fanfic=ARYA)
+    db.set_precedence([], ["canon.txt"])
+
+    docs = db.precedence_search(db.embeddings.embed_query(ARYA), k=4)
+
+    assert docs and set(_files(docs)) == {"canon.txt"}
+
+
+def test_other_questions_rank_by_precedence_weight(universe):
+    db = _db(universe, canon=ARYA, first=SANSA, second=SANSA)
+    db.set_precedence(["second.txt", "first.txt"], ["canon.txt"])
+
+    docs = db.precedence_search(db.embeddings.embed_query(SANSA), k=2)
+
+    assert _files(docs) == ["second.txt", "second.txt"]
+
+
+def test_set_precedence_persists_and_drops_cached_answers(universe):
+    db = _db(universe, a=ARYA, b=SANSA)
+    version = db.metadata["universe_version"]
+    db.answer_cache.store("q", [1.0], "", "answer", [])
+
+    result = fin.set_precedence(str(universe), ["b.txt"], ["a.txt"])
+
+    assert (result["precedence"], result["canonical"]) == (["b.txt"], ["a.txt"])
+    reloaded = fin.StoryVectorDatabase(str(universe))
+    assert reloaded.metadata["universe_version"] == version + 1
+    assert reloaded.answer_cache.lookup([1.0]) is None
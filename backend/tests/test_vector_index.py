@@ -0,0 +1,168 @@
+import numpy as np
+import pytest
+
+import vector_index
+from vector_index import (
+    build_index,
+    choose_index_kind,
+    index_kind,
+    migrate_vector_store,
+    remove_positions,
+    search_index,
+    search_ranges,
+    tombstones,
+)
+
+DIM = 64
+
+
+def _vectors(count, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, DIM)).astype(np.float32)
+
+
+def _store(kind, vectors, embeddings):
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.documents import Document
+
+    ids = [f"doc-{i}" for i in range(len(vectors))]
+    return FAISS(
+        embedding_function=embeddings,
+        index=build_index(kind, vectors),
+        docstore=InMemoryDocstore(
+            {doc_id: Document(page_content=doc_id) for doc_id in ids}
+        ),
+        index_to_docstore_id=dict(enumerate(ids)),
+    )
+
+
+def _found_docs(store, query, k):
+    _, positions = search_index(store, query, k)
+    return [store.index_to_docstore_id[int(p)] for p in positions]
+
+
+def test_choose_index_kind_by_size(monkeypatch):
+    monkeypatch.delenv(vector_index.INDEX_BACKEND_ENV, raising=False)
+
+    assert choose_index_kind(100) == "flat"
+    assert choose_index_kind(10_000) == "fp16"
+    assert choose_index_kind(100_000) == "hnsw"
+    assert choose_index_kind(500_000) == "int8"
+    assert choose_index_kind(5_000_000) == "ivfpq"
+
+
+def test_choose_index_kind_override(monkeypatch):
+    monkeypatch.setenv(vector_index.INDEX_BACKEND_ENV, "hnsw")
+    assert choose_index_kind(10) == "hnsw"
+
+    monkeypatch.setenv(vector_index.INDEX_BACKEND_ENV, "annoy")
+    with pytest.raises(ValueError):
+        choose_index_kind(10)
+
+
+@pytest.mark.parametrize("kind", vector_index.INDEX_KINDS)
+def test_build_index_kinds_find_exact_matches(kind):
+    vectors = _vectors(1200)
+    index = build_index(kind, vectors)
+
+    assert index_kind(index) == kind
+    assert index.ntotal == len(vectors)
+    _, positions = index.search(vectors[:20], 1)
+    assert (positions[:, 0] == np.arange(20)).mean() >= 0.9
+
+
+@pytest.mark.parametrize("kind", ["flat", "hnsw", "ivfpq"])
+def test_search_ranges_only_returns_positions_in_range(kind):
+    vectors = _vectors(1200)
+    index = build_index(kind, vectors)
+
+    _, positions = search_ranges(index, vectors[5], [(100, 200), (900, 950)], k=10)
+
+    assert len(positions) == 10
+    assert all(100 <= p < 200 or 900 <= p < 950 for p in positions)
+    assert len(search_ranges(index, vectors[5], [(3, 3)], k=10)[1]) == 0
+
+
+@pytest.mark.parametrize("kind", ["flat", "fp16", "int8", "ivfpq"])
+def test_remove_positions_compacts_without_reembedding(kind, embeddings):
+    vectors = _vectors(1200)
+    store = _store(kind, vectors, embeddings)
+    removed = [3, 4, 500, 1199]
+
+    assert remove_positions(store, removed) == removed
+
+    assert store.index.ntotal == len(store.index_to_docstore_id) == 1196
+    assert len(store.docstore._dict) == 1196
+    assert sorted(store.index_to_docstore_id) == list(range(1196))
+    # Positions after a removed one shift down, in order
+    assert store.index_to_docstore_id[3] == "doc-5"
+    assert store.index_to_docstore_id[1195] == "doc-1198"
+    for i in (5, 700, 1198):
+        assert _found_docs(store, vectors[i], 1) == [f"doc-{i}"]
+    for i in removed:
+        assert f"doc-{i}" not in _found_docs(store, vectors[i], 5)
+    assert embeddings.documents_embedded == 0
+
+
+def test_removed_ivfpq_positions_accept_new_vectors(embeddings):
+    vectors = _vectors(1200)
+    store = _store("ivfpq", vectors, embeddings)
+    remove_positions(store, range(0, 100))
+
+    # New vectors get the next position, as LangChain's add_embeddings assumes
+    store.index.add(vectors[:1])
+
+    assert store.index.ntotal == 1101
+    _, positions = search_index(store, vectors[0], 10)
+    assert 1100 in positions.tolist()
+    assert all(0 <= p < 1101 for p in positions)
+
+
+def test_hnsw_removal_tombstones_then_compacts(embeddings, monkeypatch):
+    monkeypatch.setattr(vector_index, "COMPACT_FRACTION", 0.2)
+    vectors = _vectors(500)
+    store = _store("hnsw", vectors, embeddings)
+
+    assert remove_positions(store, [10, 20]) == []
+    assert store.index.ntotal == 500
+    assert tombstones(store).tolist() == [10, 20]
+    assert "doc-10" not in _found_docs(store, vectors[10], 5)
+    assert _found_docs(store, vectors[11], 1) == ["doc-11"]
+
+    compacted = remove_positions(store, range(100, 200))
+
+    assert compacted == [10, 20] + list(range(100, 200))
+    assert index_kind(store.index) == "hnsw"
+    assert store.index.ntotal == len(store.index_to_docstore_id) == 398
+    assert len(tombstones(store)) == 0
+    assert _found_docs(store, vectors[300], 1) == ["doc-300"]
+    assert embeddings.documents_embedded == 0
+
+
+def test_tombstones_are_found_again_after_reload(embeddings):
+    store = _store("hnsw", _vectors(500), embeddings)
+    remove_positions(store, [7])
+    store._tombstones = None
+
+    assert tombstones(store).tolist() == [7]
+
+
+def test_migration_keeps_positions(embeddings):
+    vectors = _vectors(600)
+    store = _store("flat", vectors, embeddings)
+
+    assert migrate_vector_store(store, "hnsw")
+    assert not migrate_vector_store(store, "hnsw")
+    assert index_kind(store.index) == "hnsw"
+    assert _found_docs(store, vectors[42], 1) == ["doc-42"]
+    # Exact stored vectors: nothing is re-embedded
+    assert embeddings.documents_embedded == 0
+
+
+def test_migration_from_lossy_index_reembeds_live_chunks(embeddings):
+    store = _store("fp16", _vectors(300), embeddings)
+    remove_positions(store, [0, 1])
+
+    assert migrate_vector_store(store, "flat")
+    assert store.index.ntotal == 298
+    assert embeddings.documents_embedded == 298
@@ -0,0 +1,34 @@
+# timing.py
+import time
+from contextlib import contextmanager
+
+# Callables notified with (stage_name, seconds, labels) whenever a span ends
+_listeners = []
+
+
+def add_listener(listener):
+    """Register a callable that receives every finished timing span."""
+    _listeners.append(listener)
+
+
+def remove_listener(listener):
+    """Unregister a listener added with add_listener."""
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+@contextmanager
+def span(name: str, **labels):
+    """Time a processing stage and report it to all registered listeners.
+
+    Args:
+        name: Stage name, e.g. "split", "embed", "index", "save" or "llm"
+        labels: Extra dimensions for the stage, e.g. call="character"
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        for listener in list(_listeners):
+            listener(name, elapsed, labels)
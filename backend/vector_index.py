@@ -0,0 +1,452 @@
+# vector_index.py
+"""FAISS index backends for StoryVectorDatabase, chosen by corpus size.
+
+python vector_index.py migrate data/<universe> [--kind hnsw]
+python vector_index.py report --vectors 20000,100000 --output index_report.md
+"""
+
+import os
+import math
+import time
+import argparse
+
+import numpy as np
+
+# Available backends (measurements in index_report.md):
+#   flat   exact IndexFlatL2, 1536 bytes per 384-d MiniLM vector
+#   fp16   IndexScalarQuantizer fp16, half the memory, recall ~1.0
+#   int8   IndexScalarQuantizer 8-bit, a quarter of the memory, recall ~0.97
+#   hnsw   IndexHNSWFlat graph, sub-linear search, slightly more memory than flat
+#   ivfpq  IndexIVFPQ, ~100 bytes per vector, lowest recall
+INDEX_KINDS = ("flat", "fp16", "int8", "hnsw", "ivfpq")
+
+# (upper chunk count, backend) pairs used by choose_index_kind, in the order a
+# growing universe moves through them. fp16 is as accurate as flat at half the
+# memory; hnsw keeps chat search sub-millisecond once linear scans get slow;
+# int8 then caps memory, and ivfpq is only worth its recall loss at series scale.
+AUTO_THRESHOLDS = (
+    (5_000, "flat"),
+    (50_000, "fp16"),
+    (250_000, "hnsw"),
+    (1_000_000, "int8"),
+)
+LARGEST_KIND = "ivfpq"
+
+# Override the automatic choice for every universe, e.g. FAISS_INDEX_BACKEND=flat
+INDEX_BACKEND_ENV = "FAISS_INDEX_BACKEND"
+
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 128
+IVF_NPROBE = 16
+PQ_BYTES_PER_VECTOR = 96  # must divide the 384 MiniLM dimensions
+PQ_BITS = 8
+# HNSW graphs can't drop nodes: removed positions stay as tombstones that
+# searches skip, until they make up this share of the index and it is rebuilt
+COMPACT_FRACTION = 0.2
+
+
+def choose_index_kind(chunk_count: int) -> str:
+    """Backend to use for a universe with `chunk_count` vectors."""
+    override = os.getenv(INDEX_BACKEND_ENV)
+    if override:
+        if override not in INDEX_KINDS:
+            raise ValueError(f"Unknown {INDEX_BACKEND_ENV} '{override}'")
+        return override
+    for upper, kind in AUTO_THRESHOLDS:
+        if chunk_count < upper:
+            return kind
+    return LARGEST_KIND
+
+
+def index_kind(index) -> str:
+    """Name of the backend a FAISS index was built with."""
+    import faiss
+
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return "fp16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "int8"
+    return "flat"
+
+
+def is_lossless(index) -> bool:
+    """Whether stored vectors can be reconstructed exactly from the index."""
+    return index_kind(index) in ("flat", "hnsw")
+
+
+def build_index(kind: str, vectors: np.ndarray):
+    """Create, train and fill an L2 index of the given backend."""
+    import faiss
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    count, dim = vectors.shape
+    if kind == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif kind == "fp16":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16)
+    elif kind == "int8":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit)
+    elif kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    elif kind == "ivfpq":
+        # ~4*sqrt(n) lists, each with enough points to train its centroid
+        nlist = max(1, min(int(4 * np.sqrt(count)), count // 39))
+        m = math.gcd(dim, PQ_BYTES_PER_VECTOR)
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, nlist, m, PQ_BITS)
+    else:
+        raise ValueError(f"Unknown index backend '{kind}'")
+
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    tune_index(index)
+    return index
+
+
+def tune_index(index):
+    """Apply search-time parameters, which are not all persisted by FAISS."""
+    kind = index_kind(index)
+    if kind == "hnsw":
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    elif kind == "ivfpq":
+        index.nprobe = IVF_NPROBE
+    return index
+
+
+def stored_vectors(vector_store) -> np.ndarray:
+    """All vectors of a LangChain FAISS store in index order.
+
+    Reconstructed from the index when that is exact, otherwise re-embedded
+    from the stored chunk texts so quantization error doesn't accumulate.
+    Only used to change backends; tombstones get zero vectors.
+    """
+    index = vector_store.index
+    if is_lossless(index):
+        return index.reconstruct_n(0, index.ntotal)
+    live = np.setdiff1d(np.arange(index.ntotal), tombstones(vector_store))
+    texts = [
+        vector_store.docstore.search(vector_store.index_to_docstore_id[i]).page_content
+        for i in live
+    ]
+    vectors = np.zeros((index.ntotal, index.d), dtype=np.float32)
+    if texts:
+        vectors[live] = vector_store.embeddings.embed_documents(texts)
+    return vectors
+
+
+def migrate_vector_store(vector_store, kind: str) -> bool:
+    """Rebuild the store's index with another backend in place.
+
+    Returns True if the index was rebuilt, False if it already used `kind`.
+    Positions are preserved, so index_to_docstore_id stays valid.
+    """
+    current = index_kind(vector_store.index)
+    if current == kind or vector_store.index.ntotal == 0:
+        return False
+    start = time.perf_counter()
+    vector_store.index = build_index(kind, stored_vectors(vector_store))
+    print(
+        f"Migrated FAISS index from {current} to {kind} "
+        f"({vector_store.index.ntotal} vectors, {time.perf_counter() - start:.1f}s)"
+    )
+    return True
+
+
+def search_ranges(index, query_vector, ranges, k: int):
+    """k nearest neighbours among the index positions in `ranges` only.
+
+    Args:
+        index: FAISS index of a LangChain store (positions are 0..ntotal-1)
+        query_vector: Embedded query
+        ranges: [start, end) position pairs, e.g. one file's chunks
+        k: Number of results
+
+    Returns:
+        (distances, positions) arrays, nearest first. Cost grows with the size
+        of the ranges, not of the index: their vectors are decoded and scanned
+        directly, except for IVF-PQ, which uses an ID selector on its lists.
+    """
+    import faiss
+
+    ranges = [(int(start), int(end)) for start, end in ranges if end > start]
+    if not ranges:
+        return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+    query = np.asarray([query_vector], dtype=np.float32)
+
+    if index_kind(index) != "ivfpq":
+        positions = np.concatenate([np.arange(start, end) for start, end in ranges])
+        vectors = np.vstack([index.reconstruct_n(start, end - start) for start, end in ranges])
+        distances = ((vectors - query) ** 2).sum(axis=1)
+        nearest = np.argsort(distances)[:k]
+        return distances[nearest], positions[nearest]
+
+    if len(ranges) == 1:
+        selector = faiss.IDSelectorRange(*ranges[0])
+    else:
+        ids = np.concatenate([np.arange(start, end) for start, end in ranges])
+        selector = faiss.IDSelectorBatch(ids)
+    params = faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    distances, positions = index.search(query, k, params=params)
+    found = positions[0] >= 0
+    return distances[0][found], positions[0][found]
+
+
+def tombstones(vector_store) -> np.ndarray:
+    """Positions still in the index whose chunks were removed, sorted.
+
+    Only HNSW indexes keep them (see remove_positions). They are the
+    positions whose docstore entry is gone, found once per loaded store.
+    """
+    dead = getattr(vector_store, "_tombstones", None)
+    if dead is None:
+        mapping = vector_store.index_to_docstore_id
+        live = vector_store.docstore._dict
+        if len(mapping) == len(live):
+            dead = np.empty(0, dtype=np.int64)
+        else:
+            dead = np.array(
+                sorted(p for p, doc_id in mapping.items() if doc_id not in live),
+                dtype=np.int64,
+            )
+        vector_store._tombstones = dead
+    return dead
+
+
+def search_index(vector_store, query_vector, k: int):
+    """k nearest neighbours in the whole index of a LangChain store, skipping tombstones.
+
+    Returns:
+        (distances, positions) arrays, nearest first.
+    """
+    import faiss
+
+    index = vector_store.index
+    query = np.asarray([query_vector], dtype=np.float32)
+    dead = tombstones(vector_store)
+    if len(dead) == 0:
+        distances, positions = index.search(query, k)
+    else:
+        # The batch selector must outlive the search that uses it through Not
+        removed = faiss.IDSelectorBatch(dead)
+        selector = faiss.IDSelectorNot(removed)
+        kind = index_kind(index)
+        if kind == "hnsw":
+            params = faiss.SearchParametersHNSW(
+                sel=selector, efSearch=index.hnsw.efSearch
+            )
+        elif kind == "ivfpq":
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+        else:
+            params = faiss.SearchParameters(sel=selector)
+        distances, positions = index.search(query, k, params=params)
+    found = positions[0] >= 0
+    return distances[0][found], positions[0][found]
+
+
+def _drop_from_mapping(vector_store, positions):
+    # Renumber index_to_docstore_id after the index dropped `positions`
+    removed = set(int(p) for p in positions)
+    kept = [
+        doc_id
+        for position, doc_id in sorted(vector_store.index_to_docstore_id.items())
+        if position not in removed
+    ]
+    vector_store.index_to_docstore_id = dict(enumerate(kept))
+
+
+def _remove_from_ivf(index, positions: np.ndarray):
+    # IVF lists store explicit ids: after removing some, shift the rest down
+    # so ids stay equal to positions and new vectors keep getting ids ntotal..
+    import faiss
+
+    index.remove_ids(faiss.IDSelectorBatch(positions))
+    invlists = index.invlists
+    for list_no in range(index.nlist):
+        size = invlists.list_size(list_no)
+        if size:
+            ids = faiss.rev_swig_ptr(invlists.get_ids(list_no), size)
+            ids -= np.searchsorted(positions, ids)
+
+
+def remove_positions(vector_store, positions) -> list:
+    """Delete the chunks at the given index positions from a LangChain store.
+
+    Nothing is re-embedded or retrained. Flat-code indexes compact in place
+    and IVF-PQ drops the entries from its lists. HNSW can't remove graph
+    nodes, so its positions become tombstones that search_index skips; once
+    they reach COMPACT_FRACTION of the index it is rebuilt from its exact
+    stored vectors without them.
+
+    Returns:
+        The positions taken out of the index, sorted. Remaining chunks keep
+        their relative order and positions after a removed one shift down,
+        so per-file position ranges can simply be shifted. Tombstoned
+        positions are only returned by the call that compacts them away.
+    """
+    positions = sorted(set(int(p) for p in positions))
+    if not positions:
+        return []
+    doc_ids = [vector_store.index_to_docstore_id[p] for p in positions]
+    kind = index_kind(vector_store.index)
+    vector_store._tombstones = None
+    if kind in ("flat", "fp16", "int8"):
+        # Flat-code indexes compact in place on remove_ids
+        vector_store.delete(doc_ids)
+        return positions
+    if kind == "ivfpq":
+        _remove_from_ivf(vector_store.index, np.asarray(positions, dtype=np.int64))
+        vector_store.docstore.delete(doc_ids)
+        _drop_from_mapping(vector_store, positions)
+        return positions
+
+    vector_store.docstore.delete(doc_ids)
+    dead = tombstones(vector_store)
+    index = vector_store.index
+    if len(dead) < COMPACT_FRACTION * index.ntotal:
+        return []
+    # HNSW stores its vectors exactly, so the rebuild needs no re-embedding
+    keep = np.setdiff1d(np.arange(index.ntotal), dead)
+    vectors = index.reconstruct_n(0, index.ntotal)[keep]
+    vector_store.index = build_index("hnsw" if len(keep) else "flat", vectors)
+    _drop_from_mapping(vector_store, dead)
+    vector_store._tombstones = None
+    return dead.tolist()
+
+
+def _memory_bytes(index) -> int:
+    import faiss
+
+    return len(faiss.serialize_index(index))
+
+
+def _synthetic_vectors(count: int, dim: int, seed: int) -> np.ndarray:
+    """Clustered unit vectors, closer to sentence embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, count // 200), dim))
+    vectors = centers[rng.integers(0, len(centers), count)]
+    vectors = vectors + 0.35 * rng.normal(size=(count, dim))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32)
+
+
+def recall_report(vectors: np.ndarray, queries: np.ndarray, k: int = 10):
+    """Recall@k against exact search, mean query latency and size per backend."""
+    exact = build_index("flat", vectors)
+    _, truth = exact.search(queries, k)
+    rows = []
+    for kind in INDEX_KINDS:
+        if kind == "ivfpq" and len(vectors) < 10_000:
+            continue  # too few points to train the quantizers meaningfully
+        start = time.perf_counter()
+        index = build_index(kind, vectors)
+        build_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        found = np.vstack([index.search(q[None, :], k)[1] for q in queries])
+        query_ms = (time.perf_counter() - start) / len(queries) * 1000
+
+        hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+        rows.append(
+            {
+                "kind": kind,
+                "recall": hits / (len(queries) * k),
+                "query_ms": query_ms,
+                "bytes_per_vector": _memory_bytes(index) / len(vectors),
+                "build_seconds": build_seconds,
+            }
+        )
+    return rows
+
+
+def _migrate_command(args):
+    import fin
+
+    story_db = fin.StoryVectorDatabase(args.db_path)
+    if story_db.vector_store is None:
+        print(f"No vector database found at {args.db_path}")
+        return
+    story_db.migrate_index(args.kind, pin=bool(args.kind))
+
+
+def _report_command(args):
+    source = (
+        "MiniLM embeddings of the given corpus"
+        if args.corpus
+        else "clustered synthetic vectors"
+    )
+    lines = [
+        "# FAISS backend recall vs latency",
+        "",
+        f"Recall@{args.k} against exact flat search, mean latency of {args.queries}",
+        f"single-vector queries, {args.dim}-d {source}. Generated with",
+        f"`python vector_index.py report --vectors {args.vectors}`; pass",
+        "`--corpus` to measure real embeddings of your own books.",
+        "",
+    ]
+    for count in [int(c) for c in args.vectors.split(",")]:
+        if args.corpus:
+            from benchmark import corpus_text
+            from embedding_engine import EmbeddingEngine
+
+            text = corpus_text(args.corpus, count * 800)
+            chunks = [text[i : i + 1000] for i in range(0, len(text), 800)][:count]
+            data = np.asarray(
+                EmbeddingEngine().embed_documents(chunks), dtype=np.float32
+            )
+        else:
+            data = _synthetic_vectors(count, args.dim, args.seed)
+        rng = np.random.default_rng(args.seed + 1)
+        queries = data[rng.integers(0, len(data), args.queries)]
+        queries = queries + 0.05 * rng.normal(size=queries.shape).astype(np.float32)
+
+        lines += [
+            f"## {len(data)} vectors (auto backend: {choose_index_kind(len(data))})",
+            "",
+            "| backend | recall | query ms | bytes/vector | build s |",
+            "|---|---|---|---|---|",
+        ]
+        for row in recall_report(data, queries, args.k):
+            lines.append(
+                f"| {row['kind']} | {row['recall']:.3f} | {row['query_ms']:.3f} "
+                f"| {row['bytes_per_vector']:.0f} | {row['build_seconds']:.2f} |"
+            )
+        lines.append("")
+
+    report = "\n".join(lines)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FAISS index backend tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate = commands.add_parser("migrate", help="Rebuild a universe's index")
+    migrate.add_argument("db_path", help="Universe folder, e.g. data/0")
+    migrate.add_argument(
+        "--kind", choices=INDEX_KINDS, help="Pin this backend (default: automatic)"
+    )
+    migrate.set_defaults(func=_migrate_command)
+
+    report = commands.add_parser("report", help="Recall-vs-latency report")
+    report.add_argument("--vectors", default="5000,20000,100000")
+    report.add_argument("--queries", type=int, default=200)
+    report.add_argument("--k", type=int, default=10)
+    report.add_argument("--dim", type=int, default=384)
+    report.add_argument("--seed", type=int, default=0)
+    report.add_argument("--corpus", nargs="*", help="Embed these .txt files instead")
+    report.add_argument("--output", help="Also write the markdown report here")
+    report.set_defaults(func=_report_command)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()